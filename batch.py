@@ -0,0 +1,108 @@
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Batch decision for the calculi where every rule rewrites a single side of the
+# sequent (ll and pql). Each logic describes one formula with
+#
+#     decomposition(formula) -> (literal, left_mode, left_children, right_mode, right_children)
+#
+# where `literal` is the formula itself if it can close an axiom (None otherwise), and
+# a mode says how the premises obtained from the children combine when the formula
+# is decomposed on that side of the sequent.
+NONE = 0  # no rule decomposes the formula on this side
+ANY = 1   # one premise is enough (∧L, ∨R, ~~L, ...)
+BOTH = 2  # every premise is needed (∨L, ∧R, ...)
+
+Decomposition = Callable[[Hashable], Tuple[Optional[Hashable], int, tuple, int, tuple]]
+
+class _Universe:
+    # Integer ids for every formula reachable from `roots` through one side's rules,
+    # together with that side's rule arrays. The rank of a formula is its height in the
+    # premise relation, so a premise always has a smaller rank than its conclusion.
+    def __init__(self, roots: Sequence, decomposition: Decomposition, side: int, literals: Dict):
+        self.index: Dict = {}
+        modes, first, second, rank, literal_ids = [], [], [], [], []
+
+        for root in roots:
+            stack = [(root, False)]
+            while stack:
+                formula, expanded = stack.pop()
+                if formula in self.index:
+                    continue
+
+                literal, left_mode, left_children, right_mode, right_children = decomposition(formula)
+                mode, children = (left_mode, left_children) if side == 0 else (right_mode, right_children)
+
+                if not expanded and any(child not in self.index for child in children):
+                    stack.append((formula, True))
+                    stack.extend((child, False) for child in children)
+                    continue
+
+                self.index[formula] = len(modes)
+                modes.append(mode)
+                child_ids = [self.index[child] for child in children] or [0]
+                first.append(child_ids[0])
+                second.append(child_ids[-1])
+                rank.append(1 + max(rank[i] for i in child_ids) if children else 0)
+                literal_ids.append(-1 if literal is None else literals.setdefault(literal, len(literals)))
+
+        # Renumber by rank so that each rank is a contiguous block of ids.
+        rank_array = np.array(rank, dtype=np.int64)
+        order = np.argsort(rank_array, kind="stable")
+        position = np.empty_like(order)
+        position[order] = np.arange(len(order))
+
+        self.index = {formula: int(position[i]) for formula, i in self.index.items()}
+        self.mode = np.array(modes, dtype=np.int8)[order]
+        self.first = position[np.array(first, dtype=np.int64)[order]]
+        self.second = position[np.array(second, dtype=np.int64)[order]]
+        self.literal = np.array(literal_ids, dtype=np.int64)[order]
+        ranks = rank_array[order]
+        self.bounds = np.searchsorted(ranks, np.arange(int(ranks[-1]) + 2))
+
+    def layers(self):
+        return [slice(int(start), int(stop)) for start, stop in zip(self.bounds[:-1], self.bounds[1:])]
+
+def _combine(mode, first, second):
+    return ((mode == ANY) & (first | second)) | ((mode == BOTH) & first & second)
+
+def derivability_matrix(left: _Universe, right: _Universe) -> np.ndarray:
+    # D[i, j] is True iff left formula i ⟹ right formula j is derivable. The matrix is
+    # filled one block of (left rank, right rank) at a time: left rules only read rows
+    # of lower rank and right rules only read columns of lower rank, so both are
+    # already filled and each block is a few whole-array operations.
+    derivable = np.zeros((len(left.mode), len(right.mode)), dtype=bool)
+
+    for r, rows in enumerate(left.layers()):
+        for t, cols in enumerate(right.layers()):
+            # A (and ~A in pql)
+            literal = left.literal[rows, None]
+            block = (literal >= 0) & (literal == right.literal[None, cols])
+
+            # Left rules
+            if r > 0:
+                block |= _combine(left.mode[rows, None],
+                                  derivable[left.first[rows], cols], derivable[left.second[rows], cols])
+
+            # Right rules
+            if t > 0:
+                block |= _combine(right.mode[None, cols],
+                                  derivable[rows, right.first[cols]], derivable[rows, right.second[cols]])
+
+            derivable[rows, cols] = block
+
+    return derivable
+
+def decide_many(sequents: Sequence[Tuple[Hashable, Hashable]], decomposition: Decomposition) -> List[bool]:
+    if not sequents:
+        return []
+
+    literals: Dict = {}
+    left = _Universe([alpha for alpha, _ in sequents], decomposition, 0, literals)
+    right = _Universe([beta for _, beta in sequents], decomposition, 1, literals)
+    derivable = derivability_matrix(left, right)
+
+    rows = np.array([left.index[alpha] for alpha, _ in sequents], dtype=np.int64)
+    cols = np.array([right.index[beta] for _, beta in sequents], dtype=np.int64)
+    return derivable[rows, cols].tolist()
@@ -0,0 +1,298 @@
+import argparse
+import cProfile
+import json
+import math
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+import memo
+import search
+import workload
+import ll_run
+import pql_run
+import nl_run
+import nql_run
+
+# Times the pipeline on random workloads (see workload.py) for each logic and size:
+#
+#     parse   Parser.parse_sequent on the workload's text
+#     decide  is_derivable, from an empty cache
+#     derive  derive_proof, from an empty cache
+#     render  lift_object_to_bussproofs on the proofs found
+#
+#     python bench.py --logics ll nql --sizes 8 16 32 -o results.json
+#
+# Each item is timed on its own, `repeat` times; the report has the median and 95th
+# percentile item latency and the throughput (items per second of the whole phase).
+# --tracemalloc adds the peak traced memory of each phase and its top allocation
+# sites, from a separate run so that tracing does not skew the times. --profile DIR
+# writes a cProfile dump per logic, size and phase.
+#
+# Baselines are reports saved under a name and compared against later runs:
+#
+#     python bench.py --runs 5 --save before
+#     python bench.py --runs 5 --compare before --tolerance 0.15
+#
+# --runs N times every phase N times over and keeps the fastest run (min-of-N), which
+# is the least noisy estimate on a busy machine. A case regresses when its median is
+# more than `tolerance` slower than the baseline's and by more than --min-delta-ms;
+# the comparison prints regressions and improvements and exits with status 1 if there
+# are regressions.
+
+PHASES = ("parse", "decide", "derive", "render")
+BASELINE_DIR = ".benchmarks"
+PARSERS = {"ll": ll_run, "pql": pql_run, "nl": nl_run, "nql": nql_run}
+
+def percentile(values, q: float) -> float:
+    # Nearest-rank percentile.
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+class Cell:
+    # The workload of one logic and size, and the per-item work of each phase.
+    def __init__(self, name: str, size: int, count: int, seed: int, options: dict, max_nodes):
+        self.name = name
+        self.logic = workload.LOGICS[name]
+        self.size = size
+        self.max_nodes = max_nodes
+        self.sequents = workload.random_sequents(self.logic, count, seed, size=size, **options)
+        self.texts = [workload.sequent_text(sequent) for sequent in self.sequents]
+        self.parser = PARSERS[name].Parser(write_tables=False)
+
+        memo.clear_all()
+        proofs = [self.logic.derive_proof(sequent, max_nodes=max_nodes) for sequent in self.sequents]
+        self.proofs = [proof for proof in proofs if proof is not None and proof is not search.UNKNOWN]
+        self.derivable = len(self.proofs)
+        self.unknown = sum(proof is search.UNKNOWN for proof in proofs)
+
+    def items(self, phase: str):
+        return {"parse": self.texts, "decide": self.sequents, "derive": self.sequents, "render": self.proofs}[phase]
+
+    def run(self, phase: str, item):
+        if phase == "parse":
+            self.parser.parse_sequent(item)
+        elif phase == "decide":
+            self.logic.is_derivable(item, max_nodes=self.max_nodes)
+        elif phase == "derive":
+            self.logic.derive_proof(item, max_nodes=self.max_nodes)
+        else:
+            self.logic.lift_object_to_bussproofs(item)
+
+def time_phase(cell: Cell, phase: str, repeat: int) -> dict:
+    items = cell.items(phase)
+    cold = phase in ("decide", "derive")
+    samples = []
+    total = 0.0
+    for _ in range(repeat):
+        for item in items:
+            if cold:
+                memo.clear_all()
+            start = time.perf_counter()
+            cell.run(phase, item)
+            elapsed = time.perf_counter() - start
+            samples.append(elapsed)
+            total += elapsed
+
+    return {
+        "items": len(items),
+        "median_s": statistics.median(samples) if samples else None,
+        "p95_s": percentile(samples, 0.95) if samples else None,
+        "throughput": len(samples) / total if total > 0 else None,
+    }
+
+def trace_phase(cell: Cell, phase: str, top: int) -> dict:
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        for item in cell.items(phase):
+            if phase in ("decide", "derive"):
+                memo.clear_all()
+            cell.run(phase, item)
+        peak = tracemalloc.get_traced_memory()[1]
+        sites = tracemalloc.take_snapshot().statistics("lineno")[:top]
+    finally:
+        tracemalloc.stop()
+    return {"peak_bytes": peak,
+            "top_allocations": [{"site": str(stat.traceback[0]), "bytes": stat.size, "count": stat.count}
+                                for stat in sites]}
+
+def profile_phase(cell: Cell, phase: str, path: str):
+    profiler = cProfile.Profile()
+    for item in cell.items(phase):
+        if phase in ("decide", "derive"):
+            memo.clear_all()
+        profiler.enable()
+        cell.run(phase, item)
+        profiler.disable()
+    profiler.dump_stats(path)
+
+def best_of(results) -> dict:
+    # The fastest of several timings of the same phase.
+    timed = [result for result in results if result["median_s"] is not None]
+    if not timed:
+        return results[0]
+    return {
+        "items": results[0]["items"],
+        "median_s": min(result["median_s"] for result in timed),
+        "p95_s": min(result["p95_s"] for result in timed),
+        "throughput": max(result["throughput"] for result in timed),
+    }
+
+def run(logics, sizes, phases, count: int = 20, repeat: int = 3, seed: int = 0, options=None, max_nodes=None,
+        trace_memory: bool = False, profile_dir=None, runs: int = 1) -> dict:
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+    results = []
+    for name in logics:
+        for size in sizes:
+            cell = Cell(name, size, count, seed, options or {}, max_nodes)
+            for phase in phases:
+                result = {"logic": name, "size": size, "phase": phase,
+                          "derivable": cell.derivable, "unknown": cell.unknown}
+                result.update(best_of([time_phase(cell, phase, repeat) for _ in range(runs)]))
+                if trace_memory:
+                    result.update(trace_phase(cell, phase, 5))
+                if profile_dir:
+                    path = os.path.join(profile_dir, f"{name}-{size}-{phase}.prof")
+                    profile_phase(cell, phase, path)
+                    result["profile"] = path
+                results.append(result)
+            memo.clear_all()
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "count": count,
+            "repeat": repeat,
+            "runs": runs,
+            "seed": seed,
+            "options": options or {},
+            "max_nodes": max_nodes,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            # ru_maxrss is in kilobytes on Linux and bytes on macOS
+            "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        "results": results,
+    }
+
+def format_table(report: dict) -> str:
+    lines = [f"{'logic':<5} {'size':>5} {'phase':<7} {'items':>6} {'median ms':>10} {'p95 ms':>10} {'items/s':>10} {'peak KiB':>9}"]
+    for result in report["results"]:
+        ms = lambda seconds: "-" if seconds is None else f"{seconds * 1000:.3f}"
+        throughput = "-" if result["throughput"] is None else f"{result['throughput']:.0f}"
+        peak = f"{result['peak_bytes'] / 1024:.0f}" if "peak_bytes" in result else "-"
+        lines.append(f"{result['logic']:<5} {result['size']:>5} {result['phase']:<7} {result['items']:>6} "
+                     f"{ms(result['median_s']):>10} {ms(result['p95_s']):>10} {throughput:>10} {peak:>9}")
+    return "\n".join(lines)
+
+def case(result: dict) -> tuple:
+    return result["logic"], result["size"], result["phase"]
+
+def baseline_path(name: str, directory: str = BASELINE_DIR) -> str:
+    return os.path.join(directory, name + ".json")
+
+def save_baseline(report: dict, name: str, directory: str = BASELINE_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    path = baseline_path(name, directory)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+def load_baseline(name: str, directory: str = BASELINE_DIR) -> dict:
+    with open(baseline_path(name, directory), encoding="utf-8") as f:
+        return json.load(f)
+
+# Workload settings that must match for two reports to be comparable.
+WORKLOAD_KEYS = ("count", "repeat", "seed", "options", "max_nodes")
+
+def compare(baseline: dict, report: dict, tolerance: float = 0.10, min_delta: float = 0.0) -> list:
+    # One row (case, old median, new median, ratio, verdict) per case in both reports,
+    # verdict being "regression", "improvement" or "same".
+    old = {case(result): result for result in baseline["results"]}
+    rows = []
+    for result in report["results"]:
+        before = old.get(case(result))
+        if before is None or before["median_s"] is None or result["median_s"] is None:
+            continue
+        ratio = result["median_s"] / before["median_s"] if before["median_s"] > 0 else math.inf
+        delta = result["median_s"] - before["median_s"]
+        if ratio > 1 + tolerance and delta > min_delta:
+            verdict = "regression"
+        elif ratio < 1 / (1 + tolerance) and -delta > min_delta:
+            verdict = "improvement"
+        else:
+            verdict = "same"
+        rows.append((case(result), before["median_s"], result["median_s"], ratio, verdict))
+    return rows
+
+def format_comparison(rows: list, everything: bool = False) -> str:
+    lines = [f"{'logic':<5} {'size':>5} {'phase':<7} {'base ms':>10} {'now ms':>10} {'change':>8}  verdict"]
+    for (logic, size, phase), before, after, ratio, verdict in sorted(rows, key=lambda row: -row[3]):
+        if verdict == "same" and not everything:
+            continue
+        lines.append(f"{logic:<5} {size:>5} {phase:<7} {before * 1000:10.3f} {after * 1000:10.3f} "
+                     f"{(ratio - 1) * 100:+7.1f}%  {verdict}")
+    regressions = sum(row[4] == "regression" for row in rows)
+    improvements = sum(row[4] == "improvement" for row in rows)
+    lines.append(f"{regressions} regressions, {improvements} improvements, "
+                 f"{len(rows) - regressions - improvements} unchanged")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing, deciding, deriving and rendering.")
+    parser.add_argument("--logics", nargs="+", choices=sorted(workload.LOGICS), default=["ll", "pql", "nl", "nql"])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[4, 8, 16, 32],
+                        help="binary connectives per formula (default 4 8 16 32)")
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=list(PHASES))
+    parser.add_argument("--count", type=int, default=20, help="sequents per logic and size (default 20)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each item (default 3)")
+    parser.add_argument("--runs", type=int, default=1, help="time each phase N times and keep the fastest (default 1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--atoms", type=int, default=4)
+    parser.add_argument("--sharing", type=float, default=0.0)
+    parser.add_argument("--max-nodes", type=int, help="node budget of each search (default none)")
+    parser.add_argument("--tracemalloc", action="store_true", help="record peak memory and allocation sites")
+    parser.add_argument("--profile", metavar="DIR", help="write cProfile dumps to DIR")
+    parser.add_argument("-o", "--output", help="write the results as JSON")
+    parser.add_argument("--save", metavar="NAME", help="save the results as baseline NAME")
+    parser.add_argument("--compare", metavar="NAME", help="compare the results with baseline NAME")
+    parser.add_argument("--baseline-dir", default=BASELINE_DIR, help=f"where baselines live (default {BASELINE_DIR})")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative slowdown of a median allowed before it is a regression (default 0.10)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.005,
+                        help="ignore changes of a median smaller than this many ms (default 0.005)")
+    parser.add_argument("--all", action="store_true", help="list unchanged cases in the comparison too")
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.compare, args.baseline_dir) if args.compare else None
+    report = run(args.logics, args.sizes, args.phases, args.count, args.repeat, args.seed,
+                 {"atoms": args.atoms, "sharing": args.sharing}, args.max_nodes, args.tracemalloc, args.profile,
+                 args.runs)
+    print(format_table(report))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save:
+        print(f"Saved baseline {save_baseline(report, args.save, args.baseline_dir)}")
+
+    if baseline is not None:
+        different = [key for key in WORKLOAD_KEYS if baseline["meta"].get(key) != report["meta"].get(key)]
+        if different:
+            print(f"Warning: baseline {args.compare} was run with different {', '.join(different)}")
+        rows = compare(baseline, report, args.tolerance, args.min_delta_ms / 1000)
+        print()
+        print(f"Against baseline {args.compare} (tolerance {args.tolerance:.0%})")
+        print(format_comparison(rows, args.all))
+        if any(row[4] == "regression" for row in rows):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+import weakref
+
+# Opcodes shared by the four logics; each logic only uses the ones it has.
+ATOM = 0
+TOP = 1
+BOT = 2
+AND = 3
+OR = 4
+IMP = 5
+COIMP = 6
+NOT = 7
+
+NO_CHILD = -1
+
+# The shape of a node, used to index rule tables, is its opcode, or NEGATED plus the
+# operand's opcode for a negation (so ~(a ∧ b) and ~~a have shapes of their own).
+NEGATED = 8
+SHAPES = 16
+ALL_SHAPES = frozenset(range(SHAPES))
+
+def negated(op: int) -> int:
+    return NEGATED + op
+
+# Signatures are 32-bit masks of the literals a formula can be taken apart into, i.e.
+# the atoms and constants of its negation normal form with their polarity: one bit
+# for each of ⊤, ⊥, ~⊤, ~⊥ and a positive/negative bit pair for each atom. Atoms
+# share the 14 pairs by index, so a signature over-approximates: disjoint signatures
+# mean no common literal, overlapping ones prove nothing.
+SIG_TOP = 1 << 0
+SIG_BOT = 1 << 1
+SIG_NEG_TOP = 1 << 2
+SIG_NEG_BOT = 1 << 3
+SIG_CONSTANTS = SIG_TOP | SIG_BOT | SIG_NEG_TOP | SIG_NEG_BOT
+SIG_ATOM_SLOTS = 14
+
+def atom_signature(index: int) -> int:
+    return 1 << (4 + 2 * (index % SIG_ATOM_SLOTS))
+
+# Opcode of a slot freed by FormulaStore.collect, waiting to be reused.
+FREE = 255
+
+# Empty slot of the hash-consing index.
+EMPTY = -1
+
+def _hash(op: int, left: int, right: int) -> int:
+    return (op * 0x9E3779B1) ^ (left * 0x85EBCA77) ^ (right * 0xC2B2AE3D)
+
+_set = object.__setattr__
+
+class FormulaStore:
+    # Hash-consed formula nodes kept as parallel arrays: node i has opcode op[i] and
+    # children left[i]/right[i] (node ids, or NO_CHILD). For atoms left[i] indexes the
+    # atom-name table instead. A node id identifies a formula, so equal formulas have
+    # the same id and comparing or hashing formulas is comparing or hashing ints.
+    #
+    # Python objects only exist for the formulas someone actually looks at: the
+    # Atom/Compound/... classes of each logic are thin views holding a node id (see
+    # FormulaView), and the *_run.py parsers build straight into the arrays.
+    #
+    # sig[i] and neg_sig[i] are the signatures of node i and of its negation.
+    #
+    # The hash-consing index is an open-addressing table of node ids (array('i'), kept
+    # at most 2/3 full) probed by comparing the columns, so it costs a few bytes per
+    # node. Views are kept as weak references in a list indexed by node id.
+    #
+    # Nodes are not freed when their views die: collect() frees every node that no live
+    # view (or explicit root) reaches, and later nodes reuse the freed ids.
+    def __init__(self):
+        self.op = array("B")
+        self.left = array("i")
+        self.right = array("i")
+        self.sig = array("I")
+        self.neg_sig = array("I")
+        self.names: List[str] = []
+
+        self._names: Dict[str, int] = {}
+        self._index = array("i", [EMPTY]) * 8
+        self._free: List[int] = []
+        self._views: List[Optional[weakref.KeyedRef]] = []
+        self._classes: Dict[int, type] = {}
+        # One bound method shared by every view's weak reference.
+        self._drop_view = self._view_died
+
+    def __len__(self):
+        # Number of live nodes.
+        return len(self.op) - len(self._free)
+
+    def nbytes(self) -> int:
+        # Size of the node arrays and of the hash-consing index (not of the views).
+        return sum(len(a) * a.itemsize for a in (self.op, self.left, self.right, self.sig, self.neg_sig, self._index))
+
+    def _slot(self, op: int, left: int, right: int) -> int:
+        # Index slot holding node (op, left, right), or the empty slot where it goes.
+        index = self._index
+        mask = len(index) - 1
+        slot = _hash(op, left, right) & mask
+        while True:
+            node = index[slot]
+            if node == EMPTY or (self.op[node] == op and self.left[node] == left and self.right[node] == right):
+                return slot
+            slot = (slot + 1) & mask
+
+    def _rebuild_index(self, size: int):
+        self._index = array("i", [EMPTY]) * size
+        mask = size - 1
+        index, ops, lefts, rights = self._index, self.op, self.left, self.right
+        for node in range(len(ops)):
+            op = ops[node]
+            if op == FREE:
+                continue
+            slot = _hash(op, lefts[node], rights[node]) & mask
+            while index[slot] != EMPTY:
+                slot = (slot + 1) & mask
+            index[slot] = node
+
+    def _node(self, op: int, left: int, right: int) -> int:
+        slot = self._slot(op, left, right)
+        node = self._index[slot]
+        if node != EMPTY:
+            return node
+
+        sig, neg_sig = self._signatures(op, left, right)
+        if self._free:
+            node = self._free.pop()
+            self.op[node] = op
+            self.left[node] = left
+            self.right[node] = right
+            self.sig[node] = sig
+            self.neg_sig[node] = neg_sig
+        else:
+            node = len(self.op)
+            self.op.append(op)
+            self.left.append(left)
+            self.right.append(right)
+            self.sig.append(sig)
+            self.neg_sig.append(neg_sig)
+            self._views.append(None)
+        self._index[slot] = node
+        if 3 * len(self) > 2 * len(self._index):
+            self._rebuild_index(2 * len(self._index))
+        return node
+
+    def _signatures(self, op: int, left: int, right: int) -> Tuple[int, int]:
+        if op == ATOM:
+            positive = atom_signature(left)
+            return positive, positive << 1
+        elif op == TOP:
+            return SIG_TOP, SIG_NEG_TOP
+        elif op == BOT:
+            return SIG_BOT, SIG_NEG_BOT
+        elif op == NOT:
+            return self.neg_sig[left], self.sig[left]
+        elif op == AND or op == OR:
+            # ~(a ∧ b) and ~(a ∨ b) come apart as ~a and ~b
+            return self.sig[left] | self.sig[right], self.neg_sig[left] | self.neg_sig[right]
+        else:
+            # ⊃ and ⊂ move subformulas across the sequent, so take every literal.
+            both = self.sig[left] | self.neg_sig[left] | self.sig[right] | self.neg_sig[right]
+            return both, both
+
+    def atom(self, name: str) -> int:
+        index = self._names.get(name)
+        if index is None:
+            index = self._names[name] = len(self.names)
+            self.names.append(name)
+        return self._node(ATOM, index, NO_CHILD)
+
+    def constant(self, op: int) -> int:
+        return self._node(op, NO_CHILD, NO_CHILD)
+
+    def unary(self, op: int, operand: int) -> int:
+        return self._node(op, operand, NO_CHILD)
+
+    def binary(self, op: int, left: int, right: int) -> int:
+        return self._node(op, left, right)
+
+    def shape(self, node: int) -> int:
+        op = self.op[node]
+        if op == NOT:
+            return NEGATED + self.op[self.left[node]]
+        return op
+
+    def register(self, op: int, cls: type):
+        # View class used for nodes with opcode `op`.
+        self._classes[op] = cls
+
+    def view(self, node: int) -> "FormulaView":
+        # The unique live view object for `node`.
+        ref = self._views[node]
+        formula = ref() if ref is not None else None
+        if formula is None:
+            formula = object.__new__(self._classes[self.op[node]])
+            _set(formula, "_id", node)
+            _set(formula, "_left", None)
+            _set(formula, "_right", None)
+            self._views[node] = weakref.KeyedRef(formula, self._drop_view, node)
+        return formula
+
+    def _view_died(self, ref: weakref.KeyedRef):
+        if self._views[ref.key] is ref:
+            self._views[ref.key] = None
+
+    def collect(self, roots: Iterable[int] = ()) -> int:
+        # Frees the nodes that are not subformulas of a formula with a live view or of a
+        # node in `roots`, and returns how many were freed. Their ids are reused by later
+        # nodes, so clear caches keyed by raw node ids first; formulas cached in the
+        # proof memos are live views, so memo.clear_all() lets their nodes go too.
+        ops, lefts, rights = self.op, self.left, self.right
+        live = bytearray(len(ops))
+        stack = list(roots)
+        stack.extend(node for node, ref in enumerate(self._views) if ref is not None and ref() is not None)
+        while stack:
+            node = stack.pop()
+            if live[node]:
+                continue
+            live[node] = 1
+            op = ops[node]
+            if op == ATOM or op == TOP or op == BOT:
+                continue
+            stack.append(lefts[node])
+            if op != NOT:
+                stack.append(rights[node])
+
+        freed = 0
+        for node in range(len(ops)):
+            if not live[node] and ops[node] != FREE:
+                ops[node] = FREE
+                lefts[node] = rights[node] = NO_CHILD
+                self.sig[node] = self.neg_sig[node] = 0
+                self._free.append(node)
+                freed += 1
+        # Reuse low ids first, so a store that shrinks keeps its nodes packed.
+        self._free.sort(reverse=True)
+        size = 8
+        while 3 * len(self) > 2 * size:
+            size *= 2
+        self._rebuild_index(size)
+        return freed
+
+class FormulaView:
+    # Base of the formula classes of every logic. Subclasses set `_store` (the logic's
+    # FormulaStore) and `_fields` (the constructor arguments, for repr and pickling).
+    # Child views are created on first access and then kept.
+    __slots__ = ("_id", "_left", "_right", "__weakref__")
+
+    _store: FormulaStore
+    _fields: tuple = ()
+
+    @property
+    def id(self) -> int:
+        return self._id
+
+    def _left_view(self) -> "FormulaView":
+        left = self._left
+        if left is None:
+            left = self._store.view(self._store.left[self._id])
+            _set(self, "_left", left)
+        return left
+
+    def _right_view(self) -> "FormulaView":
+        right = self._right
+        if right is None:
+            right = self._store.view(self._store.right[self._id])
+            _set(self, "_right", right)
+        return right
+
+    def __hash__(self):
+        return self._id
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"cannot assign to field '{name}'")
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, name) for name in self._fields))
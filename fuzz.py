@@ -0,0 +1,306 @@
+import argparse
+import importlib.util
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import formula_store
+import memo
+import search
+import workload
+
+# Differential fuzzing: random sequents (see workload.py) go through every engine of a
+# logic, which must agree on derivability, and every proof an engine returns must
+# pass the logic's check_proof. A disagreement is shrunk to a smallest failing sequent.
+#
+#     python fuzz.py --logics nql --count 500 --size 6 --seed 3
+#
+# The engines of every logic are
+#
+#     reference     fixed point over every sequent reachable through the PREMISES table
+#     baseline      plain backtracking over the PREMISES table, as the engines were
+#                   before the search was optimized
+#     search        is_derivable
+#     search-proof  derive_proof
+#
+# plus whitman and whitman-proof (ll) and batch (ll and pql, needs numpy). Each engine
+# starts from an empty cache on every sequent, so their total times compare. The
+# reference and baseline read the calculus from PREMISES (the table check_proof uses)
+# rather than from `alternatives`, so a bug in the dispatch tables or in the signature
+# pruning of the optimized engines shows up as a disagreement.
+
+class OutOfBudget(Exception):
+    pass
+
+def unpruned_alternatives(logic, sequent) -> List[tuple]:
+    # The premises of every rule of the logic's PREMISES table that applies to `sequent`,
+    # in table order: no dispatch on shapes and no pruning.
+    alpha, beta = sequent
+    found = []
+    for premises in logic.PREMISES.values():
+        needed = premises(alpha, beta)
+        if needed is not None:
+            found.append(needed)
+    return found
+
+def reference_derivable(logic, sequent, budget: int) -> bool:
+    # Least fixed point over every sequent reachable through the PREMISES table: start
+    # with nothing derivable and add a sequent once one of its rules has all premises
+    # derivable, until nothing changes. No search order, memo or tabling to get wrong.
+    # Gives up (OutOfBudget) if more than `budget` sequents are reachable.
+    rules = {}
+    stack = [sequent]
+    while stack:
+        goal = stack.pop()
+        if goal in rules:
+            continue
+        if len(rules) >= budget:
+            raise OutOfBudget()
+        rules[goal] = unpruned_alternatives(logic, goal)
+        for premises in rules[goal]:
+            stack.extend(premise for premise in premises if premise not in rules)
+
+    derivable = set()
+    changed = True
+    while changed and sequent not in derivable:
+        changed = False
+        for goal, alternatives in rules.items():
+            if goal not in derivable and any(all(premise in derivable for premise in premises)
+                                             for premises in alternatives):
+                derivable.add(goal)
+                changed = True
+    return sequent in derivable
+
+def baseline_derivable(logic, sequent, budget: int) -> bool:
+    # Depth-first backtracking over the PREMISES table with a per-query cache, the way
+    # the engines searched before they were optimized. A goal already on the path fails
+    # there, and a failure that depended on such a cut is not cached. Gives up
+    # (OutOfBudget) after expanding `budget` goals.
+    proved = set()
+    failed = set()
+    path = set()
+    expanded = 0
+
+    def derivable(goal) -> Tuple[bool, bool]:
+        # (derivable, whether the answer depended on a goal on the path)
+        nonlocal expanded
+        if goal in proved:
+            return True, False
+        if goal in failed:
+            return False, False
+        if goal in path:
+            return False, True
+        expanded += 1
+        if expanded > budget:
+            raise OutOfBudget()
+
+        path.add(goal)
+        cut = False
+        try:
+            for premises in unpruned_alternatives(logic, goal):
+                for premise in premises:
+                    found, premise_cut = derivable(premise)
+                    cut |= premise_cut
+                    if not found:
+                        break
+                else:
+                    proved.add(goal)
+                    return True, False
+        finally:
+            path.discard(goal)
+        if not cut:
+            failed.add(goal)
+        return False, cut
+
+    return derivable(sequent)[0]
+
+def check_derivation(logic, proof) -> Optional[str]:
+    # What is wrong with `proof` according to the logic's check_proof rule table, or None.
+    node = search.invalid_step(proof, logic.PREMISES)
+    return None if node is None else f"{node.rule} does not derive {node}"
+
+class Engine:
+    # `run` takes a list of sequents and gives a verdict for each: True/False, a proof
+    # or None for proving engines, and None for "no answer" (reference or baseline out
+    # of budget).
+    def __init__(self, name: str, run: Callable[[List[tuple]], list], proves: bool = False):
+        self.name = name
+        self.run = run
+        self.proves = proves
+
+def _each(function: Callable) -> Callable[[List[tuple]], list]:
+    def run(sequents):
+        results = []
+        for sequent in sequents:
+            memo.clear_all()
+            results.append(function(sequent))
+        return results
+    return run
+
+def engines(logic, budget: int = 20000) -> List[Engine]:
+    def within_budget(decide: Callable) -> Callable:
+        def run(sequent):
+            try:
+                return decide(logic, sequent, budget)
+            except OutOfBudget:
+                return None
+        return run
+
+    found = [Engine("reference", _each(within_budget(reference_derivable))),
+             Engine("baseline", _each(within_budget(baseline_derivable))),
+             Engine("search", _each(logic.is_derivable)),
+             Engine("search-proof", _each(logic.derive_proof), proves=True)]
+    if logic is workload.LOGICS["ll"]:
+        found.append(Engine("whitman", _each(lambda sequent: logic.is_derivable(sequent, engine="whitman"))))
+        found.append(Engine("whitman-proof", _each(lambda sequent: logic.derive_proof(sequent, engine="whitman")),
+                            proves=True))
+    if hasattr(logic, "decide_many") and importlib.util.find_spec("numpy") is not None:
+        found.append(Engine("batch", logic.decide_many))
+    return found
+
+def failure(logic, engine_list: List[Engine], sequent) -> Optional[str]:
+    # What goes wrong on `sequent` alone, or None if the engines agree and the proofs check.
+    verdicts = {}
+    for engine in engine_list:
+        result = engine.run([sequent])[0]
+        if engine.proves and result is not None:
+            problem = check_derivation(logic, result)
+            if problem:
+                return f"{engine.name}: {problem}"
+        verdicts[engine.name] = result is not None if engine.proves else result
+    answers = {name: verdict for name, verdict in verdicts.items() if verdict is not None}
+    if len(set(answers.values())) > 1:
+        return ", ".join(f"{name}={verdict}" for name, verdict in answers.items())
+    return None
+
+def _smaller(store, node: int):
+    # Formulas strictly smaller than `node`: its children, the leaves it contains, and
+    # itself with one child replaced by something smaller.
+    op = store.op[node]
+    if op in (formula_store.ATOM, formula_store.TOP, formula_store.BOT):
+        return
+    left, right = store.left[node], store.right[node]
+    children = (left,) if op == formula_store.NOT else (left, right)
+    yield from children
+
+    leaves, stack = [], list(children)
+    while stack:
+        child = stack.pop()
+        if store.op[child] in (formula_store.ATOM, formula_store.TOP, formula_store.BOT):
+            if child not in leaves:
+                leaves.append(child)
+        else:
+            stack.append(store.left[child])
+            if store.op[child] != formula_store.NOT:
+                stack.append(store.right[child])
+    yield from leaves
+
+    if op == formula_store.NOT:
+        for smaller in _smaller(store, left):
+            yield store.unary(op, smaller)
+    else:
+        for smaller in _smaller(store, left):
+            yield store.binary(op, smaller, right)
+        for smaller in _smaller(store, right):
+            yield store.binary(op, left, smaller)
+
+def shrink(logic, engine_list: List[Engine], sequent) -> Tuple[tuple, str]:
+    # Greedily replaces either side by a smaller formula while the failure persists.
+    store = logic.store
+    problem = failure(logic, engine_list, sequent)
+    alpha, beta = sequent[0].id, sequent[1].id
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        candidates = [(smaller, beta) for smaller in _smaller(store, alpha)] + \
+                     [(alpha, smaller) for smaller in _smaller(store, beta)]
+        for left, right in candidates:
+            found = failure(logic, engine_list, (logic.formula(left), logic.formula(right)))
+            if found:
+                alpha, beta, problem, shrunk = left, right, found, True
+                break
+    return (logic.formula(alpha), logic.formula(beta)), problem
+
+class Report:
+    def __init__(self, logic_name: str):
+        self.logic = logic_name
+        self.sequents = 0
+        self.derivable = 0
+        self.skipped = 0
+        self.seconds: Dict[str, float] = {}
+        self.failures: List[Tuple[tuple, str]] = []
+
+def fuzz(logic_name: str, count: int = 200, seed: int = 0, budget: int = 20000, shrink_failures: bool = True,
+         **options) -> Report:
+    logic = workload.LOGICS[logic_name]
+    sequents = workload.random_sequents(logic, count, seed, **options)
+    engine_list = engines(logic, budget)
+    report = Report(logic_name)
+    report.sequents = len(sequents)
+
+    results = {}
+    for engine in engine_list:
+        start = time.perf_counter()
+        results[engine.name] = engine.run(sequents)
+        report.seconds[engine.name] = time.perf_counter() - start
+
+    for i, sequent in enumerate(sequents):
+        verdicts = {engine.name: results[engine.name][i] for engine in engine_list}
+        proofs = [(engine.name, verdicts[engine.name]) for engine in engine_list
+                  if engine.proves and verdicts[engine.name] is not None]
+        answers = {engine.name: verdicts[engine.name] is not None if engine.proves else verdicts[engine.name]
+                   for engine in engine_list}
+        report.skipped += answers["reference"] is None
+        report.derivable += answers["search"] is True
+
+        bad = len({answer for answer in answers.values() if answer is not None}) > 1 or \
+            any(check_derivation(logic, proof) for _, proof in proofs)
+        if bad:
+            if shrink_failures:
+                report.failures.append(shrink(logic, engine_list, sequent))
+            else:
+                report.failures.append((sequent, failure(logic, engine_list, sequent)))
+    memo.clear_all()
+    return report
+
+def format_report(report: Report) -> str:
+    lines = [f"{report.logic}: {report.sequents} sequents, {report.derivable} derivable, "
+             f"{report.skipped} beyond the reference budget, {len(report.failures)} failures"]
+    def speedup(base: Optional[float], seconds: float) -> str:
+        return f"{base / seconds:8.1f}x" if base and seconds > 0 else f"{'-':>9}"
+
+    baseline, reference = report.seconds.get("baseline"), report.seconds.get("reference")
+    for name, seconds in report.seconds.items():
+        # The optimized engines are not faster everywhere (see README.md), so say so.
+        slower = "  slower than baseline" if baseline and name not in ("baseline", "reference") and seconds > baseline else ""
+        lines.append(f"  {name:<14} {seconds:9.4f} s {speedup(baseline, seconds)} vs baseline "
+                     f"{speedup(reference, seconds)} vs reference{slower}")
+    for sequent, problem in report.failures:
+        lines.append(f"  FAIL {workload.sequent_text(sequent)}")
+        lines.append(f"       {problem}")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the engines of each logic agree on random sequents.")
+    parser.add_argument("--logics", nargs="+", choices=sorted(workload.LOGICS), default=["ll", "pql", "nl", "nql"])
+    parser.add_argument("--count", type=int, default=200, help="sequents per logic (default 200)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=5, help="binary connectives per formula (default 5)")
+    parser.add_argument("--atoms", type=int, default=3)
+    parser.add_argument("--sharing", type=float, default=0.2)
+    parser.add_argument("--budget", type=int, default=20000, help="sequents the reference and baseline engines may visit (default 20000)")
+    parser.add_argument("--no-shrink", action="store_true", help="report failures as found")
+    args = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10000))
+    failed = False
+    for name in args.logics:
+        report = fuzz(name, args.count, args.seed, args.budget, not args.no_shrink,
+                      size=args.size, atoms=args.atoms, sharing=args.sharing)
+        print(format_report(report))
+        failed |= bool(report.failures)
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
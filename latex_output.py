@@ -0,0 +1,300 @@
+from concurrent.futures import ThreadPoolExecutor, wait as wait_all
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Iterable, Iterator, List, Optional, Union
+
+import formula_store
+import memo
+
+# A .tex file written as it is produced: the template, then fragments one at a time,
+# then \end{document} on close. Nothing is held in memory beyond the fragment being
+# written, so a document costs as much memory as its largest proof.
+#
+#     with LatexWriter("proofs_output/out.tex", "a.template") as out:
+#         for proof in proofs:
+#             out += nql.iter_object_to_bussproofs(proof)
+#     build(out)
+#
+# Each `out += entry` (a string, or the pieces of one) is an entry of the report, and
+# `out += string` keeps working for code that used to build the document as a string.
+#
+# With shard_size the entries are spread over documents of shard_size entries each,
+# out_1.tex, out_2.tex, ..., which build() compiles side by side, each pdflatex in a
+# temporary directory of its own, and with merge=True joins into out.pdf.
+
+class LatexWriter:
+    def __init__(self, path: str, template: str, shard_size: Optional[int] = None):
+        if shard_size is not None and shard_size < 1:
+            raise ValueError("shard_size must be at least 1")
+        self.path = path
+        self.shard_size = shard_size
+        self.paths: List[str] = []
+        with open(template, "r") as g:
+            self._template = g.read()
+        self._open()
+
+    def _open(self):
+        path = self.path
+        if self.shard_size is not None:
+            stem, ext = os.path.splitext(self.path)
+            path = f"{stem}_{len(self.paths) + 1}{ext}"
+        self._file = open(path, "w")
+        self._file.write(self._template)
+        self._entries = 0
+        self.paths.append(path)
+
+    def _end(self):
+        self._file.write("\n\\end{document}")
+        self._file.close()
+
+    def write(self, fragment: str):
+        self._file.write(fragment)
+
+    def write_all(self, fragments: Iterable[str]):
+        for fragment in fragments:
+            self._file.write(fragment)
+
+    def add(self, entry: Union[str, Iterable[str]]):
+        # An entry is never split between shards.
+        if self.shard_size is not None and self._entries == self.shard_size:
+            self._end()
+            self._open()
+        if isinstance(entry, str):
+            self.write(entry)
+        else:
+            self.write_all(entry)
+        self._entries += 1
+
+    def __iadd__(self, entry: Union[str, Iterable[str]]) -> "LatexWriter":
+        self.add(entry)
+        return self
+
+    def close(self):
+        if not self._file.closed:
+            self._end()
+
+    def __enter__(self) -> "LatexWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# Most of a small report's compile time goes into loading the packages of the preamble.
+# pdflatex can load them once and dump the result as a format file (pdflatex -ini ...
+# \dump), which later runs start from instead (-fmt). Formats are kept in FORMAT_DIR,
+# named after a hash of the preamble and of the pdflatex version, so a changed template
+# or TeX installation gets a new one. The .tex files themselves stay whole documents.
+FORMAT_DIR = ".latex_formats"
+
+_failed_formats = set()
+_format_lock = threading.Lock()
+
+def read_preamble(tex_file: str) -> Optional[str]:
+    # Everything before the \begin{document} line, or None if there is none.
+    lines = []
+    with open(tex_file, "r") as f:
+        for line in f:
+            if line.lstrip().startswith("\\begin{document}"):
+                return "".join(lines)
+            lines.append(line)
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _pdflatex_version() -> str:
+    return subprocess.run(["pdflatex", "--version"], check=True, capture_output=True, text=True).stdout
+
+def preamble_format(preamble: str, directory: str = FORMAT_DIR) -> Optional[str]:
+    # The format file of `preamble`, dumped the first time it is asked for; None if
+    # pdflatex could not dump it (the document is then compiled the ordinary way).
+    digest = hashlib.sha256((_pdflatex_version() + preamble).encode()).hexdigest()[:16]
+    name = "preamble-" + digest
+    fmt = os.path.join(directory, name + ".fmt")
+    with _format_lock:
+        if os.path.exists(fmt):
+            return fmt
+        if fmt in _failed_formats:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, "preamble.tex"), "w") as f:
+                f.write(preamble + "\n\\dump\n")
+            result = subprocess.run(["pdflatex", "-ini", "-interaction=nonstopmode", "-halt-on-error",
+                                     f"-jobname={name}", "&pdflatex", "preamble.tex"],
+                                    cwd=tmp, stdout=subprocess.DEVNULL)
+            if result.returncode != 0 or not os.path.exists(os.path.join(tmp, name + ".fmt")):
+                _failed_formats.add(fmt)
+                return None
+            # Moved in under a temporary name first, so that another process never
+            # picks up a half-copied format.
+            shutil.move(os.path.join(tmp, name + ".fmt"), fmt + ".part")
+            os.replace(fmt + ".part", fmt)
+    return fmt
+
+def pdflatex(tex_file: str, format_dir: Optional[str] = None) -> str:
+    # Compiles tex_file in a temporary directory, so that several can run at once and
+    # the aux files go away with it, and puts the PDF next to tex_file. If pdflatex
+    # fails its log is kept next to tex_file instead. With format_dir, the preamble
+    # comes from a precompiled format (see preamble_format).
+    directory, name = os.path.split(tex_file)
+    stem = os.path.splitext(name)[0]
+    fmt = None
+    if format_dir is not None:
+        preamble = read_preamble(tex_file)
+        fmt = None if preamble is None else preamble_format(preamble, format_dir)
+
+    command = ["pdflatex", "-interaction=nonstopmode", "-halt-on-error"]
+    env = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if fmt is None:
+            shutil.copy(tex_file, tmp)
+        else:
+            # The format already holds the preamble: compile the rest of the file.
+            with open(tex_file, "r") as f, open(os.path.join(tmp, name), "w") as g:
+                for line in f:
+                    if line.lstrip().startswith("\\begin{document}"):
+                        g.write(line)
+                        break
+                shutil.copyfileobj(f, g)
+            command.append("-fmt=" + os.path.splitext(os.path.basename(fmt))[0])
+            env = dict(os.environ, TEXFORMATS=os.path.abspath(os.path.dirname(fmt)) + os.pathsep)
+        try:
+            subprocess.run(command + [name], cwd=tmp, env=env, check=True, stdout=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            if os.path.exists(os.path.join(tmp, stem + ".log")):
+                shutil.copy(os.path.join(tmp, stem + ".log"), directory or ".")
+            raise
+        pdf = os.path.join(directory, stem + ".pdf")
+        shutil.move(os.path.join(tmp, stem + ".pdf"), pdf)
+    return pdf
+
+def merge_pdfs(pdfs: List[str], path: str) -> str:
+    # One PDF with the pages of `pdfs` in order (needs pypdf).
+    from pypdf import PdfWriter
+
+    merged = PdfWriter()
+    for pdf in pdfs:
+        merged.append(pdf)
+    with open(path, "wb") as f:
+        merged.write(f)
+    return path
+
+class CompilePool:
+    # Runs at most `workers` pdflatex at a time (default: one per core). Documents are
+    # queued with submit() as soon as they are written, and wait() gives their PDFs.
+    # format_dir=None compiles every preamble from scratch.
+    def __init__(self, workers: Optional[int] = None, format_dir: Optional[str] = FORMAT_DIR):
+        self._executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count())
+        self.format_dir = format_dir
+        self._jobs = []
+
+    def submit(self, writer: LatexWriter, merge: bool = False):
+        # Every file of `writer`, which is closed first; with merge, a sharded writer's
+        # PDFs are joined into one named after writer.path.
+        writer.close()
+        futures = [self._executor.submit(pdflatex, path, self.format_dir) for path in writer.paths]
+        self._jobs.append((writer, merge, futures))
+
+    def wait(self) -> List[str]:
+        # The PDFs of everything submitted so far, in order. Raises the first failure
+        # once every job has finished.
+        jobs, self._jobs = self._jobs, []
+        wait_all([future for _, _, futures in jobs for future in futures])
+        pdfs = []
+        for writer, merge, futures in jobs:
+            done = [future.result() for future in futures]
+            if merge and writer.shard_size is not None:
+                done = [merge_pdfs(done, os.path.splitext(writer.path)[0] + ".pdf")]
+            pdfs.extend(done)
+        return pdfs
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self) -> "CompilePool":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def build(writer: LatexWriter, workers: Optional[int] = None, merge: bool = False,
+          format_dir: Optional[str] = FORMAT_DIR) -> List[str]:
+    with CompilePool(workers, format_dir) as pool:
+        pool.submit(writer, merge)
+        return pool.wait()
+
+def joined(lines: Iterable[str], separator: str = "\n") -> Iterator[str]:
+    # The pieces of separator.join(lines), without joining them.
+    first = True
+    for line in lines:
+        if not first:
+            yield separator
+        first = False
+        yield line
+
+def minipage(lines: Iterable[str], caption: str = "") -> Iterator[str]:
+    # A prooftree in a minipage, as lift_object_to_bussproofs writes it, around the
+    # lines of a proof.
+    yield f"\\begin{{minipage}}{{0.3\\linewidth}}\n{caption}\\begin{{prooftree}}\n"
+    yield from joined(lines)
+    yield "\n\\end{prooftree}\n\\end{minipage}\n\n"
+
+LATEX_CONSTANTS = {formula_store.TOP: "\\top", formula_store.BOT: "\\bot"}
+LATEX_CONNECTIVES = {formula_store.AND: "\\land", formula_store.OR: "\\lor",
+                     formula_store.IMP: "\\supset", formula_store.COIMP: "\\subset"}
+
+# Bound on the text each logic's latex memo keeps (see latex_memo).
+LATEX_CACHE_BYTES = 32 * 1024 * 1024
+
+def _latex_size(node: int, entry: tuple) -> int:
+    return sys.getsizeof(entry[1])
+
+def latex_memo(name: str) -> memo.Memo:
+    # Memo for formula_latex, bounded by the size of the text it holds.
+    return memo.Memo(name, max_bytes=LATEX_CACHE_BYTES, sizeof=_latex_size)
+
+def formula_latex(formula, cache: memo.Memo) -> str:
+    # LaTeX of a formula view, without recursion: the pieces come off an explicit stack
+    # and are joined once. Only the formulas asked for (the sequent sides of a proof)
+    # go in `cache`, keyed by node id with the view kept alongside so the node stays
+    # alive; a compound subformula already there is copied in instead of walked again.
+    store = formula._store
+    node = formula.id
+    cached = cache.get(node)
+    if cached is not memo.MISSING:
+        return cached[1]
+
+    pieces = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, str):
+            pieces.append(current)
+            continue
+        op = store.op[current]
+        if op == formula_store.ATOM:
+            pieces.append(store.names[store.left[current]])
+            continue
+        if op in LATEX_CONSTANTS:
+            pieces.append(LATEX_CONSTANTS[op])
+            continue
+        if current != node:
+            cached = cache.get(current)
+            if cached is not memo.MISSING:
+                pieces.append(cached[1])
+                continue
+
+        if op == formula_store.NOT:
+            pieces.append("\\sim ")
+            stack.append(store.left[current])
+        else:
+            stack.extend((")", store.right[current], f" {LATEX_CONNECTIVES[op]} ", store.left[current], "("))
+
+    text = "".join(pieces)
+    cache.put(node, (formula, text))
+    return text
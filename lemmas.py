@@ -0,0 +1,88 @@
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import latex_output
+
+# Proofs from search.reconstruct are DAGs: a subgoal used twice is one ProofNode with
+# two parents. Rendering them as trees writes such a subproof out at every use, which
+# can make the LaTeX exponentially larger than the proof. Here shared subproofs of at
+# least `threshold` nodes, and any subproof of `max_size` nodes or more, are set apart
+# as numbered lemmas: each is typeset once, and its uses become leaves
+# ProofNode(sequent, "Lemma k", []) that the lift_proof_to_bussproofs of every logic
+# render as axioms labelled "Lemma k".
+
+THRESHOLD = 3
+
+def is_reference(proof) -> bool:
+    return not proof.premises and proof.rule.startswith("Lemma ")
+
+def reference_latex(proof, lift_formula: Callable) -> str:
+    alpha_latex = lift_formula(proof.sequent[0])
+    beta_latex = lift_formula(proof.sequent[1])
+    return f"\\AxiomC{{}}\n\\RightLabel{{{proof.rule}}}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
+
+def split(proof, make_node: Callable, threshold: int = THRESHOLD,
+          max_size: Optional[int] = None) -> Tuple[list, object]:
+    # (lemmas, main): the lemma proofs numbered from 1, each only using lemmas before it,
+    # and the proof itself, all with references in place of the lemmas they use.
+    parents: Dict[int, int] = {}
+    order = []
+    stack = [(proof, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if expanded:
+            order.append(node)
+            continue
+        if id(node) in parents:
+            continue
+        parents[id(node)] = 0
+        stack.append((node, True))
+        for premise in node.premises:
+            stack.append((premise, False))
+    for node in order:
+        for premise in node.premises:
+            parents[id(premise)] += 1
+
+    # `order` lists premises before their conclusions, so sizes and lemma numbers are
+    # known for the premises of a node when it is reached.
+    size: Dict[int, int] = {}
+    number: Dict[int, int] = {}
+    lemmas = []
+    for node in order:
+        size[id(node)] = 1 + sum(1 if id(premise) in number else size[id(premise)] for premise in node.premises)
+        shared = parents[id(node)] > 1 and size[id(node)] >= threshold
+        large = max_size is not None and size[id(node)] >= max_size
+        if node is not proof and node.premises and (shared or large):
+            lemmas.append(node)
+            number[id(node)] = len(lemmas)
+
+    def cut(root):
+        # Copy of `root` down to the lemmas it uses.
+        copies: Dict[int, object] = {}
+        stack = [(root, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if id(node) in copies:
+                continue
+            if node is not root and id(node) in number:
+                copies[id(node)] = make_node(node.sequent, f"Lemma {number[id(node)]}", [])
+            elif expanded:
+                copies[id(node)] = make_node(node.sequent, node.rule, [copies[id(premise)] for premise in node.premises])
+            else:
+                stack.append((node, True))
+                stack.extend((premise, False) for premise in node.premises)
+        return copies[id(root)]
+
+    return [cut(lemma) for lemma in lemmas], cut(proof)
+
+def iter_lift(proof, make_node: Callable, iter_proof: Callable, threshold: int = THRESHOLD,
+              max_size: Optional[int] = None) -> Iterator[str]:
+    # The lemmas, each in a prooftree captioned with its number, then the proof itself
+    # as lift_object_to_bussproofs renders it, as pieces of text.
+    lemmas, main = split(proof, make_node, threshold, max_size)
+    for k, lemma in enumerate(lemmas, 1):
+        yield from latex_output.minipage(iter_proof(lemma), f"Lemma {k}\n")
+    yield from latex_output.minipage(iter_proof(main))
+
+def lift(proof, make_node: Callable, iter_proof: Callable, threshold: int = THRESHOLD,
+         max_size: Optional[int] = None) -> str:
+    return "".join(iter_lift(proof, make_node, iter_proof, threshold, max_size))
@@ -1,29 +1,71 @@
 from dataclasses import dataclass
-from typing import Union, Tuple, List, Optional
+from typing import Dict, Union, Tuple, List, Optional, Iterator
 from enum import Enum
 import os
-import subprocess
+import time
+
+import formula_store
+from formula_store import FormulaView
+import latex_output
+import lemmas
+import memo
+import search
 
 class ConnectiveType(Enum):
     AND = "∧"
     OR = "∨"
 
-@dataclass(frozen=True)
-class Atom:
-    name: str
+# Formulas live in `store`; the classes below are views over its nodes.
+store = formula_store.FormulaStore()
+
+OPCODES = {
+    ConnectiveType.AND: formula_store.AND,
+    ConnectiveType.OR: formula_store.OR,
+}
+CONNECTIVES = {opcode: connective for connective, opcode in OPCODES.items()}
+
+class Atom(FormulaView):
+    __slots__ = ()
+    _store = store
+    _fields = ("name",)
+
+    def __new__(cls, name: str):
+        return store.view(store.atom(name))
+
+    @property
+    def name(self) -> str:
+        return store.names[store.left[self._id]]
     
     def __str__(self):
         return self.name
 
-@dataclass(frozen=True)
-class Compound:
-    connective: ConnectiveType
-    left: Union['Atom', 'Compound']
-    right: Union['Atom', 'Compound']
+class Compound(FormulaView):
+    __slots__ = ()
+    _store = store
+    _fields = ("connective", "left", "right")
+
+    def __new__(cls, connective: ConnectiveType, left: Union['Atom', 'Compound'], right: Union['Atom', 'Compound']):
+        return store.view(store.binary(OPCODES[connective], left._id, right._id))
+
+    @property
+    def connective(self) -> ConnectiveType:
+        return CONNECTIVES[store.op[self._id]]
+
+    @property
+    def left(self) -> Union['Atom', 'Compound']:
+        return self._left_view()
+
+    @property
+    def right(self) -> Union['Atom', 'Compound']:
+        return self._right_view()
     
     def __str__(self):
         return f"({self.left} {self.connective.value} {self.right})"
 
+store.register(formula_store.ATOM, Atom)
+store.register(formula_store.AND, Compound)
+store.register(formula_store.OR, Compound)
+
 Formula = Union[Atom, Compound]
 
 @dataclass
@@ -52,7 +94,32 @@ def get_disjuncts(formula: Formula) -> Tuple[Formula, Formula]:
     assert is_disjunction(formula)
     return formula.left, formula.right
 
-def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext: str):
+def _report_entry(proof: Optional[ProofNode], seq: tuple[Formula, Formula],
+                  lemma_threshold: Optional[int]) -> Iterator[str]:
+    formula_left = lift_formula_to_latex_string(seq[0])
+    formula_right = lift_formula_to_latex_string(seq[1])
+
+    status_text = "Sequente não derivável" if proof is None else "Sequente derivável"
+    yield "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
+    + f"\\text{{{status_text}}}\n" \
+    + "\\hfill\n\\break\n"*2
+
+    if proof is not None:
+        if lemma_threshold is None:
+            yield from iter_object_to_bussproofs(proof)
+        else:
+            yield from iter_lemmas_to_bussproofs(proof, lemma_threshold)
+        yield "\\hfill\n\\break\n"*2
+
+def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext: str,
+                  lemma_threshold: Optional[int] = None, shard_size: Optional[int] = None,
+                  workers: Optional[int] = None, merge: bool = False, precompiled: bool = True,
+                  minimal: bool = False):
+    # With lemma_threshold, shared subproofs of that many nodes are typeset once as lemmas.
+    # With shard_size, the proofs go to documents of that many proofs each, compiled by
+    # up to `workers` pdflatex at once and, with merge, joined into one PDF. precompiled
+    # loads the preamble from a format file dumped once, and minimal uses
+    # minimal.template instead of a.template (see latex_output.py).
     if not ext:
         return False
 
@@ -64,67 +131,27 @@ def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext:
     else:
         os.makedirs(output_dir)
 
-    template_dest = os.path.join(output_dir, "../a.template")
+    template_dest = os.path.join(output_dir, "../minimal.template" if minimal else "../a.template")
     tex_file = os.path.join(output_dir, f"{ext}.tex")
 
-    with open(tex_file, 'w') as f:
-        final = ""
+    # Each proof goes to the file as it is rendered, so only one is ever in memory.
+    with latex_output.LatexWriter(tex_file, template_dest, shard_size) as out:
         for proof, seq in proofs:
-            formula_left = lift_formula_to_latex_string(seq[0])
-            formula_right = lift_formula_to_latex_string(seq[1])
-
-            if proof is None:
-                status_text = "Sequente não derivável"
-                init_data = "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
-                + f"\\text{{{status_text}}}\n" \
-                + "\\hfill\n\\break\n"*2
-
-                proof_data = ""
-            else:
-                status_text = "Sequente derivável"
-                init_data = "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
-                + f"\\text{{{status_text}}}\n" \
-                + "\\hfill\n\\break\n"*2
-
-                proof_data = lift_object_to_bussproofs(proof)
-                proof_data += "\\hfill\n\\break\n"*2
-
-
-            proof_data = init_data + proof_data
-
-            final += proof_data
-
-
-        with open(template_dest, 'r') as g:
-            template_data = g.read()
-            f.write(template_data + final + "\n\\end{document}")
-
-
-    original_cwd = os.getcwd()
-    try:
-        os.chdir(output_dir)
-        subprocess.run(["pdflatex", ext + ".tex"], check=True)
-        
-        aux_files = [ext + ".aux", ext + ".log", ext + ".out"]
-        for aux_file in aux_files:
-            if os.path.exists(aux_file):
-                os.remove(aux_file)
-                
-    finally:
-        os.chdir(original_cwd)
-    
-    print(f"PDF generated successfully in {output_dir}/" + ext + ".pdf")
+            out += _report_entry(proof, seq, lemma_threshold)
 
+    for pdf in latex_output.build(out, workers, merge, latex_output.FORMAT_DIR if precompiled else None):
+        print(f"PDF generated successfully in {pdf}")
 
 def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: str, assertion: bool, proofs: bool):
     # print left and right pretty
     print(f"{str(sequent[0])} ⟹   {str(sequent[1])}")
     
-    if assertion:
-        result = is_derivable(sequent)
-        assert result == expected, f"{test_str}"
-    
     if expected and proofs:
+        # Only build the proof when it is going to be rendered; the search then
+        # doubles as the assertion.
+        proof = derive_proof(sequent)
+        if assertion:
+            assert (proof is not None) == expected, f"{test_str}"
 
         status_text = "Sequente derivável"
         formula_left = lift_formula_to_latex_string(sequent[0])
@@ -133,8 +160,12 @@ def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: s
         return ("\\paragraph{" + test_str[:test_str.index(":")+1].replace("failed", "") + " " + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}"  + "\\leavevmode"+"\n\n"+
                       f"\\text{{{status_text}}}\n" +
                       "\\hfill\n\\break\n"*2+ 
-            lift_object_to_bussproofs(derive_proof(sequent)) + "\\hfill\n\\break\n"*2)
+            lift_object_to_bussproofs(proof) + "\\hfill\n\\break\n"*2)
         
+    if assertion:
+        result = is_derivable(sequent)
+        assert result == expected, f"{test_str}"
+
     formula_left = lift_formula_to_latex_string(sequent[0])
     formula_right = lift_formula_to_latex_string(sequent[1])
     if expected:
@@ -148,115 +179,350 @@ def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: s
                     f"\\text{{{status_text}}}\n" +
                     "\\hfill\n\\break\n"*2)
 
-def derive_proof(sequent: Tuple[Formula, Formula]) -> Optional[ProofNode]:
+# The rule that proved each searched sequent, or None; derive_proof and is_derivable share it.
+proof_cache = memo.Memo("ll")
+
+def derive_proof(sequent: Tuple[Formula, Formula], engine: str = "search", stats: bool = False,
+                 max_nodes: Optional[int] = None, deadline: Optional[float] = None,
+                 trace: Optional[str] = None) -> Union[Optional[ProofNode], search.Unknown, tuple]:
+    # engine is "search" (memoized backtracking) or "whitman" (subformula-pair table).
+    # The search takes the options of search.derive_proof: stats, node and time limits,
+    # JSONL trace. The whitman engine has no goals to limit or trace and its stats only
+    # hold the time.
+    if engine == "search":
+        return search.derive_proof(sequent, alternatives, proof_cache, ProofNode, stats, max_nodes, deadline, trace)
+    elif engine != "whitman":
+        raise ValueError(f"Unknown engine: {engine}")
+    elif max_nodes is not None or deadline is not None or trace is not None:
+        raise ValueError("The whitman engine takes no max_nodes, deadline or trace")
+
+    start = time.perf_counter()
+    proof = whitman_proof(sequent)
+    return (proof, search.SearchStats(seconds=time.perf_counter() - start)) if stats else proof
+
+def reconstruct(sequent: Tuple[Formula, Formula], depth: Optional[int] = None) -> Optional[ProofNode]:
+    # Builds the proof from the rules recorded in proof_cache (searching first if
+    # needed), only `depth` levels deep if given.
+    return search.reconstruct(sequent, alternatives, proof_cache, ProofNode, depth)
+
+def shares_atom(alpha: Formula, beta: Formula) -> bool:
+    # Every derivation ends in axioms p ⟹  p with p an atom of both sides, so a
+    # sequent whose signatures are disjoint is not derivable.
+    return store.sig[alpha._id] & store.sig[beta._id] != 0
+
+def alternatives(sequent: Tuple[Formula, Formula]) -> Iterator[Tuple[str, tuple]]:
     alpha, beta = sequent
-    
+
+    if not shares_atom(alpha, beta):
+        return
+
     # A (Axiom)
     if is_atom(alpha) and is_atom(beta) and alpha == beta:
-        return ProofNode(sequent, "A", [])
+        yield "A", ()
 
     #### Left operations!
     # ∧L
     if is_conjunction(alpha):
         for i, ai in enumerate(get_conjuncts(alpha)):
-            sub_proof = derive_proof((ai, beta))
-            if sub_proof:
-                return ProofNode(sequent, f"∧L{i+1}", [sub_proof])
-    
+            if shares_atom(ai, beta):
+                yield f"∧L{i+1}", ((ai, beta),)
+
     # ∨L
     if is_disjunction(alpha):
         a1, a2 = get_disjuncts(alpha)
-        sub_proof_l = derive_proof((a1, beta))
-        sub_proof_r = derive_proof((a2, beta))
-        
-        if sub_proof_l and sub_proof_r:
-            return ProofNode(sequent, "∨L", [sub_proof_l, sub_proof_r])
+        yield "∨L", ((a1, beta), (a2, beta))
 
     #### Right operations!
     # ∧R
     if is_conjunction(beta):
         b1, b2 = get_conjuncts(beta)
-        sub_proof_l = derive_proof((alpha, b1))
-        sub_proof_r = derive_proof((alpha, b2))
-        
-        if sub_proof_l and sub_proof_r:
-            return ProofNode(sequent, "∧R", [sub_proof_l, sub_proof_r])
+        yield "∧R", ((alpha, b1), (alpha, b2))
 
     # ∨R
     if is_disjunction(beta):
         for i, bi in enumerate(get_disjuncts(beta)):
-            sub_proof = derive_proof((alpha, bi))
-            if sub_proof:
-                return ProofNode(sequent, f"∨R{i+1}", [sub_proof])
-    
-    return None
+            if shares_atom(alpha, bi):
+                yield f"∨R{i+1}", ((alpha, bi),)
+
+def is_derivable(sequent: Tuple[Formula, Formula], engine: str = "search", max_nodes: Optional[int] = None,
+                 deadline: Optional[float] = None, trace: Optional[str] = None) -> Union[bool, search.Unknown]:
+    if engine == "search":
+        return search.is_derivable(sequent, alternatives, proof_cache, max_nodes, deadline, trace)
+    elif engine != "whitman":
+        raise ValueError(f"Unknown engine: {engine}")
+    elif max_nodes is not None or deadline is not None or trace is not None:
+        raise ValueError("The whitman engine takes no max_nodes, deadline or trace")
+
+    return whitman_table(sequent)[sequent] is not None
+
+# The premises each rule needs for a conclusion α ⟹  β, or None if the rule does not
+# apply to it: the calculus as check_proof sees it.
+PREMISES = {
+    "A": lambda alpha, beta: () if is_atom(alpha) and alpha == beta else None,
+    "∧L1": lambda alpha, beta: ((alpha.left, beta),) if is_conjunction(alpha) else None,
+    "∧L2": lambda alpha, beta: ((alpha.right, beta),) if is_conjunction(alpha) else None,
+    "∨L": lambda alpha, beta: ((alpha.left, beta), (alpha.right, beta)) if is_disjunction(alpha) else None,
+    "∧R": lambda alpha, beta: ((alpha, beta.left), (alpha, beta.right)) if is_conjunction(beta) else None,
+    "∨R1": lambda alpha, beta: ((alpha, beta.left),) if is_disjunction(beta) else None,
+    "∨R2": lambda alpha, beta: ((alpha, beta.right),) if is_disjunction(beta) else None,
+}
+
+def check_proof(proof: ProofNode) -> bool:
+    # Whether every node of `proof` is an instance of its rule, in time linear in the
+    # size of the proof. Independent of the search, so it can vet proofs from anywhere.
+    return search.check_proof(proof, PREMISES)
+
+def certificate(proof: ProofNode) -> bytes:
+    # `proof` as one byte per node, its rule's position in PREMISES, in pre-order.
+    return search.certificate(proof, PREMISES)
+
+def replay(sequent: Tuple[Formula, Formula], certificate: bytes) -> ProofNode:
+    # Rebuilds the proof of `sequent` from its certificate, checking every step (ValueError
+    # if one does not apply). The rule codes are only valid for the same PREMISES table.
+    return search.replay(sequent, certificate, PREMISES, ProofNode)
+
+def batch_decomposition(formula: Formula) -> tuple:
+    # How each rule of ll decomposes `formula`, in the format used by batch.py.
+    import batch
 
-def is_derivable(sequent: Tuple[Formula, Formula]) -> bool:
-    return derive_proof(sequent) is not None
-
-def lift_formula_to_latex_string(formula: Formula) -> str:
     if is_atom(formula):
-        return formula.name
+        return formula, batch.NONE, (), batch.NONE, ()
     elif is_conjunction(formula):
-        left = lift_formula_to_latex_string(formula.left)
-        right = lift_formula_to_latex_string(formula.right)
-        return f"({left} \\land {right})"
-    elif is_disjunction(formula):
-        left = lift_formula_to_latex_string(formula.left)
-        right = lift_formula_to_latex_string(formula.right)
-        return f"({left} \\lor {right})"
+        # ∧L needs one conjunct, ∧R needs both
+        return None, batch.ANY, get_conjuncts(formula), batch.BOTH, get_conjuncts(formula)
     else:
-        return str(formula)
-
-def lift_proof_to_bussproofs(proof: ProofNode) -> str:
-    if not proof.premises:
-        if proof.rule != "A":
-            raise ValueError(f"Premises are empty, but rule is not A: {proof.rule}.")
+        # ∨L needs both disjuncts, ∨R needs one
+        return None, batch.BOTH, get_disjuncts(formula), batch.ANY, get_disjuncts(formula)
+
+def decide_many(sequents: List[Tuple[Formula, Formula]]) -> List[bool]:
+    # Decides a whole batch at once over the union of its subformulas (needs numpy).
+    import batch
+
+    return batch.decide_many(sequents, batch_decomposition)
+
+# Whitman's procedure: every premise of a lattice rule pairs an immediate subformula
+# of one side with the other side, so derivability only ever asks about pairs
+# (subformula of α, subformula of β). Filling that table bottom-up decides the
+# sequent in O(|α|·|β|) with no backtracking. It always fills the whole table, so when
+# the search settles a sequent after a few goals it can lose: on workload.alternating
+# at n = 8 (511 subformulas a side) it is about 1.5x slower than search.
+
+def subformulas(formula: Formula) -> List[Formula]:
+    # Distinct subformulas, children before parents.
+    return [store.view(node) for node in subformula_ids(formula.id)]
+
+def subformula_ids(node: int) -> List[int]:
+    # Node ids of the distinct subformulas of `node`, children before parents.
+    order = []
+    seen = set()
+    stack = [node]
+    while stack:
+        current = stack[-1]
+        if current in seen:
+            stack.pop()
+            continue
+        if store.op[current] != formula_store.ATOM:
+            left, right = store.left[current], store.right[current]
+            if left not in seen or right not in seen:
+                stack.append(right)
+                stack.append(left)
+                continue
+        stack.pop()
+        seen.add(current)
+        order.append(current)
+    return order
+
+# Rule of each code in a WhitmanTable; 0 is "not derivable".
+WHITMAN_RULES = (None, "A", "∧L1", "∧L2", "∨L", "∧R", "∨R1", "∨R2")
+
+class WhitmanTable:
+    # The rule code of every (subformula of α, subformula of β), one byte per pair in a
+    # row-major bytearray: row i is the i-th subformula of α, column j the j-th of β.
+    # table[(a, b)] is the rule derive_proof would use for a ⟹  b, or None.
+    __slots__ = ("rows", "columns", "codes")
+
+    def __init__(self, rows: Dict[int, int], columns: Dict[int, int], codes: bytearray):
+        self.rows = rows
+        self.columns = columns
+        self.codes = codes
+
+    def __getitem__(self, pair: Tuple[Formula, Formula]) -> Optional[str]:
+        return WHITMAN_RULES[self.codes[self.rows[pair[0].id] * len(self.columns) + self.columns[pair[1].id]]]
+
+def whitman_table(sequent: Tuple[Formula, Formula]) -> WhitmanTable:
+    # Fills the table row by row straight from the store arrays. Children come before
+    # their parents in both orders, so every premise pair is already decided, and the
+    # rules are tried in the order of `alternatives` (with its signature pruning) so
+    # that the proofs are the ones the search finds.
+    alpha, beta = sequent
+    ops, lefts, rights, sigs = store.op, store.left, store.right, store.sig
+    left_ids = subformula_ids(alpha.id)
+    right_ids = subformula_ids(beta.id)
+    rows = {node: i for i, node in enumerate(left_ids)}
+    columns = {node: j for j, node in enumerate(right_ids)}
+    width = len(right_ids)
+    codes = bytearray(len(left_ids) * width)
+
+    # Per column: opcode, signature and the columns of the two children (or -1).
+    right_ops = [ops[b] for b in right_ids]
+    right_sigs = [sigs[b] for b in right_ids]
+    right_left = [columns[lefts[b]] if ops[b] != formula_store.ATOM else -1 for b in right_ids]
+    right_right = [columns[rights[b]] if ops[b] != formula_store.ATOM else -1 for b in right_ids]
+    columns_range = range(width)
+
+    for a in left_ids:
+        base = rows[a] * width
+        a_op, a_sig = ops[a], sigs[a]
+        if a_op != formula_store.ATOM:
+            first, second = rows[lefts[a]] * width, rows[rights[a]] * width
+        for j in columns_range:
+            # A pair whose signatures are disjoint stays 0 (see shares_atom), so the
+            # premises below need no pruning of their own.
+            if not a_sig & right_sigs[j]:
+                continue
+            b_op = right_ops[j]
+            code = 0
+            if a_op == formula_store.ATOM:
+                if b_op == formula_store.ATOM and a == right_ids[j]:
+                    code = 1
+            elif a_op == formula_store.AND:
+                if codes[first + j]:
+                    code = 2
+                elif codes[second + j]:
+                    code = 3
+            elif codes[first + j] and codes[second + j]:
+                code = 4
+            if not code and b_op != formula_store.ATOM:
+                b_first, b_second = base + right_left[j], base + right_right[j]
+                if b_op == formula_store.AND:
+                    if codes[b_first] and codes[b_second]:
+                        code = 5
+                elif codes[b_first]:
+                    code = 6
+                elif codes[b_second]:
+                    code = 7
+            codes[base + j] = code
+    return WhitmanTable(rows, columns, codes)
+
+def whitman_proof(sequent: Tuple[Formula, Formula], table: Optional[WhitmanTable] = None) -> Optional[ProofNode]:
+    # Rebuilds the proof from a filled table; each pair gets a single shared ProofNode.
+    if table is None:
+        table = whitman_table(sequent)
+    if table[sequent] is None:
+        return None
+
+    nodes = {}
+    stack = [sequent]
+    while stack:
+        pair = stack[-1]
+        if pair in nodes:
+            stack.pop()
+            continue
+
+        rule = table[pair]
+        premises = PREMISES[rule](*pair)
+        missing = [premise for premise in premises if premise not in nodes]
+        if missing:
+            stack.extend(reversed(missing))
+            continue
+
+        stack.pop()
+        nodes[pair] = ProofNode(pair, rule, [nodes[premise] for premise in premises])
+
+    return nodes[sequent]
+
+latex_cache = latex_output.latex_memo("ll latex")
 
-        alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
-        beta_latex = lift_formula_to_latex_string(proof.sequent[1])
+def lift_formula_to_latex_string(formula: Formula) -> str:
+    return latex_output.formula_latex(formula, latex_cache)
+
+# The \RightLabel of each rule, for axioms and for rules with premises.
+AXIOM_LABELS = {
+    "A": "\\RightLabel{$A$}",
+}
+
+RULE_LABELS = {
+    "∧L1": "\\RightLabel{$\\land_{L1}$}",
+    "∧L2": "\\RightLabel{$\\land_{L2}$}",
+    "∨L": "\\RightLabel{$\\lor_{L}$}",
+    "∧R": "\\RightLabel{$\\land_{R}$}",
+    "∨R1": "\\RightLabel{$\\lor_{R1}$}",
+    "∨R2": "\\RightLabel{$\\lor_{R2}$}",
+}
+
+def _leaf_latex(proof: ProofNode) -> str:
+    # An axiom, or a reference to a lemma (see lemmas.py).
+    if lemmas.is_reference(proof):
+        return lemmas.reference_latex(proof, lift_formula_to_latex_string)
+
+    rule_latex = AXIOM_LABELS.get(proof.rule)
+    if rule_latex is None:
+        raise ValueError(f"Premises are empty, but rule is not A: {proof.rule}.")
 
-        return f"\\AxiomC{{}}\n\\RightLabel{{$A$}}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
-    
-    premises_latex = []
-    for premise in proof.premises:
-        premises_latex.append(lift_proof_to_bussproofs(premise))
-    
     alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
     beta_latex = lift_formula_to_latex_string(proof.sequent[1])
 
-    rulestr = ""
-    if proof.rule[0] == "∧":
-        rulestr = f"\\RightLabel{{$\\land_{{{proof.rule[1:]}}}$}}"
-    elif proof.rule[0] == "∨":
-        rulestr = f"\\RightLabel{{$\\lor_{{{proof.rule[1:]}}}$}}"
-    elif proof.rule == "A":
-        rulestr = "\\RightLabel{$A$}"
-    else:
+    return f"\\AxiomC{{}}\n{rule_latex}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
+
+def _rule_latex(proof: ProofNode) -> str:
+    label = RULE_LABELS.get(proof.rule)
+    if label is None:
         raise ValueError(f"Unknown rule: {proof.rule}")
-    
+    return label
+
+def _inference_latex(proof: ProofNode) -> str:
+    alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
+    beta_latex = lift_formula_to_latex_string(proof.sequent[1])
+
     if len(proof.premises) == 1:
-        return f"{premises_latex[0]}\n{rulestr}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
+        return f"\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
     elif len(proof.premises) == 2:
-        return f"{premises_latex[0]}\n{premises_latex[1]}\n{rulestr}\n\\BinaryInfC{{${alpha_latex} \\Rightarrow  {beta_latex}$}}"
+        return f"\\BinaryInfC{{${alpha_latex} \\Rightarrow  {beta_latex}$}}"
     else:
         raise ValueError("More than 2 premises in a proof node, which is not supported in monosequents.")
 
+def iter_proof_to_bussproofs(proof: ProofNode) -> Iterator[str]:
+    # The lines of lift_proof_to_bussproofs one at a time, premises first and without
+    # recursion, so a proof of any depth can be written out as it is rendered.
+    stack = [(proof, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not node.premises:
+            yield _leaf_latex(node)
+        elif not expanded:
+            stack.append((node, True))
+            stack.extend((premise, False) for premise in reversed(node.premises))
+        else:
+            yield _rule_latex(node)
+            yield _inference_latex(node)
+
+def lift_proof_to_bussproofs(proof: ProofNode) -> str:
+    return "\n".join(iter_proof_to_bussproofs(proof))
+
+def iter_object_to_bussproofs(proof: ProofNode) -> Iterator[str]:
+    return latex_output.minipage(iter_proof_to_bussproofs(proof))
+
 def lift_object_to_bussproofs(proof: ProofNode) -> str:
-    proof_latex = lift_proof_to_bussproofs(proof)
-    
-    return f"""\\begin{{minipage}}{{0.3\\linewidth}}
-\\begin{{prooftree}}
-{proof_latex}
-\\end{{prooftree}}
-\\end{{minipage}}
+    return "".join(iter_object_to_bussproofs(proof))
+
+def iter_lemmas_to_bussproofs(proof: ProofNode, threshold: int = lemmas.THRESHOLD,
+                              max_size: Optional[int] = None) -> Iterator[str]:
+    return lemmas.iter_lift(proof, ProofNode, iter_proof_to_bussproofs, threshold, max_size)
 
-"""
+def lift_lemmas_to_bussproofs(proof: ProofNode, threshold: int = lemmas.THRESHOLD,
+                              max_size: Optional[int] = None) -> str:
+    # lift_object_to_bussproofs, with shared subproofs of `threshold` nodes or more and
+    # subproofs of `max_size` nodes or more typeset once, as numbered lemmas.
+    return "".join(iter_lemmas_to_bussproofs(proof, threshold, max_size))
 
 # Helper functions to create the formulas.
 def atom(name: str) -> Atom:
     return Atom(name)
 
+def formula(node: int) -> Formula:
+    # View of a node built directly in `store` (e.g. by the parser).
+    return store.view(node)
+
 def and_formula(left: Formula, right: Formula) -> Compound:
     return Compound(ConnectiveType.AND, left, right)
 
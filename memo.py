@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import sys
+import weakref
+
+# Returned by Memo.get when the key is not cached (None is a valid cached result).
+MISSING = object()
+
+DEFAULT_MAX_ENTRIES = 100_000
+
+@dataclass
+class MemoStats:
+    name: str
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size_bytes: int
+
+    def __str__(self):
+        return f"{self.name}: {self.entries} entries, {self.hits} hits, {self.misses} misses, {self.evictions} evictions"
+
+def shallow_sizeof(key: Hashable, value: Any) -> int:
+    return sys.getsizeof(key) + sys.getsizeof(value)
+
+class Memo:
+    # Bounded LRU table shared by the derive engines of ll, pql, nl and nql.
+    # Entries live for the whole process (across queries) until evicted or cleared.
+    # max_bytes is checked against sizeof(key, value), which by default is a shallow
+    # estimate; leave it as None to bound by entry count only.
+    def __init__(self, name: str, max_entries: Optional[int] = DEFAULT_MAX_ENTRIES,
+                 max_bytes: Optional[int] = None,
+                 sizeof: Callable[[Hashable, Any], int] = shallow_sizeof):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self.size_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        _registry.add(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        value = self._entries.get(key, MISSING)
+        if value is MISSING:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = value
+
+        if self.max_bytes is not None:
+            size = self.sizeof(key, value)
+            self.size_bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+
+        self._evict()
+
+    def _evict(self):
+        while self._entries and (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self.size_bytes > self.max_bytes)
+        ):
+            key, _ = self._entries.popitem(last=False)
+            self.size_bytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+    def resize(self, max_entries: Optional[int] = DEFAULT_MAX_ENTRIES, max_bytes: Optional[int] = None):
+        # Byte accounting only runs while max_bytes is set, so turning it on measures
+        # what is already cached.
+        if max_bytes is not None and self.max_bytes is None:
+            self._sizes = {key: self.sizeof(key, value) for key, value in self._entries.items()}
+            self.size_bytes = sum(self._sizes.values())
+        elif max_bytes is None:
+            self._sizes = {}
+            self.size_bytes = 0
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.size_bytes = 0
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> MemoStats:
+        return MemoStats(self.name, self.hits, self.misses, self.evictions, len(self._entries), self.size_bytes)
+
+_registry: "weakref.WeakSet[Memo]" = weakref.WeakSet()
+
+def clear_all():
+    for memo in _registry:
+        memo.clear()
+
+def all_stats() -> List[MemoStats]:
+    return sorted((memo.stats() for memo in _registry), key=lambda stats: stats.name)
@@ -2,8 +2,9 @@ import ply.lex as lex
 import ply.yacc as yacc
 import os
 import time
-import subprocess
 
+import formula_store
+import latex_output
 import nl
 
 tokens = (
@@ -69,35 +70,35 @@ precedence = (
 
 def p_sequent(p):
     '''sequent : expression SEQ expression'''
-    p[0] = (p[1], p[3])
+    p[0] = (nl.formula(p[1]), nl.formula(p[3]))
 
 def p_expression_atom(p):
     '''expression : ATOM'''
-    p[0] = nl.atom(p[1])
+    p[0] = nl.store.atom(p[1])
 
 def p_expression_bot(p):
     '''expression : BOT'''
-    p[0] = nl.bot()
+    p[0] = nl.store.constant(formula_store.BOT)
 
 def p_expression_top(p):
     '''expression : TOP'''
-    p[0] = nl.top()
+    p[0] = nl.store.constant(formula_store.TOP)
 
 def p_expression_and(p):
     '''expression : expression AND expression'''
-    p[0] = nl.and_formula(p[1], p[3])
+    p[0] = nl.store.binary(formula_store.AND, p[1], p[3])
 
 def p_expression_or(p):
     '''expression : expression OR expression'''
-    p[0] = nl.or_formula(p[1], p[3])
+    p[0] = nl.store.binary(formula_store.OR, p[1], p[3])
 
 def p_expression_imp(p):
     '''expression : expression IMP expression'''
-    p[0] = nl.imp_formula(p[1], p[3])
+    p[0] = nl.store.binary(formula_store.IMP, p[1], p[3])
 
 def p_expression_coimp(p):
     '''expression : expression COIMP expression'''
-    p[0] = nl.coimp_formula(p[1], p[3])
+    p[0] = nl.store.binary(formula_store.COIMP, p[1], p[3])
 
 def p_expression_group(p):
     '''expression : LPAREN expression RPAREN'''
@@ -110,9 +111,11 @@ def p_error(p):
 
 
 class Parser:
-    def __init__(self):
+    def __init__(self, write_tables: bool = True):
+        # write_tables=False builds the tables in memory only, without parser.out and
+        # parsetab.py (which the four grammars would overwrite for each other).
         self.lexer = lex.lex()
-        self.parser = yacc.yacc()
+        self.parser = yacc.yacc(debug=write_tables, write_tables=write_tables)
 
     def parse(self, s):
         try:
@@ -134,8 +137,6 @@ class Parser:
     def is_sequent_symbol(self, s):
         return '=>' in s
 
-parser = Parser()
-
 def output_latex(proof, seq):
     if not proof:
         error_out("No proof to output")
@@ -162,58 +163,46 @@ def output_latex(proof, seq):
     + "\\hfill\n\\break\n"*2 + proof_data + "\\hfill\n\\break\n"*2
 
     tex_file = os.path.join(output_dir, f"{ext}.tex")
-    with open(tex_file, 'w') as f:
-        template_data = ""
-        with open(template_dest, 'r') as g:
-            template_data = g.read()
-            final = template_data + proof_data + "\n\\end{document}"
-            f.write(final)
-
-    original_cwd = os.getcwd()
-    try:
-        os.chdir(output_dir)
-        subprocess.run(["pdflatex", ext + ".tex"], check=True)
-        
-        aux_files = [ext + ".aux", ext + ".log", ext + ".out"]
-        for aux_file in aux_files:
-            if os.path.exists(aux_file):
-                os.remove(aux_file)
-                
-    finally:
-        os.chdir(original_cwd)
-    
-    print(f"PDF generated successfully in {output_dir}/" + ext + ".pdf")
-
-
-while True:
-    try:
-        s = input('nl> ')
-    except EOFError:
-        break
-    if not s.strip():
-        continue
-
-    if s.lower() == 'q' or s.lower() == 'quit':
-        ext = input("Nome do ficheiro (sem .tex): ")
-
-        if not ext:
-            ext = "proof"+time.strftime("%Y%m%d_%H%M%S")
-
-        nl.to_latex_weak(context, ext)
-        break
-
-    if not parser.is_sequent_symbol(s):
-        error_out("Input must be a sequent of the form 'A => B'")
-
-    seq = parser.parse_sequent(s)
-
-    proof = nl.derive_proof(seq)
-
-    if proof is not None:
-        print("Sequente derivável!")
-    else:
-        print("Sequente não derivável!")
+    with latex_output.LatexWriter(tex_file, template_dest) as out:
+        out += proof_data
+
+    for pdf in latex_output.build(out):
+        print(f"PDF generated successfully in {pdf}")
+
+
+def main():
+    parser = Parser()
+
+    while True:
+        try:
+            s = input('nl> ')
+        except EOFError:
+            break
+        if not s.strip():
+            continue
+
+        if s.lower() == 'q' or s.lower() == 'quit':
+            ext = input("Nome do ficheiro (sem .tex): ")
+
+            if not ext:
+                ext = "proof"+time.strftime("%Y%m%d_%H%M%S")
+
+            nl.to_latex_weak(context, ext)
+            break
+
+        if not parser.is_sequent_symbol(s):
+            error_out("Input must be a sequent of the form 'A => B'")
+
+        seq = parser.parse_sequent(s)
+
+        proof = nl.derive_proof(seq)
 
-    context.append((proof, seq))
+        if proof is not None:
+            print("Sequente derivável!")
+        else:
+            print("Sequente não derivável!")
 
+        context.append((proof, seq))
 
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 from dataclasses import dataclass
-from typing import Union, Tuple, List, Optional
+from typing import Union, Tuple, List, Optional, Iterator
 from enum import Enum
 import os
-import subprocess
+
+import formula_store
+from formula_store import FormulaView
+import latex_output
+import lemmas
+import memo
+import search
 
 class ConnectiveType(Enum):
     AND = "∧"
@@ -11,41 +17,104 @@ class ConnectiveType(Enum):
     COIMP = "⊂"
     NOT = "~"
 
-@dataclass(frozen=True)
-class Atom:
-    name: str
+# Formulas live in `store`; the classes below are views over its nodes.
+store = formula_store.FormulaStore()
+
+OPCODES = {
+    ConnectiveType.AND: formula_store.AND,
+    ConnectiveType.OR: formula_store.OR,
+    ConnectiveType.IMP: formula_store.IMP,
+    ConnectiveType.COIMP: formula_store.COIMP,
+    ConnectiveType.NOT: formula_store.NOT,
+}
+CONNECTIVES = {opcode: connective for connective, opcode in OPCODES.items()}
+
+class Atom(FormulaView):
+    __slots__ = ()
+    _store = store
+    _fields = ("name",)
+
+    def __new__(cls, name: str):
+        return store.view(store.atom(name))
+
+    @property
+    def name(self) -> str:
+        return store.names[store.left[self._id]]
     
     def __str__(self):
         return self.name
 
-@dataclass(frozen=True)
-class Bot:
+class Bot(FormulaView):
+    __slots__ = ()
+    _store = store
+
+    def __new__(cls):
+        return store.view(store.constant(formula_store.BOT))
+
     def __str__(self):
         return "⊥"
 
-@dataclass(frozen=True)
-class Top:
+class Top(FormulaView):
+    __slots__ = ()
+    _store = store
+
+    def __new__(cls):
+        return store.view(store.constant(formula_store.TOP))
+
     def __str__(self):
         return "⊤"
 
+class UnaryCompound(FormulaView):
+    __slots__ = ()
+    _store = store
+    _fields = ("connective", "operand")
 
-@dataclass(frozen=True)
-class UnaryCompound:
-    connective: ConnectiveType
-    operand: Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top']
+    def __new__(cls, connective: ConnectiveType, operand: Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top']):
+        return store.view(store.unary(OPCODES[connective], operand._id))
+
+    @property
+    def connective(self) -> ConnectiveType:
+        return CONNECTIVES[store.op[self._id]]
+
+    @property
+    def operand(self) -> Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top']:
+        return self._left_view()
 
     def __str__(self):
         return f"{self.connective.value}{self.operand}"
 
-@dataclass(frozen=True)
-class Compound:
-    connective: ConnectiveType
-    left: Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top']
-    right: Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top']
+class Compound(FormulaView):
+    __slots__ = ()
+    _store = store
+    _fields = ("connective", "left", "right")
+
+    def __new__(cls, connective: ConnectiveType, left: Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top'], right: Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top']):
+        return store.view(store.binary(OPCODES[connective], left._id, right._id))
+
+    @property
+    def connective(self) -> ConnectiveType:
+        return CONNECTIVES[store.op[self._id]]
+
+    @property
+    def left(self) -> Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top']:
+        return self._left_view()
+
+    @property
+    def right(self) -> Union['Atom', 'Compound', 'UnaryCompound', 'Bot', 'Top']:
+        return self._right_view()
     
     def __str__(self):
         return f"({self.left} {self.connective.value} {self.right})"
 
+store.register(formula_store.ATOM, Atom)
+store.register(formula_store.BOT, Bot)
+store.register(formula_store.TOP, Top)
+store.register(formula_store.NOT, UnaryCompound)
+store.register(formula_store.AND, Compound)
+store.register(formula_store.OR, Compound)
+store.register(formula_store.IMP, Compound)
+store.register(formula_store.COIMP, Compound)
+
 Formula = Union[Atom, UnaryCompound, Compound, Bot, Top]
 
 @dataclass
@@ -144,7 +213,32 @@ def get_neg_coimp_parts(formula: Formula) -> Tuple[Formula, Formula]:
     alpha, beta = get_coimp_parts(formula.operand)
     return not_formula(alpha), beta
 
-def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext: str):
+def _report_entry(proof: Optional[ProofNode], seq: tuple[Formula, Formula],
+                  lemma_threshold: Optional[int]) -> Iterator[str]:
+    formula_left = lift_formula_to_latex_string(seq[0])
+    formula_right = lift_formula_to_latex_string(seq[1])
+
+    status_text = "Sequente não derivável" if proof is None else "Sequente derivável"
+    yield "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
+    + f"\\text{{{status_text}}}\n" \
+    + "\\hfill\n\\break\n"*2
+
+    if proof is not None:
+        if lemma_threshold is None:
+            yield from iter_object_to_bussproofs(proof)
+        else:
+            yield from iter_lemmas_to_bussproofs(proof, lemma_threshold)
+        yield "\\hfill\n\\break\n"*2
+
+def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext: str,
+                  lemma_threshold: Optional[int] = None, shard_size: Optional[int] = None,
+                  workers: Optional[int] = None, merge: bool = False, precompiled: bool = True,
+                  minimal: bool = False):
+    # With lemma_threshold, shared subproofs of that many nodes are typeset once as lemmas.
+    # With shard_size, the proofs go to documents of that many proofs each, compiled by
+    # up to `workers` pdflatex at once and, with merge, joined into one PDF. precompiled
+    # loads the preamble from a format file dumped once, and minimal uses
+    # minimal.template instead of a.template (see latex_output.py).
     if not ext:
         return False
 
@@ -156,65 +250,26 @@ def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext:
     else:
         os.makedirs(output_dir)
 
-    template_dest = os.path.join(output_dir, "../a.template")
+    template_dest = os.path.join(output_dir, "../minimal.template" if minimal else "../a.template")
     tex_file = os.path.join(output_dir, f"{ext}.tex")
 
-    with open(tex_file, 'w') as f:
-        final = ""
+    # Each proof goes to the file as it is rendered, so only one is ever in memory.
+    with latex_output.LatexWriter(tex_file, template_dest, shard_size) as out:
         for proof, seq in proofs:
-            formula_left = lift_formula_to_latex_string(seq[0])
-            formula_right = lift_formula_to_latex_string(seq[1])
-
-            if proof is None:
-                status_text = "Sequente não derivável"
-                init_data = "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
-                + f"\\text{{{status_text}}}\n" \
-                + "\\hfill\n\\break\n"*2
-
-                proof_data = ""
-            else:
-                status_text = "Sequente derivável"
-                init_data = "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
-                + f"\\text{{{status_text}}}\n" \
-                + "\\hfill\n\\break\n"*2
-
-                proof_data = lift_object_to_bussproofs(proof)
-                proof_data += "\\hfill\n\\break\n"*2
-
+            out += _report_entry(proof, seq, lemma_threshold)
 
-            proof_data = init_data + proof_data
-
-            final += proof_data
-
-
-        with open(template_dest, 'r') as g:
-            template_data = g.read()
-            f.write(template_data + final + "\n\\end{document}")
-
-
-    original_cwd = os.getcwd()
-    try:
-        os.chdir(output_dir)
-        subprocess.run(["pdflatex", ext + ".tex"], check=True)
-        
-        aux_files = [ext + ".aux", ext + ".log", ext + ".out"]
-        for aux_file in aux_files:
-            if os.path.exists(aux_file):
-                os.remove(aux_file)
-                
-    finally:
-        os.chdir(original_cwd)
-    
-    print(f"PDF generated successfully in {output_dir}/" + ext + ".pdf")
+    for pdf in latex_output.build(out, workers, merge, latex_output.FORMAT_DIR if precompiled else None):
+        print(f"PDF generated successfully in {pdf}")
 
 def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: str, assertion: bool, proofs: bool):
     global proof_data
     
-    if assertion:
-        result = is_derivable(sequent)
-        assert result == expected, f"{test_str}"
-    
     if expected and proofs:
+        # Only build the proof when it is going to be rendered; the search then
+        # doubles as the assertion.
+        proof = derive_proof(sequent)
+        if assertion:
+            assert (proof is not None) == expected, f"{test_str}"
 
         status_text = "Sequente derivável"
         formula_left = lift_formula_to_latex_string(sequent[0])
@@ -223,7 +278,11 @@ def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: s
         return ("\\paragraph{" + test_str[:test_str.index(":")+1].replace("failed", "") + " " + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}"  + "\\leavevmode"+"\n\n"+
                       f"\\text{{{status_text}}}\n" +
                       "\\hfill\n\\break\n"*2+ 
-            lift_object_to_bussproofs(derive_proof(sequent)) + "\\hfill\n\\break\n"*2)
+            lift_object_to_bussproofs(proof) + "\\hfill\n\\break\n"*2)
+
+    if assertion:
+        result = is_derivable(sequent)
+        assert result == expected, f"{test_str}"
 
     formula_left = lift_formula_to_latex_string(sequent[0])
     formula_right = lift_formula_to_latex_string(sequent[1])
@@ -239,481 +298,377 @@ def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: s
                     "\\hfill\n\\break\n"*2)
 
 
-cache = {}
-weaks = []
+# The weakening rules make the search graph cyclic; search.py tables it, so proofs and
+# failures alike are kept across queries.
+proof_cache = memo.Memo("nql")
 
-def derive_proof(sequent: Tuple[Formula, Formula]) -> Optional[ProofNode]:
-    global cache, weaks
-    cache = {}
-    weaks = []
-    return derive_proof_inner(sequent)
+def derive_proof(sequent: Tuple[Formula, Formula], stats: bool = False, max_nodes: Optional[int] = None,
+                 deadline: Optional[float] = None, trace: Optional[str] = None) -> Union[Optional[ProofNode], search.Unknown, tuple]:
+    # Options as in search.derive_proof: stats, node and time limits, JSONL trace.
+    return search.derive_proof(sequent, alternatives, proof_cache, ProofNode, stats, max_nodes, deadline, trace)
 
-def derive_proof_inner(sequent: Tuple[Formula, Formula]) -> Optional[ProofNode]:
-    global cache, weaks
+def reconstruct(sequent: Tuple[Formula, Formula], depth: Optional[int] = None) -> Optional[ProofNode]:
+    # Builds the proof from the rules recorded in proof_cache (searching first if
+    # needed), only `depth` levels deep if given.
+    return search.reconstruct(sequent, alternatives, proof_cache, ProofNode, depth)
 
-    if sequent in cache:
-        return cache[sequent]
+# Rules other than the axioms, one generator per rule. Each is only called on sequents
+# whose shapes it was registered for in RULES, so it can take the formulas apart directly.
 
+# Weakening rules
+
+def _we_l(alpha, beta):
+    # we_L: if ⊤ ⟹   β then α ⟹   β
+    yield "we_L", ((TOP, beta),)
+
+def _we_r(alpha, beta):
+    # we_R: if α ⟹   ⊥ then α ⟹   β
+    yield "we_R", ((alpha, BOT),)
+
+def _neg_we_l(alpha, beta):
+    # ~we_L: if ~⊥ ⟹  α then β ⟹  α
+    yield "~we_L", ((NEG_BOT, beta),)
+
+def _neg_we_r(alpha, beta):
+    # ~we_R: if α ⟹  ~⊤ then α ⟹  β
+    yield "~we_R", ((alpha, NEG_TOP),)
+
+#### Left operations!
+def _neg_neg_l(alpha, beta):
+    yield "~~L", ((alpha.operand.operand, beta),)
+
+def _and_l(alpha, beta):
+    yield "∧L1", ((alpha.left, beta),)
+    yield "∧L2", ((alpha.right, beta),)
+
+def _neg_and_l(alpha, beta):
+    a = alpha.operand
+    yield "~∧L", ((not_formula(a.left), beta), (not_formula(a.right), beta))
+
+def _or_l(alpha, beta):
+    yield "∨L", ((alpha.left, beta), (alpha.right, beta))
+
+def _neg_or_l(alpha, beta):
+    a = alpha.operand
+    yield "~∨L1", ((not_formula(a.left), beta),)
+    yield "~∨L2", ((not_formula(a.right), beta),)
+
+def _imp_l(alpha, beta):
+    yield "⊃L", ((TOP, alpha.left), (alpha.right, beta))
+
+def _neg_imp_l(alpha, beta):
+    a = alpha.operand
+    # ~⊃L1: from α ⟹  δ derive ~(α ⊃ β) ⟹  δ
+    yield "~⊃L1", ((a.left, beta),)
+    # ~⊃L2: from ~β ⟹  δ derive ~(α ⊃ β) ⟹  δ
+    yield "~⊃L2", ((not_formula(a.right), beta),)
+
+def _coimp_l(alpha, beta):
+    yield "⊂L", ((alpha.left, alpha.right),)
+
+def _neg_coimp_l(alpha, beta):
+    a = alpha.operand
+    yield "~⊂L", ((not_formula(a.left), beta), (a.right, beta))
+
+#### Right operations
+def _neg_neg_r(alpha, beta):
+    yield "~~R", ((alpha, beta.operand.operand),)
+
+def _and_r(alpha, beta):
+    yield "∧R", ((alpha, beta.left), (alpha, beta.right))
+
+def _neg_and_r(alpha, beta):
+    b = beta.operand
+    yield "~∧R1", ((alpha, not_formula(b.left)),)
+    yield "~∧R2", ((alpha, not_formula(b.right)),)
+
+def _or_r(alpha, beta):
+    yield "∨R1", ((alpha, beta.left),)
+    yield "∨R2", ((alpha, beta.right),)
+
+def _neg_or_r(alpha, beta):
+    b = beta.operand
+    yield "~∨R", ((alpha, not_formula(b.left)), (alpha, not_formula(b.right)))
+
+def _imp_r(alpha, beta):
+    yield "⊃R", ((beta.left, beta.right),)
+
+def _neg_imp_r(alpha, beta):
+    b = beta.operand
+    yield "~⊃R", ((alpha, b.left), (alpha, not_formula(b.right)))
+
+def _coimp_r(alpha, beta):
+    yield "⊂R", ((alpha, beta.left), (beta.right, BOT))
+
+def _neg_coimp_r(alpha, beta):
+    b = beta.operand
+    # ~⊂R1: from α ⟹  ~β₁ derive α ⟹  ~(β₁ ⊂ β₂)
+    yield "~⊂R1", ((alpha, not_formula(b.left)),)
+    # ~⊂R2: from α ⟹  β₂ derive α ⟹  ~(β₁ ⊂ β₂)
+    yield "~⊂R2", ((alpha, b.right),)
+
+#### Order operations
+def _imp_order(alpha, beta):
+    yield "⊃order", ((beta.left, alpha.left), (alpha.right, beta.right))
+
+def _coimp_order(alpha, beta):
+    yield "⊂order", ((alpha.left, beta.left), (beta.right, alpha.right))
+
+_ANY = formula_store.ALL_SHAPES
+_NEG = formula_store.negated
+
+# (left shapes, right shapes, rule) in the order derive_proof tries them.
+RULES = search.dispatch_table([
+    (_ANY - {formula_store.TOP}, _ANY, _we_l),
+    (_ANY, _ANY - {formula_store.BOT}, _we_r),
+    (_ANY - {_NEG(formula_store.BOT)}, _ANY, _neg_we_l),
+    (_ANY, _ANY - {_NEG(formula_store.TOP)}, _neg_we_r),
+
+    ({_NEG(formula_store.NOT)}, _ANY, _neg_neg_l),
+    ({formula_store.AND}, _ANY, _and_l),
+    ({_NEG(formula_store.AND)}, _ANY, _neg_and_l),
+    ({formula_store.OR}, _ANY, _or_l),
+    ({_NEG(formula_store.OR)}, _ANY, _neg_or_l),
+    ({formula_store.IMP}, _ANY, _imp_l),
+    ({_NEG(formula_store.IMP)}, _ANY, _neg_imp_l),
+    ({formula_store.COIMP}, {formula_store.BOT}, _coimp_l),
+    ({_NEG(formula_store.COIMP)}, _ANY, _neg_coimp_l),
+
+    (_ANY, {_NEG(formula_store.NOT)}, _neg_neg_r),
+    (_ANY, {formula_store.AND}, _and_r),
+    (_ANY, {_NEG(formula_store.AND)}, _neg_and_r),
+    (_ANY, {formula_store.OR}, _or_r),
+    (_ANY, {_NEG(formula_store.OR)}, _neg_or_r),
+    ({formula_store.TOP}, {formula_store.IMP}, _imp_r),
+    (_ANY, {_NEG(formula_store.IMP)}, _neg_imp_r),
+    (_ANY, {formula_store.COIMP}, _coimp_r),
+    (_ANY, {_NEG(formula_store.COIMP)}, _neg_coimp_r),
+
+    ({formula_store.IMP}, {formula_store.IMP}, _imp_order),
+    ({formula_store.COIMP}, {formula_store.COIMP}, _coimp_order),
+], formula_store.SHAPES)
+
+def alternatives(sequent: Tuple[Formula, Formula]) -> Iterator[Tuple[str, tuple]]:
     alpha, beta = sequent
-    
+
     # A (Axiom)
     if is_atom(alpha) and is_atom(beta) and alpha.name == beta.name:
-        result = ProofNode(sequent, "A", [])
-        cache[sequent] = result
-        return result
+        yield "A", ()
 
     # ~A (Axiom)
     if is_neg_atom(alpha) and is_neg_atom(beta) and alpha == beta:
-        result = ProofNode(sequent, "~A", [])
-        cache[sequent] = result
-        return result
-    
+        yield "~A", ()
+
     # ⊥ rule: ⊥ ⟹   α
     if is_bot(alpha):
-        result = ProofNode(sequent, "⊥", [])
-        cache[sequent] = result
-        return result
+        yield "⊥", ()
 
     # ~⊥ rule: α ⟹  ~⊥
     if is_neg_bot(beta):
-        result = ProofNode(sequent, "~⊥", [])
-        cache[sequent] = result
-        return result
-    
+        yield "~⊥", ()
+
     # ⊤ rule: α ⟹   ⊤
     if is_top(beta):
-        result = ProofNode(sequent, "⊤", [])
-        cache[sequent] = result
-        return result
+        yield "⊤", ()
 
     # ~⊤ rule: ~⊤ ⟹  α
     if is_neg_top(alpha):
-        result = ProofNode(sequent, "~⊤", [])
-        cache[sequent] = result
-        return result
-
-    # Weakening rules
+        yield "~⊤", ()
+
+    for rule in RULES[store.shape(alpha._id) * formula_store.SHAPES + store.shape(beta._id)]:
+        yield from rule(alpha, beta)
+
+def is_derivable(sequent: Tuple[Formula, Formula], max_nodes: Optional[int] = None,
+                 deadline: Optional[float] = None, trace: Optional[str] = None) -> Union[bool, search.Unknown]:
+    return search.is_derivable(sequent, alternatives, proof_cache, max_nodes, deadline, trace)
+
+# The premises each rule needs for a conclusion α ⟹  β, or None if the rule does not
+# apply to it: the calculus as check_proof sees it.
+PREMISES = {
+    "A": lambda alpha, beta: () if is_atom(alpha) and alpha == beta else None,
+    "⊥": lambda alpha, beta: () if is_bot(alpha) else None,
+    "⊤": lambda alpha, beta: () if is_top(beta) else None,
+    "we_L": lambda alpha, beta: ((TOP, beta),) if not is_top(alpha) else None,
+    "we_R": lambda alpha, beta: ((alpha, BOT),) if not is_bot(beta) else None,
+    "~A": lambda alpha, beta: () if is_neg_atom(alpha) and alpha == beta else None,
+    "~⊥": lambda alpha, beta: () if is_neg_bot(beta) else None,
+    "~⊤": lambda alpha, beta: () if is_neg_top(alpha) else None,
+    "~we_L": lambda alpha, beta: ((NEG_BOT, beta),) if not is_neg_bot(alpha) else None,
+    "~we_R": lambda alpha, beta: ((alpha, NEG_TOP),) if not is_neg_top(beta) else None,
+
+    "∧L1": lambda alpha, beta: ((alpha.left, beta),) if is_conjunction(alpha) else None,
+    "∧L2": lambda alpha, beta: ((alpha.right, beta),) if is_conjunction(alpha) else None,
+    "∨L": lambda alpha, beta: ((alpha.left, beta), (alpha.right, beta)) if is_disjunction(alpha) else None,
+    "⊃L": lambda alpha, beta: ((TOP, alpha.left), (alpha.right, beta)) if is_imp(alpha) else None,
+    "⊂L": lambda alpha, beta: ((alpha.left, alpha.right),) if is_coimp(alpha) and is_bot(beta) else None,
+    "~~L": lambda alpha, beta: ((alpha.operand.operand, beta),) if is_double_negation(alpha) else None,
+    "~∧L": lambda alpha, beta: ((not_formula(alpha.operand.left), beta), (not_formula(alpha.operand.right), beta))
+        if is_neg_conjunction(alpha) else None,
+    "~∨L1": lambda alpha, beta: ((not_formula(alpha.operand.left), beta),) if is_neg_disjunction(alpha) else None,
+    "~∨L2": lambda alpha, beta: ((not_formula(alpha.operand.right), beta),) if is_neg_disjunction(alpha) else None,
+    "~⊃L1": lambda alpha, beta: ((alpha.operand.left, beta),) if is_neg_imp(alpha) else None,
+    "~⊃L2": lambda alpha, beta: ((not_formula(alpha.operand.right), beta),) if is_neg_imp(alpha) else None,
+    "~⊂L": lambda alpha, beta: ((not_formula(alpha.operand.left), beta), (alpha.operand.right, beta))
+        if is_neg_coimp(alpha) else None,
+
+    "∧R": lambda alpha, beta: ((alpha, beta.left), (alpha, beta.right)) if is_conjunction(beta) else None,
+    "∨R1": lambda alpha, beta: ((alpha, beta.left),) if is_disjunction(beta) else None,
+    "∨R2": lambda alpha, beta: ((alpha, beta.right),) if is_disjunction(beta) else None,
+    "⊃R": lambda alpha, beta: ((beta.left, beta.right),) if is_top(alpha) and is_imp(beta) else None,
+    "⊂R": lambda alpha, beta: ((alpha, beta.left), (beta.right, BOT)) if is_coimp(beta) else None,
+    "~~R": lambda alpha, beta: ((alpha, beta.operand.operand),) if is_double_negation(beta) else None,
+    "~∧R1": lambda alpha, beta: ((alpha, not_formula(beta.operand.left)),) if is_neg_conjunction(beta) else None,
+    "~∧R2": lambda alpha, beta: ((alpha, not_formula(beta.operand.right)),) if is_neg_conjunction(beta) else None,
+    "~∨R": lambda alpha, beta: ((alpha, not_formula(beta.operand.left)), (alpha, not_formula(beta.operand.right)))
+        if is_neg_disjunction(beta) else None,
+    "~⊃R": lambda alpha, beta: ((alpha, beta.operand.left), (alpha, not_formula(beta.operand.right)))
+        if is_neg_imp(beta) else None,
+    "~⊂R1": lambda alpha, beta: ((alpha, not_formula(beta.operand.left)),) if is_neg_coimp(beta) else None,
+    "~⊂R2": lambda alpha, beta: ((alpha, beta.operand.right),) if is_neg_coimp(beta) else None,
+
+    "⊃order": lambda alpha, beta: ((beta.left, alpha.left), (alpha.right, beta.right))
+        if is_imp(alpha) and is_imp(beta) else None,
+    "⊂order": lambda alpha, beta: ((alpha.left, beta.left), (beta.right, alpha.right))
+        if is_coimp(alpha) and is_coimp(beta) else None,
+}
+
+def check_proof(proof: ProofNode) -> bool:
+    # Whether every node of `proof` is an instance of its rule, in time linear in the
+    # size of the proof. Independent of the search, so it can vet proofs from anywhere.
+    return search.check_proof(proof, PREMISES)
+
+def certificate(proof: ProofNode) -> bytes:
+    # `proof` as one byte per node, its rule's position in PREMISES, in pre-order.
+    return search.certificate(proof, PREMISES)
+
+def replay(sequent: Tuple[Formula, Formula], certificate: bytes) -> ProofNode:
+    # Rebuilds the proof of `sequent` from its certificate, checking every step (ValueError
+    # if one does not apply). The rule codes are only valid for the same PREMISES table.
+    return search.replay(sequent, certificate, PREMISES, ProofNode)
+
+latex_cache = latex_output.latex_memo("nql latex")
 
-    # we_L: if ⊤ ⟹   β then α ⟹   β
-    if not is_top(alpha) and weaks.count(not_formula(Bot())) <= 2:
-        weaks.append(Top())
-        top_to_beta = derive_proof_inner((Top(), beta))
-        if top_to_beta:
-            result = ProofNode(sequent, "we_L", [top_to_beta])
-            cache[sequent] = result
-            return result
-    
-    # we_R: if α ⟹   ⊥ then α ⟹   β
-    if not is_bot(beta) and weaks.count(not_formula(Top())) <= 2:
-        weaks.append(Bot())
-        alpha_to_bot = derive_proof_inner((alpha, Bot()))
-        if alpha_to_bot:
-            result = ProofNode(sequent, "we_R", [alpha_to_bot])
-            cache[sequent] = result
-            return result
+def lift_formula_to_latex_string(formula: Formula) -> str:
+    return latex_output.formula_latex(formula, latex_cache)
+
+# The \RightLabel of each rule, for axioms and for rules with premises.
+AXIOM_LABELS = {
+    "A": "\\RightLabel{$A$}",
+    "~A": "\\RightLabel{$\\sim A$}",
+    "⊥": "\\RightLabel{$\\bot$}",
+    "~⊥": "\\RightLabel{$\\sim\\bot$}",
+    "⊤": "\\RightLabel{$\\top$}",
+    "~⊤": "\\RightLabel{$\\sim\\top$}",
+}
+
+RULE_LABELS = {
+    "we_L": "\\RightLabel{$we_L$}",
+    "we_R": "\\RightLabel{$we_R$}",
+    "~we_L": "\\RightLabel{$\\sim we_L$}",
+    "~we_R": "\\RightLabel{$\\sim we_R$}",
+    "∧L1": "\\RightLabel{$\\land_{L1}$}",
+    "∧L2": "\\RightLabel{$\\land_{L2}$}",
+    "∨L": "\\RightLabel{$\\lor_L$}",
+    "⊃L": "\\RightLabel{$\\supset_L$}",
+    "⊂L": "\\RightLabel{$\\subset_L$}",
+    "~~L": "\\RightLabel{$\\sim \\sim_{L}$}",
+    "~∧L": "\\RightLabel{$\\sim \\land_{L}$}",
+    "~∨L1": "\\RightLabel{$\\sim \\lor_{L1}$}",
+    "~∨L2": "\\RightLabel{$\\sim \\lor_{L2}$}",
+    "~⊃L1": "\\RightLabel{$\\sim \\supset_{1}$}",
+    "~⊃L2": "\\RightLabel{$\\sim \\supset_{2}$}",
+    "~⊂L": "\\RightLabel{$\\sim\\subset_{L}$}",
+    "∧R": "\\RightLabel{$\\land_R$}",
+    "∨R1": "\\RightLabel{$\\lor_{R1}$}",
+    "∨R2": "\\RightLabel{$\\lor_{R2}$}",
+    "⊃R": "\\RightLabel{$\\supset_R$}",
+    "⊂R": "\\RightLabel{$\\subset_R$}",
+    "~~R": "\\RightLabel{$\\sim \\sim_{R}$}",
+    "~∧R1": "\\RightLabel{$\\sim \\land_{R1}$}",
+    "~∧R2": "\\RightLabel{$\\sim \\land_{R2}$}",
+    "~∨R": "\\RightLabel{$\\sim \\lor_{R}$}",
+    "~⊃R": "\\RightLabel{$\\sim \\supset_R$}",
+    "~⊂R1": "\\RightLabel{$\\sim\\subset_{1}$}",
+    "~⊂R2": "\\RightLabel{$\\sim\\subset_{2}$}",
+    "⊃order": "\\RightLabel{$\\supset_{order}$}",
+    "⊂order": "\\RightLabel{$\\subset_{order}$}",
+}
+
+def _leaf_latex(proof: ProofNode) -> str:
+    # An axiom, or a reference to a lemma (see lemmas.py).
+    if lemmas.is_reference(proof):
+        return lemmas.reference_latex(proof, lift_formula_to_latex_string)
+
+    rule_latex = AXIOM_LABELS.get(proof.rule)
+    if rule_latex is None:
+        raise ValueError(f"You can't have premises empty for the rule {proof.rule}.")
 
-    # ~we_L: if ~⊥ ⟹  α then β ⟹  α
-    if not is_neg_bot(alpha) and weaks.count(Top()) <= 2:
-        weaks.append(not_formula(Bot()))
-        neg_bot_to_alpha = derive_proof_inner((not_formula(Bot()), beta))
-        if neg_bot_to_alpha:
-            result = ProofNode(sequent, "~we_L", [neg_bot_to_alpha])
-            cache[sequent] = result
-            return result
+    alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
+    beta_latex = lift_formula_to_latex_string(proof.sequent[1])
 
-    # ~we_R: if α ⟹  ~⊤ then α ⟹  β
-    if not is_neg_top(beta) and weaks.count(Bot()) <= 2:
-        weaks.append(not_formula(Top()))
-        alpha_to_neg_top = derive_proof_inner((alpha, not_formula(Top())))
-        if alpha_to_neg_top:
-            result = ProofNode(sequent, "~we_R", [alpha_to_neg_top])
-            cache[sequent] = result
-            return result
-
-    #### Left operations!
-    # ~~L
-    if is_double_negation(alpha):
-        sub_proof = derive_proof_inner((get_neg(get_neg(alpha)), beta))
-        if sub_proof:
-            result = ProofNode(sequent, "~~L", [sub_proof])
-            cache[sequent] = result
-            return result
-
-    # ∧L
-    if is_conjunction(alpha):
-        for i, ai in enumerate(get_conjuncts(alpha)):
-            sub_proof = derive_proof_inner((ai, beta))
-            if sub_proof:
-                result = ProofNode(sequent, f"∧L{i+1}", [sub_proof])
-                cache[sequent] = result
-                return result
-
-    # ~∧L
-    if is_neg_conjunction(alpha):
-        a1, a2 = get_neg_conjuncts(alpha)
-        sub_proof_l = derive_proof_inner((a1, beta))
-        sub_proof_r = derive_proof_inner((a2, beta))
-        
-        if sub_proof_l and sub_proof_r:
-            result = ProofNode(sequent, "~∧L", [sub_proof_l, sub_proof_r])
-            cache[sequent] = result
-            return result
-
-    # ∨L
-    if is_disjunction(alpha):
-        a1, a2 = get_disjuncts(alpha)
-        sub_proof_l = derive_proof_inner((a1, beta))
-        sub_proof_r = derive_proof_inner((a2, beta))
-        
-        if sub_proof_l and sub_proof_r:
-            result = ProofNode(sequent, "∨L", [sub_proof_l, sub_proof_r])
-            cache[sequent] = result
-            return result
-
-    # ~∨L
-    if is_neg_disjunction(alpha):
-        for i, ai in enumerate(get_neg_disjuncts(alpha)):
-            sub_proof = derive_proof_inner((ai, beta))
-            if sub_proof:
-                result = ProofNode(sequent, f"~∨L{i+1}", [sub_proof])
-                cache[sequent] = result
-                return result
-
-    # ⊃L
-    if is_imp(alpha):
-        a1, a2 = get_imp_parts(alpha)
-        top_to_a1 = derive_proof_inner((Top(), a1))
-        a2_to_beta = derive_proof_inner((a2, beta))
-        
-        if top_to_a1 and a2_to_beta:
-            result = ProofNode(sequent, "⊃L", [top_to_a1, a2_to_beta])
-            cache[sequent] = result
-            return result
-
-    # ~⊃L
-    if is_neg_imp(alpha):
-        a1, neg_a2 = get_neg_imp_parts(alpha)
-        
-        # Try ~⊃L1: from α ⟹  δ derive ~(α ⊃ β) ⟹  δ
-        sub_proof = derive_proof_inner((a1, beta))
-        if sub_proof:
-            result = ProofNode(sequent, "~⊃L1", [sub_proof])
-            cache[sequent] = result
-            return result
-            
-        # Try ~⊃L2: from ~β ⟹  δ derive ~(α ⊃ β) ⟹  δ
-        sub_proof = derive_proof_inner((neg_a2, beta))
-        if sub_proof:
-            result = ProofNode(sequent, "~⊃L2", [sub_proof])
-            cache[sequent] = result
-            return result
-
-    # ⊂L
-    if is_coimp(alpha) and is_bot(beta):
-        a1, a2 = get_coimp_parts(alpha)
-        a1_to_a2 = derive_proof_inner((a1, a2))
-        if a1_to_a2:
-            result = ProofNode(sequent, "⊂L", [a1_to_a2])
-            cache[sequent] = result
-            return result
-
-    # ~⊂L
-    if is_neg_coimp(alpha):
-        neg_a1, a2 = get_neg_coimp_parts(alpha)
-        sub_proof_l = derive_proof_inner((neg_a1, beta))
-        sub_proof_r = derive_proof_inner((a2, beta))
-        
-        if sub_proof_l and sub_proof_r:
-            result = ProofNode(sequent, "~⊂L", [sub_proof_l, sub_proof_r])
-            cache[sequent] = result
-            return result
-
-    #### Right operations
-    # ~~R
-    if is_double_negation(beta):
-        sub_proof = derive_proof_inner((alpha, get_neg(get_neg(beta))))
-        if sub_proof:
-            result = ProofNode(sequent, "~~R", [sub_proof])
-            cache[sequent] = result
-            return result
-
-    # ∧R
-    if is_conjunction(beta):
-        b1, b2 = get_conjuncts(beta)
-        sub_proof_l = derive_proof_inner((alpha, b1))
-        sub_proof_r = derive_proof_inner((alpha, b2))
-        
-        if sub_proof_l and sub_proof_r:
-            result = ProofNode(sequent, "∧R", [sub_proof_l, sub_proof_r])
-            cache[sequent] = result
-            return result
-
-    # ~∧R
-    if is_neg_conjunction(beta):
-        for i, bi in enumerate(get_neg_conjuncts(beta)):
-            sub_proof = derive_proof_inner((alpha, bi))
-            if sub_proof:
-                result = ProofNode(sequent, f"~∧R{i+1}", [sub_proof])
-                cache[sequent] = result
-                return result
-
-    # ∨R
-    if is_disjunction(beta):
-        for i, bi in enumerate(get_disjuncts(beta)):
-            sub_proof = derive_proof_inner((alpha, bi))
-            if sub_proof:
-                result = ProofNode(sequent, f"∨R{i+1}", [sub_proof])
-                cache[sequent] = result
-                return result
-    
-    # ~∨R
-    if is_neg_disjunction(beta):
-        b1, b2 = get_neg_disjuncts(beta)
-        sub_proof_l = derive_proof_inner((alpha, b1))
-        sub_proof_r = derive_proof_inner((alpha, b2))
-
-        if sub_proof_l and sub_proof_r:
-            result = ProofNode(sequent, "~∨R", [sub_proof_l, sub_proof_r])
-            cache[sequent] = result
-            return result
-
-    # ⊃R
-    if is_imp(beta) and is_top(alpha):
-        b1, b2 = get_imp_parts(beta)
-        b1_to_b2 = derive_proof_inner((b1, b2))
-        if b1_to_b2:
-            result = ProofNode(sequent, "⊃R", [b1_to_b2])
-            cache[sequent] = result
-            return result
-
-    # ~⊃R
-    if is_neg_imp(beta):
-        b1, neg_b2 = get_neg_imp_parts(beta)
-        alpha_to_b1 = derive_proof_inner((alpha, b1))
-        alpha_to_neg_b2 = derive_proof_inner((alpha, neg_b2))
-        
-        if alpha_to_b1 and alpha_to_neg_b2:
-            result = ProofNode(sequent, "~⊃R", [alpha_to_b1, alpha_to_neg_b2])
-            cache[sequent] = result
-            return result
-
-    # ⊂R
-    if is_coimp(beta):
-        b1, b2 = get_coimp_parts(beta)
-        alpha_to_b1 = derive_proof_inner((alpha, b1))
-        b2_to_bot = derive_proof_inner((b2, Bot()))
-        
-        if alpha_to_b1 and b2_to_bot:
-            result = ProofNode(sequent, "⊂R", [alpha_to_b1, b2_to_bot])
-            cache[sequent] = result
-            return result
-
-    # ~⊂R
-    if is_neg_coimp(beta):
-        neg_b1, b2 = get_neg_coimp_parts(beta)
-        
-        # Try ~⊂R1: from α ⟹  ~β₁ derive α ⟹  ~(β₁ ⊂ β₂)
-        sub_proof = derive_proof_inner((alpha, neg_b1))
-        if sub_proof:
-            result = ProofNode(sequent, "~⊂R1", [sub_proof])
-            cache[sequent] = result
-            return result
-            
-        # Try ~⊂R2: from α ⟹  β₂ derive α ⟹  ~(β₁ ⊂ β₂)
-        sub_proof = derive_proof_inner((alpha, b2))
-        if sub_proof:
-            result = ProofNode(sequent, "~⊂R2", [sub_proof])
-            cache[sequent] = result
-            return result
-
-    #### Order operations
-    # ⊃_order
-    if is_imp(alpha) and is_imp(beta):
-        a1, a2 = get_imp_parts(alpha)
-        b1, b2 = get_imp_parts(beta)
-        
-        b1_to_a1 = derive_proof_inner((b1, a1))
-        a2_to_b2 = derive_proof_inner((a2, b2))
-        
-        if b1_to_a1 and a2_to_b2:
-            result = ProofNode(sequent, "⊃order", [b1_to_a1, a2_to_b2])
-            cache[sequent] = result
-            return result
-
-    # ⊂_order
-    if is_coimp(alpha) and is_coimp(beta):
-        a1, a2 = get_coimp_parts(alpha)
-        b1, b2 = get_coimp_parts(beta)
-        
-        a1_to_b1 = derive_proof_inner((a1, b1))
-        b2_to_a2 = derive_proof_inner((b2, a2))
-        
-        if a1_to_b1 and b2_to_a2:
-            result = ProofNode(sequent, "⊂order", [a1_to_b1, b2_to_a2])
-            cache[sequent] = result
-            return result
-
-    cache[sequent] = None
-    return None
-
-def is_derivable(sequent: Tuple[Formula, Formula]) -> bool:
-    return derive_proof(sequent) is not None
+    return f"\\AxiomC{{}}\n{rule_latex}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
 
-def lift_formula_to_latex_string(formula: Formula) -> str:
-    if is_atom(formula):
-        return formula.name
-    elif is_bot(formula):
-        return "\\bot"
-    elif is_top(formula):
-        return "\\top"
-    elif is_neg_atom(formula):
-        return f"\\sim {formula.operand.name}"
-    elif is_neg_bot(formula):
-        return "\\sim \\bot"
-    elif is_neg_top(formula):
-        return "\\sim \\top"
-    elif is_neg_conjunction(formula):
-        left, right = get_conjuncts(formula.operand)
-        return f"\\sim ({lift_formula_to_latex_string(left)} \\land {lift_formula_to_latex_string(right)})"
-    elif is_neg_disjunction(formula):
-        left, right = get_disjuncts(formula.operand)
-        return f"\\sim ({lift_formula_to_latex_string(left)} \\lor {lift_formula_to_latex_string(right)})"
-    elif is_neg_imp(formula):
-        left, right = get_imp_parts(formula.operand)
-        return f"\\sim ({lift_formula_to_latex_string(left)} \\supset {lift_formula_to_latex_string(right)})"
-    elif is_neg_coimp(formula):
-        left, right = get_coimp_parts(formula.operand)
-        return f"\\sim ({lift_formula_to_latex_string(left)} \\subset {lift_formula_to_latex_string(right)})"
-    elif is_double_negation(formula):
-        return f"\\sim \\sim {lift_formula_to_latex_string(get_neg(get_neg(formula)))}"
-    elif is_conjunction(formula):
-        left = lift_formula_to_latex_string(formula.left)
-        right = lift_formula_to_latex_string(formula.right)
-        return f"({left} \\land {right})"
-    elif is_disjunction(formula):
-        left = lift_formula_to_latex_string(formula.left)
-        right = lift_formula_to_latex_string(formula.right)
-        return f"({left} \\lor {right})"
-    elif is_imp(formula):
-        left = lift_formula_to_latex_string(formula.left)
-        right = lift_formula_to_latex_string(formula.right)
-        return f"({left} \\supset {right})"
-    elif is_coimp(formula):
-        left = lift_formula_to_latex_string(formula.left)
-        right = lift_formula_to_latex_string(formula.right)
-        return f"({left} \\subset {right})"
-    else:
-        return str(formula)
+def _rule_latex(proof: ProofNode) -> str:
+    return RULE_LABELS.get(proof.rule) or f"\\RightLabel{{{proof.rule}}}"
 
-def lift_proof_to_bussproofs(proof: ProofNode) -> str:
-    if not proof.premises:
-        alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
-        beta_latex = lift_formula_to_latex_string(proof.sequent[1])
-        
-        rule_latex = ""
-        if proof.rule == "A":
-            rule_latex = "\\RightLabel{$A$}"
-        elif proof.rule == "~A":
-            rule_latex = "\\RightLabel{$\\sim A$}"
-        elif proof.rule == "⊥":
-            rule_latex = "\\RightLabel{$\\bot$}"
-        elif proof.rule == "~⊥":
-            rule_latex = "\\RightLabel{$\\sim\\bot$}"
-        elif proof.rule == "⊤":
-            rule_latex = "\\RightLabel{$\\top$}"
-        elif proof.rule == "~⊤":
-            rule_latex = "\\RightLabel{$\\sim\\top$}"
-        else:
-            raise ValueError(f"You can't have premises empty for the rule {proof.rule}.")
-        
-        return f"\\AxiomC{{}}\n{rule_latex}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
-    
-    premises_latex = []
-    for premise in proof.premises:
-        premises_latex.append(lift_proof_to_bussproofs(premise))
-    
+def _inference_latex(proof: ProofNode) -> str:
     alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
     beta_latex = lift_formula_to_latex_string(proof.sequent[1])
 
-    rulestr = ""
-    if proof.rule == "we_L":
-        rulestr = "\\RightLabel{$we_L$}"
-    elif proof.rule == "we_R":
-        rulestr = "\\RightLabel{$we_R$}"
-    elif proof.rule == "~we_L":
-        rulestr = "\\RightLabel{$\\sim we_L$}"
-    elif proof.rule == "~we_R":
-        rulestr = "\\RightLabel{$\\sim we_R$}"
-    elif proof.rule in ["∧L1", "∧L2"]:
-        rulestr = f"\\RightLabel{{$\\land_{{{proof.rule[1:]}}}$}}"
-    elif proof.rule == "∧R":
-        rulestr = "\\RightLabel{$\\land_R$}"
-    elif proof.rule == "~∧L":
-        rulestr = "\\RightLabel{$\\sim \\land_{L}$}"
-    elif proof.rule in ["~∧R1", "~∧R2"]:
-        rulestr = f"\\RightLabel{{$\\sim \\land_{{{proof.rule[2:]}}}$}}"
-    elif proof.rule == "∨L":
-        rulestr = "\\RightLabel{$\\lor_L$}"
-    elif proof.rule in ["∨R1", "∨R2"]:
-        rulestr = f"\\RightLabel{{$\\lor_{{{proof.rule[1:]}}}$}}"
-    elif proof.rule in ["~∨L1", "~∨L2"]:
-        rulestr = f"\\RightLabel{{$\\sim \\lor_{{{proof.rule[2:]}}}$}}"
-    elif proof.rule == "~∨R":
-        rulestr = "\\RightLabel{$\\sim \\lor_{R}$}"
-    elif proof.rule == "⊃L":
-        rulestr = "\\RightLabel{$\\supset_L$}"
-    elif proof.rule == "⊃R":
-        rulestr = "\\RightLabel{$\\supset_R$}"
-    elif proof.rule in ["~⊃L1", "~⊃L2"]:
-        rulestr = f"\\RightLabel{{$\\sim \\supset_{{{proof.rule[3:]}}}$}}"
-    elif proof.rule == "~⊃R":
-        rulestr = "\\RightLabel{$\\sim \\supset_R$}"
-    elif proof.rule == "⊂L":
-        rulestr = "\\RightLabel{$\\subset_L$}"
-    elif proof.rule == "⊂R":
-        rulestr = "\\RightLabel{$\\subset_R$}"
-    elif proof.rule == "~⊂L":
-        rulestr = "\\RightLabel{$\\sim\\subset_{L}$}"
-    elif proof.rule in ["~⊂R1", "~⊂R2"]:
-        rulestr = f"\\RightLabel{{$\\sim\\subset_{{{proof.rule[3:]}}}$}}"
-    elif proof.rule == "⊃order":
-        rulestr = "\\RightLabel{$\\supset_{order}$}"
-    elif proof.rule == "⊂order":
-        rulestr = "\\RightLabel{$\\subset_{order}$}"
-    elif proof.rule == "~~L":
-        rulestr = "\\RightLabel{$\\sim \\sim_{L}$}"
-    elif proof.rule == "~~R":
-        rulestr = "\\RightLabel{$\\sim \\sim_{R}$}"
-    else:
-        rulestr = f"\\RightLabel{{{proof.rule}}}"
-    
     if len(proof.premises) == 1:
-        return f"{premises_latex[0]}\n{rulestr}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
+        return f"\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
     elif len(proof.premises) == 2:
-        return f"{premises_latex[0]}\n{premises_latex[1]}\n{rulestr}\n\\BinaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
+        return f"\\BinaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
     else:
         raise ValueError("More than 2 premises in a proof node, which is not supported.")
 
+def iter_proof_to_bussproofs(proof: ProofNode) -> Iterator[str]:
+    # The lines of lift_proof_to_bussproofs one at a time, premises first and without
+    # recursion, so a proof of any depth can be written out as it is rendered.
+    stack = [(proof, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not node.premises:
+            yield _leaf_latex(node)
+        elif not expanded:
+            stack.append((node, True))
+            stack.extend((premise, False) for premise in reversed(node.premises))
+        else:
+            yield _rule_latex(node)
+            yield _inference_latex(node)
+
+def lift_proof_to_bussproofs(proof: ProofNode) -> str:
+    return "\n".join(iter_proof_to_bussproofs(proof))
+
+def iter_object_to_bussproofs(proof: ProofNode) -> Iterator[str]:
+    return latex_output.minipage(iter_proof_to_bussproofs(proof))
+
 def lift_object_to_bussproofs(proof: ProofNode) -> str:
-    proof_latex = lift_proof_to_bussproofs(proof)
-    
-    return f"""\\begin{{minipage}}{{0.3\\linewidth}}
-\\begin{{prooftree}}
-{proof_latex}
-\\end{{prooftree}}
-\\end{{minipage}}
+    return "".join(iter_object_to_bussproofs(proof))
 
-"""
+def iter_lemmas_to_bussproofs(proof: ProofNode, threshold: int = lemmas.THRESHOLD,
+                              max_size: Optional[int] = None) -> Iterator[str]:
+    return lemmas.iter_lift(proof, ProofNode, iter_proof_to_bussproofs, threshold, max_size)
+
+def lift_lemmas_to_bussproofs(proof: ProofNode, threshold: int = lemmas.THRESHOLD,
+                              max_size: Optional[int] = None) -> str:
+    # lift_object_to_bussproofs, with shared subproofs of `threshold` nodes or more and
+    # subproofs of `max_size` nodes or more typeset once, as numbered lemmas.
+    return "".join(iter_lemmas_to_bussproofs(proof, threshold, max_size))
 
 # Helper functions to create the formulas.
 def atom(name: str) -> Atom:
     return Atom(name)
 
+def formula(node: int) -> Formula:
+    # View of a node built directly in `store` (e.g. by the parser).
+    return store.view(node)
+
 def bot() -> Bot:
-    return Bot()
+    return BOT
 
 def top() -> Top:
-    return Top()
+    return TOP
 
 def and_formula(left: Formula, right: Formula) -> Compound:
     return Compound(ConnectiveType.AND, left, right)
@@ -730,3 +685,8 @@ def coimp_formula(left: Formula, right: Formula) -> Compound:
 def not_formula(operand: Formula) -> UnaryCompound:
     return UnaryCompound(ConnectiveType.NOT, operand)
 
+# Constants are interned, so these are the only ⊤, ⊥, ~⊤ and ~⊥ objects in the process.
+TOP = Top()
+BOT = Bot()
+NEG_TOP = not_formula(TOP)
+NEG_BOT = not_formula(BOT)
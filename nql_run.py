@@ -4,6 +4,7 @@ import os
 import time
 import subprocess
 
+import formula_store
 import nql
 
 tokens = (
@@ -73,39 +74,39 @@ precedence = (
 
 def p_sequent(p):
     '''sequent : expression SEQ expression'''
-    p[0] = (p[1], p[3])
+    p[0] = (nql.formula(p[1]), nql.formula(p[3]))
 
 def p_expression_atom(p):
     '''expression : ATOM'''
-    p[0] = nql.atom(p[1])
+    p[0] = nql.store.atom(p[1])
 
 def p_expression_bot(p):
     '''expression : BOT'''
-    p[0] = nql.bot()
+    p[0] = nql.store.constant(formula_store.BOT)
 
 def p_expression_top(p):
     '''expression : TOP'''
-    p[0] = nql.top()
+    p[0] = nql.store.constant(formula_store.TOP)
 
 def p_expression_not(p):
     '''expression : NOT expression'''
-    p[0] = nql.not_formula(p[2])
+    p[0] = nql.store.unary(formula_store.NOT, p[2])
 
 def p_expression_and(p):
     '''expression : expression AND expression'''
-    p[0] = nql.and_formula(p[1], p[3])
+    p[0] = nql.store.binary(formula_store.AND, p[1], p[3])
 
 def p_expression_or(p):
     '''expression : expression OR expression'''
-    p[0] = nql.or_formula(p[1], p[3])
+    p[0] = nql.store.binary(formula_store.OR, p[1], p[3])
 
 def p_expression_imp(p):
     '''expression : expression IMP expression'''
-    p[0] = nql.imp_formula(p[1], p[3])
+    p[0] = nql.store.binary(formula_store.IMP, p[1], p[3])
 
 def p_expression_coimp(p):
     '''expression : expression COIMP expression'''
-    p[0] = nql.coimp_formula(p[1], p[3])
+    p[0] = nql.store.binary(formula_store.COIMP, p[1], p[3])
 
 def p_expression_group(p):
     '''expression : LPAREN expression RPAREN'''
@@ -118,9 +119,11 @@ def p_error(p):
 
 
 class Parser:
-    def __init__(self):
+    def __init__(self, write_tables: bool = True):
+        # write_tables=False builds the tables in memory only, without parser.out and
+        # parsetab.py (which the four grammars would overwrite for each other).
         self.lexer = lex.lex()
-        self.parser = yacc.yacc()
+        self.parser = yacc.yacc(debug=write_tables, write_tables=write_tables)
 
     def parse(self, s):
         try:
@@ -142,35 +145,38 @@ class Parser:
     def is_sequent_symbol(self, s):
         return '=>' in s
 
-parser = Parser()
+def main():
+    parser = Parser()
 
-while True:
-    try:
-        s = input('nql> ')
-    except EOFError:
-        break
-    if not s.strip():
-        continue
+    while True:
+        try:
+            s = input('nql> ')
+        except EOFError:
+            break
+        if not s.strip():
+            continue
 
-    if s.lower() == 'q' or s.lower() == 'quit':
-        ext = input("Nome do ficheiro (sem .tex): ")
+        if s.lower() == 'q' or s.lower() == 'quit':
+            ext = input("Nome do ficheiro (sem .tex): ")
 
-        if not ext:
-            ext = "proof"+time.strftime("%Y%m%d_%H%M%S")
+            if not ext:
+                ext = "proof"+time.strftime("%Y%m%d_%H%M%S")
 
-        nql.to_latex_weak(context, ext)
-        break
+            nql.to_latex_weak(context, ext)
+            break
 
-    if not parser.is_sequent_symbol(s):
-        error_out("Input must be a sequent of the form 'A => B'")
+        if not parser.is_sequent_symbol(s):
+            error_out("Input must be a sequent of the form 'A => B'")
 
-    seq = parser.parse_sequent(s)
+        seq = parser.parse_sequent(s)
 
-    proof = nql.derive_proof(seq)
+        proof = nql.derive_proof(seq)
 
-    if proof is not None:
-        print("Sequente derivável!")
-    else:
-        print("Sequente não derivável!")
-    context.append((proof, seq))
+        if proof is not None:
+            print("Sequente derivável!")
+        else:
+            print("Sequente não derivável!")
+        context.append((proof, seq))
 
+if __name__ == "__main__":
+    main()
@@ -1,38 +1,92 @@
 from dataclasses import dataclass
-from typing import Union, Tuple, List, Optional
+from typing import Union, Tuple, List, Optional, Iterator
 from enum import Enum
 import os
-import subprocess
+
+import formula_store
+from formula_store import FormulaView
+import latex_output
+import lemmas
+import memo
+import search
 
 class ConnectiveType(Enum):
     AND = "∧"
     OR = "∨"
     NOT = "~"
 
-@dataclass(frozen=True)
-class Atom:
-    name: str
+# Formulas live in `store`; the classes below are views over its nodes.
+store = formula_store.FormulaStore()
+
+OPCODES = {
+    ConnectiveType.AND: formula_store.AND,
+    ConnectiveType.OR: formula_store.OR,
+    ConnectiveType.NOT: formula_store.NOT,
+}
+CONNECTIVES = {opcode: connective for connective, opcode in OPCODES.items()}
+
+class Atom(FormulaView):
+    __slots__ = ()
+    _store = store
+    _fields = ("name",)
+
+    def __new__(cls, name: str):
+        return store.view(store.atom(name))
+
+    @property
+    def name(self) -> str:
+        return store.names[store.left[self._id]]
     
     def __str__(self):
         return self.name
 
-@dataclass(frozen=True)
-class UnaryCompound:
-    connective: ConnectiveType
-    operand: Union['Atom', 'BinaryCompound', 'UnaryCompound']
-    
+class UnaryCompound(FormulaView):
+    __slots__ = ()
+    _store = store
+    _fields = ("connective", "operand")
+
+    def __new__(cls, connective: ConnectiveType, operand: Union['Atom', 'BinaryCompound', 'UnaryCompound']):
+        return store.view(store.unary(OPCODES[connective], operand._id))
+
+    @property
+    def connective(self) -> ConnectiveType:
+        return CONNECTIVES[store.op[self._id]]
+
+    @property
+    def operand(self) -> Union['Atom', 'BinaryCompound', 'UnaryCompound']:
+        return self._left_view()
+
     def __str__(self):
         return f"{self.connective.value}{self.operand}"
 
-@dataclass(frozen=True)
-class BinaryCompound:
-    connective: ConnectiveType
-    left: Union['Atom', 'UnaryCompound', 'BinaryCompound']
-    right: Union['Atom', 'UnaryCompound', 'BinaryCompound']
+class BinaryCompound(FormulaView):
+    __slots__ = ()
+    _store = store
+    _fields = ("connective", "left", "right")
+
+    def __new__(cls, connective: ConnectiveType, left: Union['Atom', 'UnaryCompound', 'BinaryCompound'], right: Union['Atom', 'UnaryCompound', 'BinaryCompound']):
+        return store.view(store.binary(OPCODES[connective], left._id, right._id))
+
+    @property
+    def connective(self) -> ConnectiveType:
+        return CONNECTIVES[store.op[self._id]]
+
+    @property
+    def left(self) -> Union['Atom', 'UnaryCompound', 'BinaryCompound']:
+        return self._left_view()
+
+    @property
+    def right(self) -> Union['Atom', 'UnaryCompound', 'BinaryCompound']:
+        return self._right_view()
     
     def __str__(self):
         return f"({self.left} {self.connective.value} {self.right})"
 
+store.register(formula_store.ATOM, Atom)
+store.register(formula_store.NOT, UnaryCompound)
+store.register(formula_store.AND, BinaryCompound)
+store.register(formula_store.OR, BinaryCompound)
+
 Formula = Union[Atom, UnaryCompound, BinaryCompound]
 
 @dataclass
@@ -89,7 +143,32 @@ def get_neg_disjuncts(formula: Formula) -> Tuple[Formula, Formula]:
     assert is_neg_disjunction(formula)
     return not_formula(get_disjuncts(formula.operand)[0]), not_formula(get_disjuncts(formula.operand)[1])
 
-def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext: str):
+def _report_entry(proof: Optional[ProofNode], seq: tuple[Formula, Formula],
+                  lemma_threshold: Optional[int]) -> Iterator[str]:
+    formula_left = lift_formula_to_latex_string(seq[0])
+    formula_right = lift_formula_to_latex_string(seq[1])
+
+    status_text = "Sequente não derivável" if proof is None else "Sequente derivável"
+    yield "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
+    + f"\\text{{{status_text}}}\n" \
+    + "\\hfill\n\\break\n"*2
+
+    if proof is not None:
+        if lemma_threshold is None:
+            yield from iter_object_to_bussproofs(proof)
+        else:
+            yield from iter_lemmas_to_bussproofs(proof, lemma_threshold)
+        yield "\\hfill\n\\break\n"*2
+
+def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext: str,
+                  lemma_threshold: Optional[int] = None, shard_size: Optional[int] = None,
+                  workers: Optional[int] = None, merge: bool = False, precompiled: bool = True,
+                  minimal: bool = False):
+    # With lemma_threshold, shared subproofs of that many nodes are typeset once as lemmas.
+    # With shard_size, the proofs go to documents of that many proofs each, compiled by
+    # up to `workers` pdflatex at once and, with merge, joined into one PDF. precompiled
+    # loads the preamble from a format file dumped once, and minimal uses
+    # minimal.template instead of a.template (see latex_output.py).
     if not ext:
         return False
 
@@ -101,65 +180,26 @@ def to_latex_weak(proofs: List[Tuple[ProofNode, tuple[Formula, Formula]]], ext:
     else:
         os.makedirs(output_dir)
 
-    template_dest = os.path.join(output_dir, "../a.template")
+    template_dest = os.path.join(output_dir, "../minimal.template" if minimal else "../a.template")
     tex_file = os.path.join(output_dir, f"{ext}.tex")
 
-    with open(tex_file, 'w') as f:
-        final = ""
+    # Each proof goes to the file as it is rendered, so only one is ever in memory.
+    with latex_output.LatexWriter(tex_file, template_dest, shard_size) as out:
         for proof, seq in proofs:
-            formula_left = lift_formula_to_latex_string(seq[0])
-            formula_right = lift_formula_to_latex_string(seq[1])
-
-            if proof is None:
-                status_text = "Sequente não derivável"
-                init_data = "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
-                + f"\\text{{{status_text}}}\n" \
-                + "\\hfill\n\\break\n"*2
+            out += _report_entry(proof, seq, lemma_threshold)
 
-                proof_data = ""
-            else:
-                status_text = "Sequente derivável"
-                init_data = "\\paragraph{" + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}" + "\\leavevmode"+"\n\n" \
-                + f"\\text{{{status_text}}}\n" \
-                + "\\hfill\n\\break\n"*2
-
-                proof_data = lift_object_to_bussproofs(proof)
-                proof_data += "\\hfill\n\\break\n"*2
-
-
-            proof_data = init_data + proof_data
-
-            final += proof_data
-
-
-        with open(template_dest, 'r') as g:
-            template_data = g.read()
-            f.write(template_data + final + "\n\\end{document}")
-
-
-    original_cwd = os.getcwd()
-    try:
-        os.chdir(output_dir)
-        subprocess.run(["pdflatex", ext + ".tex"], check=True)
-        
-        aux_files = [ext + ".aux", ext + ".log", ext + ".out"]
-        for aux_file in aux_files:
-            if os.path.exists(aux_file):
-                os.remove(aux_file)
-                
-    finally:
-        os.chdir(original_cwd)
-    
-    print(f"PDF generated successfully in {output_dir}/" + ext + ".pdf")
+    for pdf in latex_output.build(out, workers, merge, latex_output.FORMAT_DIR if precompiled else None):
+        print(f"PDF generated successfully in {pdf}")
 
 def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: str, assertion: bool, proofs: bool):
     global proof_data
     
-    if assertion:
-        result = is_derivable(sequent)
-        assert result == expected, f"{test_str}"
-    
     if expected and proofs:
+        # Only build the proof when it is going to be rendered; the search then
+        # doubles as the assertion.
+        proof = derive_proof(sequent)
+        if assertion:
+            assert (proof is not None) == expected, f"{test_str}"
 
         status_text = "Sequente derivável"
         formula_left = lift_formula_to_latex_string(sequent[0])
@@ -168,7 +208,11 @@ def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: s
         return ("\\paragraph{" + test_str[:test_str.index(":")+1].replace("failed", "") + " " + f"${formula_left} \\Rightarrow  {formula_right}$ \\\\\n""}"  + "\\leavevmode"+"\n\n"+
                       f"\\text{{{status_text}}}\n" +
                       "\\hfill\n\\break\n"*2+ 
-            lift_object_to_bussproofs(derive_proof(sequent)) + "\\hfill\n\\break\n"*2)
+            lift_object_to_bussproofs(proof) + "\\hfill\n\\break\n"*2)
+
+    if assertion:
+        result = is_derivable(sequent)
+        assert result == expected, f"{test_str}"
 
     formula_left = lift_formula_to_latex_string(sequent[0])
     formula_right = lift_formula_to_latex_string(sequent[1])
@@ -184,190 +228,282 @@ def test_derivable(sequent: tuple[Formula, Formula], expected: bool, test_str: s
                     "\\hfill\n\\break\n"*2)
 
 
-def derive_proof(sequent: Tuple[Formula, Formula]) -> Optional[ProofNode]:
+proof_cache = memo.Memo("pql")
+
+def derive_proof(sequent: Tuple[Formula, Formula], stats: bool = False, max_nodes: Optional[int] = None,
+                 deadline: Optional[float] = None, trace: Optional[str] = None) -> Union[Optional[ProofNode], search.Unknown, tuple]:
+    # Options as in search.derive_proof: stats, node and time limits, JSONL trace.
+    return search.derive_proof(sequent, alternatives, proof_cache, ProofNode, stats, max_nodes, deadline, trace)
+
+def reconstruct(sequent: Tuple[Formula, Formula], depth: Optional[int] = None) -> Optional[ProofNode]:
+    # Builds the proof from the rules recorded in proof_cache (searching first if
+    # needed), only `depth` levels deep if given.
+    return search.reconstruct(sequent, alternatives, proof_cache, ProofNode, depth)
+
+def shares_literal(alpha: Formula, beta: Formula) -> bool:
+    # Every derivation ends in axioms p ⟹  p or ~p ⟹  ~p, and each rule only keeps
+    # literals of the negation normal form of its side, so a sequent whose signatures
+    # are disjoint is not derivable.
+    return store.sig[alpha._id] & store.sig[beta._id] != 0
+
+# Rules other than the axioms, one generator per rule. Each is only called on sequents
+# whose shapes it was registered for in RULES, so it can take the formulas apart directly.
+
+#### Left operations!
+def _neg_neg_l(alpha, beta):
+    yield "~~L", ((alpha.operand.operand, beta),)
+
+# One-premise alternatives whose premise cannot reach an axiom are skipped.
+def _and_l(alpha, beta):
+    if shares_literal(alpha.left, beta):
+        yield "∧L1", ((alpha.left, beta),)
+    if shares_literal(alpha.right, beta):
+        yield "∧L2", ((alpha.right, beta),)
+
+def _neg_or_l(alpha, beta):
+    a = alpha.operand
+    for label, ai in (("~∨L1", a.left), ("~∨L2", a.right)):
+        if store.neg_sig[ai._id] & store.sig[beta._id]:
+            yield label, ((not_formula(ai), beta),)
+
+def _or_l(alpha, beta):
+    yield "∨L", ((alpha.left, beta), (alpha.right, beta))
+
+def _neg_and_l(alpha, beta):
+    a = alpha.operand
+    yield "~∧L", ((not_formula(a.left), beta), (not_formula(a.right), beta))
+
+#### Right operations!
+def _neg_neg_r(alpha, beta):
+    yield "~~R", ((alpha, beta.operand.operand),)
+
+def _and_r(alpha, beta):
+    yield "∧R", ((alpha, beta.left), (alpha, beta.right))
+
+def _neg_or_r(alpha, beta):
+    b = beta.operand
+    yield "~∨R", ((alpha, not_formula(b.left)), (alpha, not_formula(b.right)))
+
+def _or_r(alpha, beta):
+    if shares_literal(alpha, beta.left):
+        yield "∨R1", ((alpha, beta.left),)
+    if shares_literal(alpha, beta.right):
+        yield "∨R2", ((alpha, beta.right),)
+
+def _neg_and_r(alpha, beta):
+    b = beta.operand
+    for label, bi in (("~∧R1", b.left), ("~∧R2", b.right)):
+        if store.sig[alpha._id] & store.neg_sig[bi._id]:
+            yield label, ((alpha, not_formula(bi)),)
+
+_ANY = formula_store.ALL_SHAPES
+_NEG = formula_store.negated
+
+# (left shapes, right shapes, rule) in the order derive_proof tries them.
+RULES = search.dispatch_table([
+    ({_NEG(formula_store.NOT)}, _ANY, _neg_neg_l),
+    ({formula_store.AND}, _ANY, _and_l),
+    ({_NEG(formula_store.OR)}, _ANY, _neg_or_l),
+    ({formula_store.OR}, _ANY, _or_l),
+    ({_NEG(formula_store.AND)}, _ANY, _neg_and_l),
+
+    (_ANY, {_NEG(formula_store.NOT)}, _neg_neg_r),
+    (_ANY, {formula_store.AND}, _and_r),
+    (_ANY, {_NEG(formula_store.OR)}, _neg_or_r),
+    (_ANY, {formula_store.OR}, _or_r),
+    (_ANY, {_NEG(formula_store.AND)}, _neg_and_r),
+], formula_store.SHAPES)
+
+def alternatives(sequent: Tuple[Formula, Formula]) -> Iterator[Tuple[str, tuple]]:
     alpha, beta = sequent
-    
+
+    if not shares_literal(alpha, beta):
+        return
+
     # A (Axiom)
     if is_atom(alpha) and is_atom(beta) and alpha == beta:
-        return ProofNode(sequent, "A", [])
+        yield "A", ()
 
     # ~A (Axiom)
     if is_neg_atom(alpha) and is_neg_atom(beta) and alpha == beta:
-        return ProofNode(sequent, "~A", [])
-
-    #### Left operations!
-    # ~~L
-    if is_double_negation(alpha):
-        sub_proof = derive_proof((get_neg(get_neg(alpha)), beta))
-        if sub_proof:
-            return ProofNode(sequent, "~~L", [sub_proof])
-
-    # ∧L
-    if is_conjunction(alpha):
-        for i, ai in enumerate(get_conjuncts(alpha)):
-            sub_proof = derive_proof((ai, beta))
-            if sub_proof:
-                return ProofNode(sequent, f"∧L{i+1}", [sub_proof])
-
-    # ~∨L
-    if is_neg_disjunction(alpha):
-        for i, ai in enumerate(get_neg_disjuncts(alpha)):
-            sub_proof = derive_proof((ai, beta))
-            if sub_proof:
-                return ProofNode(sequent, f"~∨L{i+1}", [sub_proof])
-    
-    # ∨L
-    if is_disjunction(alpha):
-        a1, a2 = get_disjuncts(alpha)
-        sub_proof_l = derive_proof((a1, beta))
-        sub_proof_r = derive_proof((a2, beta))
-        
-        if sub_proof_l and sub_proof_r:
-            return ProofNode(sequent, "∨L", [sub_proof_l, sub_proof_r])
-
-    # ~∧L
-    if is_neg_conjunction(alpha):
-        a1, a2 = get_neg_conjuncts(alpha)
-        sub_proof_l = derive_proof((a1, beta))
-        sub_proof_r = derive_proof((a2, beta))
-        
-        if sub_proof_l and sub_proof_r:
-            return ProofNode(sequent, "~∧L", [sub_proof_l, sub_proof_r])
-
-    #### Right operations!
-    # ~~R
-    if is_double_negation(beta):
-        sub_proof = derive_proof((alpha, get_neg(get_neg(beta))))
-        if sub_proof:
-            return ProofNode(sequent, "~~R", [sub_proof])
-
-    # ∧R
-    if is_conjunction(beta):
-        b1, b2 = get_conjuncts(beta)
-        sub_proof_l = derive_proof((alpha, b1))
-        sub_proof_r = derive_proof((alpha, b2))
-        
-        if sub_proof_l and sub_proof_r:
-            return ProofNode(sequent, "∧R", [sub_proof_l, sub_proof_r])
-
-    # ~∨R
-    if is_neg_disjunction(beta):
-        b1, b2 = get_neg_disjuncts(beta)
-        sub_proof_l = derive_proof((alpha, b1))
-        sub_proof_r = derive_proof((alpha, b2))
-
-        if sub_proof_l and sub_proof_r:
-            return ProofNode(sequent, "~∨R", [sub_proof_l, sub_proof_r])
-
-    # ∨R
-    if is_disjunction(beta):
-        for i, bi in enumerate(get_disjuncts(beta)):
-            sub_proof = derive_proof((alpha, bi))
-            if sub_proof:
-                return ProofNode(sequent, f"∨R{i+1}", [sub_proof])
-
-    # ~∧R
-    if is_neg_conjunction(beta):
-        for i, bi in enumerate(get_neg_conjuncts(beta)):
-            sub_proof = derive_proof((alpha, bi))
-            if sub_proof:
-                return ProofNode(sequent, f"~∧R{i+1}", [sub_proof])
-    
-    return None
-
-def is_derivable(sequent: Tuple[Formula, Formula]) -> bool:
-    return derive_proof(sequent) is not None
-
-def lift_formula_to_latex_string(formula: Formula) -> str:
-    if is_atom(formula):
-        return formula.name
+        yield "~A", ()
+
+    for rule in RULES[store.shape(alpha._id) * formula_store.SHAPES + store.shape(beta._id)]:
+        yield from rule(alpha, beta)
+
+def is_derivable(sequent: Tuple[Formula, Formula], max_nodes: Optional[int] = None,
+                 deadline: Optional[float] = None, trace: Optional[str] = None) -> Union[bool, search.Unknown]:
+    return search.is_derivable(sequent, alternatives, proof_cache, max_nodes, deadline, trace)
+
+# The premises each rule needs for a conclusion α ⟹  β, or None if the rule does not
+# apply to it: the calculus as check_proof sees it.
+PREMISES = {
+    "A": lambda alpha, beta: () if is_atom(alpha) and alpha == beta else None,
+    "~A": lambda alpha, beta: () if is_neg_atom(alpha) and alpha == beta else None,
+
+    "~~L": lambda alpha, beta: ((alpha.operand.operand, beta),) if is_double_negation(alpha) else None,
+    "∧L1": lambda alpha, beta: ((alpha.left, beta),) if is_conjunction(alpha) else None,
+    "∧L2": lambda alpha, beta: ((alpha.right, beta),) if is_conjunction(alpha) else None,
+    "~∨L1": lambda alpha, beta: ((not_formula(alpha.operand.left), beta),) if is_neg_disjunction(alpha) else None,
+    "~∨L2": lambda alpha, beta: ((not_formula(alpha.operand.right), beta),) if is_neg_disjunction(alpha) else None,
+    "∨L": lambda alpha, beta: ((alpha.left, beta), (alpha.right, beta)) if is_disjunction(alpha) else None,
+    "~∧L": lambda alpha, beta: ((not_formula(alpha.operand.left), beta), (not_formula(alpha.operand.right), beta))
+        if is_neg_conjunction(alpha) else None,
+
+    "~~R": lambda alpha, beta: ((alpha, beta.operand.operand),) if is_double_negation(beta) else None,
+    "∧R": lambda alpha, beta: ((alpha, beta.left), (alpha, beta.right)) if is_conjunction(beta) else None,
+    "~∨R": lambda alpha, beta: ((alpha, not_formula(beta.operand.left)), (alpha, not_formula(beta.operand.right)))
+        if is_neg_disjunction(beta) else None,
+    "∨R1": lambda alpha, beta: ((alpha, beta.left),) if is_disjunction(beta) else None,
+    "∨R2": lambda alpha, beta: ((alpha, beta.right),) if is_disjunction(beta) else None,
+    "~∧R1": lambda alpha, beta: ((alpha, not_formula(beta.operand.left)),) if is_neg_conjunction(beta) else None,
+    "~∧R2": lambda alpha, beta: ((alpha, not_formula(beta.operand.right)),) if is_neg_conjunction(beta) else None,
+}
+
+def check_proof(proof: ProofNode) -> bool:
+    # Whether every node of `proof` is an instance of its rule, in time linear in the
+    # size of the proof. Independent of the search, so it can vet proofs from anywhere.
+    return search.check_proof(proof, PREMISES)
+
+def certificate(proof: ProofNode) -> bytes:
+    # `proof` as one byte per node, its rule's position in PREMISES, in pre-order.
+    return search.certificate(proof, PREMISES)
+
+def replay(sequent: Tuple[Formula, Formula], certificate: bytes) -> ProofNode:
+    # Rebuilds the proof of `sequent` from its certificate, checking every step (ValueError
+    # if one does not apply). The rule codes are only valid for the same PREMISES table.
+    return search.replay(sequent, certificate, PREMISES, ProofNode)
+
+def batch_decomposition(formula: Formula) -> tuple:
+    # How each rule of pql decomposes `formula`, in the format used by batch.py.
+    import batch
+
+    if is_atom(formula) or is_neg_atom(formula):
+        return formula, batch.NONE, (), batch.NONE, ()
+    elif is_double_negation(formula):
+        # ~~L and ~~R
+        inner = (get_neg(get_neg(formula)),)
+        return None, batch.ANY, inner, batch.ANY, inner
     elif is_conjunction(formula):
-        left = lift_formula_to_latex_string(formula.left)
-        right = lift_formula_to_latex_string(formula.right)
-        return f"({left} \\land {right})"
+        # ∧L needs one conjunct, ∧R needs both
+        return None, batch.ANY, get_conjuncts(formula), batch.BOTH, get_conjuncts(formula)
     elif is_disjunction(formula):
-        left = lift_formula_to_latex_string(formula.left)
-        right = lift_formula_to_latex_string(formula.right)
-        return f"({left} \\lor {right})"
-    elif is_neg_atom(formula):
-        return f"\\sim {formula.operand.name}"
+        # ∨L needs both disjuncts, ∨R needs one
+        return None, batch.BOTH, get_disjuncts(formula), batch.ANY, get_disjuncts(formula)
     elif is_neg_conjunction(formula):
-        left, right = get_conjuncts(formula.operand)
-        return f"\\sim ({lift_formula_to_latex_string(left)} \\land {lift_formula_to_latex_string(right)})"
-    elif is_neg_disjunction(formula):
-        left, right = get_disjuncts(formula.operand)
-        return f"\\sim ({lift_formula_to_latex_string(left)} \\lor {lift_formula_to_latex_string(right)})"
-    elif is_double_negation(formula):
-        return f"\\sim \\sim {lift_formula_to_latex_string(get_neg(get_neg(formula)))}"
+        # ~∧L needs both negated conjuncts, ~∧R needs one
+        return None, batch.BOTH, get_neg_conjuncts(formula), batch.ANY, get_neg_conjuncts(formula)
     else:
-        return str(formula)
+        # ~∨L needs one negated disjunct, ~∨R needs both
+        return None, batch.ANY, get_neg_disjuncts(formula), batch.BOTH, get_neg_disjuncts(formula)
 
-def lift_proof_to_bussproofs(proof: ProofNode) -> str:
-    if not proof.premises:
-        if proof.rule not in ["A", "~A"]:
-            raise ValueError(f"Premises are empty, but rule is not A: {proof.rule}.")
+def decide_many(sequents: List[Tuple[Formula, Formula]]) -> List[bool]:
+    # Decides a whole batch at once over the union of its subformulas (needs numpy).
+    import batch
 
-        alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
-        beta_latex = lift_formula_to_latex_string(proof.sequent[1])
+    return batch.decide_many(sequents, batch_decomposition)
+
+latex_cache = latex_output.latex_memo("pql latex")
+
+def lift_formula_to_latex_string(formula: Formula) -> str:
+    return latex_output.formula_latex(formula, latex_cache)
+
+# The \RightLabel of each rule, for axioms and for rules with premises.
+AXIOM_LABELS = {
+    "A": "\\RightLabel{$A$}",
+    "~A": "\\RightLabel{$\\sim A$}",
+}
+
+RULE_LABELS = {
+    "~~L": "\\RightLabel{$\\sim \\sim_{L}$}",
+    "∧L1": "\\RightLabel{$\\land_{L1}$}",
+    "∧L2": "\\RightLabel{$\\land_{L2}$}",
+    "~∨L1": "\\RightLabel{$\\sim \\lor_{L1}$}",
+    "~∨L2": "\\RightLabel{$\\sim \\lor_{L2}$}",
+    "∨L": "\\RightLabel{$\\lor_{L}$}",
+    "~∧L": "\\RightLabel{$\\sim \\land_{L}$}",
+    "~~R": "\\RightLabel{$\\sim \\sim_{R}$}",
+    "∧R": "\\RightLabel{$\\land_{R}$}",
+    "~∨R": "\\RightLabel{$\\sim \\lor_{R}$}",
+    "∨R1": "\\RightLabel{$\\lor_{R1}$}",
+    "∨R2": "\\RightLabel{$\\lor_{R2}$}",
+    "~∧R1": "\\RightLabel{$\\sim \\land_{R1}$}",
+    "~∧R2": "\\RightLabel{$\\sim \\land_{R2}$}",
+}
+
+def _leaf_latex(proof: ProofNode) -> str:
+    # An axiom, or a reference to a lemma (see lemmas.py).
+    if lemmas.is_reference(proof):
+        return lemmas.reference_latex(proof, lift_formula_to_latex_string)
+
+    rule_latex = AXIOM_LABELS.get(proof.rule)
+    if rule_latex is None:
+        raise ValueError(f"Premises are empty, but rule is not A: {proof.rule}.")
 
-        return "\\AxiomC{}\n\\RightLabel{$" + ("\\sim " if proof.rule == "~A" else "") \
-        + f"A$}}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
-    
-    premises_latex = []
-    for premise in proof.premises:
-        premises_latex.append(lift_proof_to_bussproofs(premise))
-    
     alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
     beta_latex = lift_formula_to_latex_string(proof.sequent[1])
 
-    rulestr = ""
-    if proof.rule.startswith("∧L"):
-        rulestr = f"\\RightLabel{{$\\land_{{{proof.rule[1:]}}}$}}"
-    elif proof.rule.startswith("∨L"):
-        rulestr = f"\\RightLabel{{$\\lor_{{L}}$}}"
-    elif proof.rule.startswith("∧R"):
-        rulestr = f"\\RightLabel{{$\\land_{{R}}$}}"
-    elif proof.rule.startswith("∨R"):
-        rulestr = f"\\RightLabel{{$\\lor_{{{proof.rule[1:]}}}$}}"
-    elif proof.rule == "~~L":
-        rulestr = "\\RightLabel{$\\sim \\sim_{L}$}"
-    elif proof.rule == "~~R":
-        rulestr = "\\RightLabel{$\\sim \\sim_{R}$}"
-    elif proof.rule == "~∧L":
-        rulestr = "\\RightLabel{$\\sim \\land_{L}$}"
-    elif proof.rule == "~∨R":
-        rulestr = "\\RightLabel{$\\sim \\lor_{R}$}"
-    elif proof.rule.startswith("~∧R"):
-        rulestr = f"\\RightLabel{{$\\sim \\land_{{{proof.rule[2:]}}}$}}"
-    elif proof.rule.startswith("~∨L"):
-        rulestr = f"\\RightLabel{{$\\sim \\lor_{{{proof.rule[2:]}}}$}}"
-    elif proof.rule in ["A", "~A"]:
-        rulestr = f"\\RightLabel{{${proof.rule}$}}"
-    else:
+    return f"\\AxiomC{{}}\n{rule_latex}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
+
+def _rule_latex(proof: ProofNode) -> str:
+    label = RULE_LABELS.get(proof.rule)
+    if label is None:
         raise ValueError(f"Unknown rule: {proof.rule}")
-    
+    return label
+
+def _inference_latex(proof: ProofNode) -> str:
+    alpha_latex = lift_formula_to_latex_string(proof.sequent[0])
+    beta_latex = lift_formula_to_latex_string(proof.sequent[1])
+
     if len(proof.premises) == 1:
-        return f"{premises_latex[0]}\n{rulestr}\n\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
+        return f"\\UnaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
     elif len(proof.premises) == 2:
-        return f"{premises_latex[0]}\n{premises_latex[1]}\n{rulestr}\n\\BinaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
+        return f"\\BinaryInfC{{${alpha_latex} \\Rightarrow {beta_latex}$}}"
     else:
         raise ValueError("More than 2 premises in a proof node, which is not supported in monosequents.")
 
+def iter_proof_to_bussproofs(proof: ProofNode) -> Iterator[str]:
+    # The lines of lift_proof_to_bussproofs one at a time, premises first and without
+    # recursion, so a proof of any depth can be written out as it is rendered.
+    stack = [(proof, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if not node.premises:
+            yield _leaf_latex(node)
+        elif not expanded:
+            stack.append((node, True))
+            stack.extend((premise, False) for premise in reversed(node.premises))
+        else:
+            yield _rule_latex(node)
+            yield _inference_latex(node)
+
+def lift_proof_to_bussproofs(proof: ProofNode) -> str:
+    return "\n".join(iter_proof_to_bussproofs(proof))
+
+def iter_object_to_bussproofs(proof: ProofNode) -> Iterator[str]:
+    return latex_output.minipage(iter_proof_to_bussproofs(proof))
+
 def lift_object_to_bussproofs(proof: ProofNode) -> str:
-    proof_latex = lift_proof_to_bussproofs(proof)
-    
-    return f"""\\begin{{minipage}}{{0.3\\linewidth}}
-\\begin{{prooftree}}
-{proof_latex}
-\\end{{prooftree}}
-\\end{{minipage}}
+    return "".join(iter_object_to_bussproofs(proof))
+
+def iter_lemmas_to_bussproofs(proof: ProofNode, threshold: int = lemmas.THRESHOLD,
+                              max_size: Optional[int] = None) -> Iterator[str]:
+    return lemmas.iter_lift(proof, ProofNode, iter_proof_to_bussproofs, threshold, max_size)
 
-"""
+def lift_lemmas_to_bussproofs(proof: ProofNode, threshold: int = lemmas.THRESHOLD,
+                              max_size: Optional[int] = None) -> str:
+    # lift_object_to_bussproofs, with shared subproofs of `threshold` nodes or more and
+    # subproofs of `max_size` nodes or more typeset once, as numbered lemmas.
+    return "".join(iter_lemmas_to_bussproofs(proof, threshold, max_size))
 
 # Helper functions to create the formulas.
 def atom(name: str) -> Atom:
     return Atom(name)
 
+def formula(node: int) -> Formula:
+    # View of a node built directly in `store` (e.g. by the parser).
+    return store.view(node)
+
 def and_formula(left: Formula, right: Formula) -> BinaryCompound:
     return BinaryCompound(ConnectiveType.AND, left, right)
 
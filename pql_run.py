@@ -2,6 +2,7 @@ import ply.lex as lex
 import ply.yacc as yacc
 import time
 
+import formula_store
 import pql
 
 tokens = (
@@ -58,23 +59,23 @@ precedence = (
 
 def p_sequent(p):
     '''sequent : expression SEQ expression'''
-    p[0] = (p[1], p[3])
+    p[0] = (pql.formula(p[1]), pql.formula(p[3]))
 
 def p_expression_atom(p):
     '''expression : ATOM'''
-    p[0] = pql.atom(p[1])
+    p[0] = pql.store.atom(p[1])
 
 def p_expression_not(p):
     '''expression : NOT expression'''
-    p[0] = pql.not_formula(p[2])
+    p[0] = pql.store.unary(formula_store.NOT, p[2])
 
 def p_expression_and(p):
     '''expression : expression AND expression'''
-    p[0] = pql.and_formula(p[1], p[3])
+    p[0] = pql.store.binary(formula_store.AND, p[1], p[3])
 
 def p_expression_or(p):
     '''expression : expression OR expression'''
-    p[0] = pql.or_formula(p[1], p[3])
+    p[0] = pql.store.binary(formula_store.OR, p[1], p[3])
 
 def p_expression_group(p):
     '''expression : LPAREN expression RPAREN'''
@@ -87,9 +88,11 @@ def p_error(p):
 
 
 class Parser:
-    def __init__(self):
+    def __init__(self, write_tables: bool = True):
+        # write_tables=False builds the tables in memory only, without parser.out and
+        # parsetab.py (which the four grammars would overwrite for each other).
         self.lexer = lex.lex()
-        self.parser = yacc.yacc()
+        self.parser = yacc.yacc(debug=write_tables, write_tables=write_tables)
 
     def parse(self, s):
         try:
@@ -111,37 +114,39 @@ class Parser:
     def is_sequent_symbol(self, s):
         return '=>' in s
 
-parser = Parser()
+def main():
+    parser = Parser()
 
-while True:
-    try:
-        s = input('pql> ')
-    except EOFError:
-        break
-    if not s.strip():
-        continue
-
-    if s.lower() == 'q' or s.lower() == 'quit':
-        ext = input("Nome do ficheiro (sem .tex): ")
+    while True:
+        try:
+            s = input('pql> ')
+        except EOFError:
+            break
+        if not s.strip():
+            continue
 
-        if not ext:
-            ext = "proof"+time.strftime("%Y%m%d_%H%M%S")
+        if s.lower() == 'q' or s.lower() == 'quit':
+            ext = input("Nome do ficheiro (sem .tex): ")
 
-        pql.to_latex_weak(context, ext)
-        break
+            if not ext:
+                ext = "proof"+time.strftime("%Y%m%d_%H%M%S")
 
-    if not parser.is_sequent_symbol(s):
-        error_out("Input must be a sequent of the form 'A => B'")
+            pql.to_latex_weak(context, ext)
+            break
 
-    seq = parser.parse_sequent(s)
+        if not parser.is_sequent_symbol(s):
+            error_out("Input must be a sequent of the form 'A => B'")
 
-    proof = pql.derive_proof(seq)
+        seq = parser.parse_sequent(s)
 
-    if proof is not None:
-        print("Sequente derivável!")
-    else:
-        print("Sequente não derivável!")
+        proof = pql.derive_proof(seq)
 
-    context.append((proof, seq))
+        if proof is not None:
+            print("Sequente derivável!")
+        else:
+            print("Sequente não derivável!")
 
+        context.append((proof, seq))
 
+if __name__ == "__main__":
+    main()
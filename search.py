@@ -0,0 +1,546 @@
+from dataclasses import dataclass, field
+from typing import Callable, Collection, Dict, Generator, Hashable, Iterator, List, Optional, Sequence, Tuple
+import json
+import time
+
+import formula_store
+import memo
+
+# Every logic module describes its calculus as an `alternatives(sequent)` generator.
+# Each item is (rule, premises): the rule label used in ProofNode.rule and the tuple
+# of premise sequents that rule needs, in the order derive_proof tries them.
+# Axioms have no premises.
+Alternatives = Callable[[Hashable], Iterator[Tuple[str, tuple]]]
+
+# What the search records per sequent: the (rule, premises) alternative that proved
+# it, or None if it is not derivable. Proof trees are only built by reconstruct.
+Choice = Optional[Tuple[str, tuple]]
+
+# For the proof checkers: each rule label maps to a function from the conclusion's two
+# formulas to the premise sequents the rule needs, or None if it does not apply.
+Premises = Callable[[Hashable, Hashable], Optional[tuple]]
+
+class Unknown:
+    # Type of UNKNOWN, which has no truth value so that it cannot pass for True or False.
+    def __repr__(self):
+        return "UNKNOWN"
+
+    def __bool__(self):
+        raise TypeError("UNKNOWN has no truth value")
+
+# Returned instead of a result when the search ran out of nodes or time.
+UNKNOWN = Unknown()
+
+class Limits:
+    # Node budget and deadline (a time.monotonic() value) shared by the searches of
+    # one query. Every goal the search opens, and every proof node reconstruct builds,
+    # costs one node.
+    __slots__ = ("nodes", "deadline")
+
+    def __init__(self, max_nodes: Optional[int] = None, deadline: Optional[float] = None):
+        self.nodes = max_nodes
+        self.deadline = deadline
+
+    def spend(self) -> bool:
+        # Takes one node; False once the budget or the time is used up.
+        if self.nodes is not None:
+            if self.nodes <= 0:
+                return False
+            self.nodes -= 1
+        return self.deadline is None or time.monotonic() < self.deadline
+
+def limits(max_nodes: Optional[int] = None, deadline: Optional[float] = None) -> Optional[Limits]:
+    # None (no checks at all) unless a limit is given.
+    if max_nodes is None and deadline is None:
+        return None
+    return Limits(max_nodes, deadline)
+
+# A rule yields the alternatives it offers for (alpha, beta), like `alternatives` does.
+Rule = Callable[[Hashable, Hashable], Iterator[Tuple[str, tuple]]]
+
+def dispatch_table(rules: Sequence[Tuple[Collection[int], Collection[int], Rule]], shapes: int) -> List[Tuple[Rule, ...]]:
+    # rules are (left shapes, right shapes, rule) in the order the calculus tries them.
+    # Entry left * shapes + right of the table lists, in that order, the rules that
+    # can apply to a sequent whose sides have those shapes.
+    return [tuple(rule for left_shapes, right_shapes, rule in rules if left in left_shapes and right in right_shapes)
+            for left in range(shapes) for right in range(shapes)]
+
+@dataclass
+class RuleStats:
+    attempts: int = 0
+    successes: int = 0
+    failures: int = 0
+
+@dataclass
+class SearchStats:
+    # Filled in by derive/decide/reconstruct when passed as `stats`. A rule attempt
+    # ends in a success (all premises proved) or a failure (a premise failed).
+    rules: Dict[str, RuleStats] = field(default_factory=dict)
+    cache_hits: int = 0
+    cache_misses: int = 0
+    max_depth: int = 0
+    subgoals: int = 0
+    seconds: float = 0.0
+
+    def rule(self, label: str) -> RuleStats:
+        stats = self.rules.get(label)
+        if stats is None:
+            stats = self.rules[label] = RuleStats()
+        return stats
+
+    def __str__(self):
+        lines = [f"{self.subgoals} subgoals, max depth {self.max_depth}, {self.cache_hits} cache hits, "
+                 f"{self.cache_misses} cache misses, {self.seconds:.6f} s"]
+        for label, rule in sorted(self.rules.items(), key=lambda item: -item[1].attempts):
+            lines.append(f"  {label}: {rule.attempts} attempts, {rule.successes} successes, {rule.failures} failures")
+        return "\n".join(lines)
+
+# How trace_writer names the connectives and constants in its formula records.
+TRACE_SYMBOLS = {formula_store.TOP: "⊤", formula_store.BOT: "⊥", formula_store.AND: "∧",
+                 formula_store.OR: "∨", formula_store.IMP: "⊃", formula_store.COIMP: "⊂",
+                 formula_store.NOT: "~"}
+
+def _formula_records(store, node: int, written: set) -> Iterator[dict]:
+    # Records for `node` and its subformulas not in `written` yet, children first, so
+    # that each distinct formula is described once and in terms of its children's ids.
+    stack = [node]
+    while stack:
+        current = stack[-1]
+        if current in written:
+            stack.pop()
+            continue
+        op = store.op[current]
+        if op == formula_store.ATOM:
+            record = {"formula": current, "atom": store.names[store.left[current]]}
+        elif op == formula_store.TOP or op == formula_store.BOT:
+            record = {"formula": current, "constant": TRACE_SYMBOLS[op]}
+        elif op == formula_store.NOT:
+            operand = store.left[current]
+            if operand not in written:
+                stack.append(operand)
+                continue
+            record = {"formula": current, "connective": TRACE_SYMBOLS[op], "operand": operand}
+        else:
+            left, right = store.left[current], store.right[current]
+            if left not in written or right not in written:
+                stack.extend((left, right))
+                continue
+            record = {"formula": current, "connective": TRACE_SYMBOLS[op], "left": left, "right": right}
+        written.add(current)
+        stack.pop()
+        yield record
+
+def trace_writer(path: str) -> Generator[None, dict, None]:
+    # Coroutine that writes each trace event sent to it as one JSON line, so a trace
+    # never has to fit in memory. Start it with next() and close() it to close the file.
+    #
+    # An event names its sequent by "goal": [α id, β id]. The formulas themselves are
+    # written once, as {"formula": id, ...} records before the first event that needs
+    # them (see trace_report.formula_text), so the trace grows linearly with the
+    # formulas however deep they are.
+    written = set()
+    with open(path, "w", encoding="utf-8") as f:
+        while True:
+            event = yield
+            alpha, beta = event.pop("sequent")
+            for formula in (alpha, beta):
+                for record in _formula_records(formula._store, formula.id, written):
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            event["goal"] = [alpha.id, beta.id]
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+class Tracer:
+    # Numbers the goals visited by the searches of one query and sends an event for
+    # each to `sink` (see trace_writer) once its outcome is known: "proved", "failed",
+    # "cycle" (still open higher up, so read as failed) or "unknown" (limits ran out).
+    # `via` is the rule of the parent goal that asked for it, `rule` the rule that
+    # proved it, and `seconds` includes the goal's whole subtree.
+    __slots__ = ("sink", "next_id")
+
+    def __init__(self, sink: Generator[None, dict, None]):
+        self.sink = sink
+        self.next_id = 0
+
+    def start(self, parent: Optional[list], via: Optional[str], depth: int) -> list:
+        info = [self.next_id, None if parent is None else parent[0], via, depth, time.perf_counter(), 0]
+        self.next_id += 1
+        return info
+
+    def finish(self, info: list, sequent, rule: Optional[str], outcome: str, cache_hit: bool):
+        goal_id, parent, via, depth, start, attempts = info
+        self.sink.send({"id": goal_id, "parent": parent, "depth": depth, "via": via, "sequent": sequent,
+                        "rule": rule, "outcome": outcome, "cache_hit": cache_hit, "attempts": attempts,
+                        "seconds": time.perf_counter() - start})
+
+def _outcome(value) -> str:
+    return "failed" if value is None else "proved"
+
+class _Frame:
+    # One goal on the explicit work stack: the rule alternative being tried, how many
+    # of its premises are proved so far, and its bookkeeping for cycle detection.
+    __slots__ = ("sequent", "alternatives", "rule", "premises", "proved", "index", "low", "mark", "seen", "trace")
+
+    def __init__(self, sequent, alternatives: Iterator[Tuple[str, tuple]], index: int, mark: int, seen: int):
+        self.sequent = sequent
+        self.alternatives = alternatives
+        self.rule = None
+        self.premises = None
+        self.proved = 0
+        self.index = index
+        self.low = index
+        self.mark = mark
+        self.seen = seen
+        self.trace = None
+
+def _solve(root, alternatives: Alternatives, cache: memo.Memo, stats: Optional[SearchStats] = None,
+           limits: Optional[Limits] = None, trace: Optional[Tracer] = None) -> Choice:
+    # Depth-first search without Python recursion. Premises are proved left to right;
+    # the first failing premise abandons its rule and the next alternative is tried,
+    # exactly as the recursive engines did.
+    #
+    # Calculi with cycles (the nql weakenings) are handled by tabling. A premise that
+    # is already open on the stack is read as failed, which makes the failures found
+    # below it conditional. Those wait in `pending` until the strongly connected
+    # component they belong to is complete (its first goal, the leader, is done). If
+    # nothing read as failed got proved in the meantime they are final, otherwise the
+    # leader is searched again. Proofs are final as soon as they are found, so every
+    # cached result, positive or negative, is independent of the search order.
+    #
+    # When `limits` run out the search stops and returns UNKNOWN. Only final results
+    # have been cached by then; open goals and pending failures are dropped.
+    value = cache.get(root)
+    if value is not memo.MISSING:
+        if trace is not None:
+            trace.finish(trace.start(None, None, 0), root, value and value[0], _outcome(value), True)
+        return value
+
+    active = {}          # open goal -> its frame
+    pending = {}         # conditionally failed goal -> its index
+    pending_order = []
+    assumed = set()      # goals read as failed while open
+    assumed_proved = set()
+    counter = 1
+
+    def lookup(frame, sequent):
+        value = cache.get(sequent)
+        if value is memo.MISSING:
+            if sequent in active:
+                assumed.add(sequent)
+                if active[sequent].index < frame.low:
+                    frame.low = active[sequent].index
+                return None
+            if sequent in pending:
+                if pending[sequent] < frame.low:
+                    frame.low = pending[sequent]
+                return None
+        return value
+
+    def drop_pending(mark):
+        for goal in pending_order[mark:]:
+            del pending[goal]
+        del pending_order[mark:]
+
+    def give_up():
+        if trace is not None:
+            for frame in reversed(stack):
+                trace.finish(frame.trace, frame.sequent, None, "unknown", False)
+        return UNKNOWN
+
+    if limits is not None and not limits.spend():
+        if trace is not None:
+            trace.finish(trace.start(None, None, 0), root, None, "unknown", False)
+        return UNKNOWN
+
+    stack = [_Frame(root, alternatives(root), 0, 0, 0)]
+    active[root] = stack[0]
+    if trace is not None:
+        stack[0].trace = trace.start(None, None, 0)
+    if stats is not None:
+        stats.subgoals += 1
+        stats.max_depth = max(stats.max_depth, 1)
+    while True:
+        frame = stack[-1]
+
+        if frame.premises is not None and frame.proved < len(frame.premises):
+            premise = frame.premises[frame.proved]
+            value = lookup(frame, premise)
+            if value is memo.MISSING:
+                if limits is not None and not limits.spend():
+                    return give_up()
+                parent = frame
+                frame = active[premise] = _Frame(premise, alternatives(premise), counter,
+                                                 len(pending_order), len(assumed_proved))
+                counter += 1
+                stack.append(frame)
+                if stats is not None:
+                    stats.subgoals += 1
+                    stats.max_depth = max(stats.max_depth, len(stack))
+                if trace is not None:
+                    frame.trace = trace.start(parent.trace, parent.rule, len(stack) - 1)
+                continue
+            if trace is not None:
+                cycle = premise in active
+                trace.finish(trace.start(frame.trace, frame.rule, len(stack)), premise, value and value[0],
+                             "cycle" if cycle else _outcome(value), not cycle)
+        elif frame.premises is not None:
+            value = (frame.rule, frame.premises)
+            if stats is not None:
+                stats.rule(frame.rule).successes += 1
+        else:
+            alternative = next(frame.alternatives, None)
+            if alternative is not None:
+                frame.rule, frame.premises = alternative
+                frame.proved = 0
+                if stats is not None:
+                    stats.rule(frame.rule).attempts += 1
+                if trace is not None:
+                    frame.trace[5] += 1
+                continue
+            value = None
+
+        # `value` is now either a finished goal (the frame on top) or a cached premise.
+        while True:
+            if frame.premises is not None and frame.proved < len(frame.premises):
+                # Result of a premise of the frame on top of the stack.
+                if value is None:
+                    frame.premises = None
+                    if stats is not None:
+                        stats.rule(frame.rule).failures += 1
+                else:
+                    frame.proved += 1
+                break
+
+            goal = frame.sequent
+            leader = frame.low == frame.index
+            if value is None and leader and len(assumed_proved) > frame.seen:
+                # A goal this component read as failed has been proved: search again.
+                if limits is not None and not limits.spend():
+                    return give_up()
+                drop_pending(frame.mark)
+                frame.alternatives = alternatives(goal)
+                frame.premises = None
+                frame.seen = len(assumed_proved)
+                break
+
+            stack.pop()
+            del active[goal]
+            if trace is not None:
+                trace.finish(frame.trace, goal, value and value[0], _outcome(value), False)
+            if value is not None:
+                cache.put(goal, value)
+                if goal in assumed:
+                    assumed_proved.add(goal)
+                if leader:
+                    drop_pending(frame.mark)
+            elif not leader:
+                pending[goal] = frame.index
+                pending_order.append(goal)
+            else:
+                for member in pending_order[frame.mark:]:
+                    cache.put(member, None)
+                drop_pending(frame.mark)
+                cache.put(goal, None)
+
+            if not stack:
+                return value
+            parent = stack[-1]
+            if frame.low < parent.low:
+                parent.low = frame.low
+            frame = parent
+
+def _search(sequent, alternatives: Alternatives, cache: memo.Memo, stats: Optional[SearchStats],
+            limits: Optional[Limits], trace: Optional[Tracer]) -> Choice:
+    # _solve, adding its cache traffic to `stats`.
+    if stats is None:
+        return _solve(sequent, alternatives, cache, None, limits, trace)
+
+    hits, misses = cache.hits, cache.misses
+    choice = _solve(sequent, alternatives, cache, stats, limits, trace)
+    stats.cache_hits += cache.hits - hits
+    stats.cache_misses += cache.misses - misses
+    return choice
+
+def decide(sequent, alternatives: Alternatives, cache: memo.Memo, stats: Optional[SearchStats] = None,
+           limits: Optional[Limits] = None, trace: Optional[Tracer] = None):
+    # Runs the search, leaving the winning rule of every proved subgoal in `cache`.
+    # True, False, or UNKNOWN if `limits` ran out.
+    start = time.perf_counter()
+    choice = _search(sequent, alternatives, cache, stats, limits, trace)
+    if stats is not None:
+        stats.seconds += time.perf_counter() - start
+    return UNKNOWN if choice is UNKNOWN else choice is not None
+
+def reconstruct(sequent, alternatives: Alternatives, cache: memo.Memo, make_node: Callable,
+                depth: Optional[int] = None, stats: Optional[SearchStats] = None,
+                limits: Optional[Limits] = None, trace: Optional[Tracer] = None):
+    # Builds the proof of `sequent` from the rules recorded in `cache`, calling
+    # make_node(sequent, rule, premise_proofs) bottom-up; None if it is not derivable
+    # and UNKNOWN if `limits` ran out, searching or building. Subgoals evicted from the
+    # cache are searched again. With `depth`, nodes that deep keep their rule but get
+    # no premises. A subgoal used twice gets one node.
+    start = time.perf_counter()
+    try:
+        return _build(sequent, alternatives, cache, make_node, depth, stats, limits, trace)
+    finally:
+        if stats is not None:
+            stats.seconds += time.perf_counter() - start
+
+def _build(sequent, alternatives: Alternatives, cache: memo.Memo, make_node: Callable,
+           depth: Optional[int], stats: Optional[SearchStats], limits: Optional[Limits],
+           trace: Optional[Tracer]):
+    choice = _search(sequent, alternatives, cache, stats, limits, trace)
+    if choice is None or choice is UNKNOWN:
+        return choice
+
+    # Choices left in `cache` by different searches can disagree once some were evicted:
+    # a subgoal searched again may pick a rule that goes back through a goal still
+    # being built. `path` holds those goals; on reaching one, it is searched again in
+    # `scratch`, a memo with no cap and no evictions, whose choices always form a proof,
+    # and from then on the rest of the proof is read from `scratch` too.
+    built = {}
+    path = set()
+    scratch = None
+    stack = [(sequent, 0, None)]
+    while stack:
+        goal, level, choice = stack.pop()
+        key = goal if depth is None else (goal, level)
+        if choice is None:
+            # First visit: look the rule up and build the premises first.
+            if key in built:
+                continue
+            if limits is not None and not limits.spend():
+                return UNKNOWN
+            if goal in path:
+                # Back to an ancestor: drop what was stacked above it and build it again
+                # from scratch.
+                if scratch is None:
+                    scratch = memo.Memo("scratch", max_entries=None)
+                while stack[-1][0] != goal or stack[-1][2] is None:
+                    entry = stack.pop()
+                    if entry[2] is not None:
+                        path.discard(entry[0])
+                goal, level, _ = stack.pop()
+                key = goal if depth is None else (goal, level)
+                path.discard(goal)
+            choice = memo.MISSING if scratch is not None else cache.get(goal)
+            if choice is memo.MISSING:
+                choice = _solve(goal, alternatives, cache if scratch is None else scratch, None, limits, trace)
+            if choice is UNKNOWN:
+                return UNKNOWN
+            if choice is None:
+                raise RuntimeError(f"{goal} was proved but is no longer derivable; the cache is too small")
+            if depth is None or level < depth:
+                path.add(goal)
+                stack.append((goal, level, choice))
+                stack.extend((premise, level + 1, None) for premise in reversed(choice[1]))
+                continue
+
+        path.discard(goal)
+        rule, premises = choice
+        if depth is not None and level >= depth:
+            premises = ()
+        children = [built[premise if depth is None else (premise, level + 1)] for premise in premises]
+        built[key] = make_node(goal, rule, children)
+
+    return built[sequent if depth is None else (sequent, 0)]
+
+def derive(sequent, alternatives: Alternatives, cache: memo.Memo, make_node: Callable,
+           stats: Optional[SearchStats] = None, limits: Optional[Limits] = None,
+           trace: Optional[Tracer] = None):
+    # Proof search: decide, then build the proof with make_node. None is failure,
+    # UNKNOWN means `limits` ran out.
+    return reconstruct(sequent, alternatives, cache, make_node, None, stats, limits, trace)
+
+# derive_proof and is_derivable of the logic modules; they only differ in the calculus.
+
+def derive_proof(sequent, alternatives: Alternatives, cache: memo.Memo, make_node: Callable, stats: bool = False,
+                 max_nodes: Optional[int] = None, deadline: Optional[float] = None, trace: Optional[str] = None):
+    # The proof, None or UNKNOWN; (that, SearchStats) with stats. The search gives up
+    # after opening max_nodes goals or once time.monotonic() passes deadline. With a
+    # trace path, every goal visited is written there as a JSON line.
+    search_stats = SearchStats() if stats else None
+    sink = None
+    if trace is not None:
+        sink = trace_writer(trace)
+        next(sink)
+    try:
+        proof = derive(sequent, alternatives, cache, make_node, search_stats, limits(max_nodes, deadline),
+                       None if sink is None else Tracer(sink))
+    finally:
+        if sink is not None:
+            sink.close()
+    return (proof, search_stats) if stats else proof
+
+def is_derivable(sequent, alternatives: Alternatives, cache: memo.Memo, max_nodes: Optional[int] = None,
+                 deadline: Optional[float] = None, trace: Optional[str] = None):
+    # True, False or UNKNOWN, with the same limits and trace as derive_proof.
+    sink = None
+    if trace is not None:
+        sink = trace_writer(trace)
+        next(sink)
+    try:
+        return decide(sequent, alternatives, cache, None, limits(max_nodes, deadline),
+                      None if sink is None else Tracer(sink))
+    finally:
+        if sink is not None:
+            sink.close()
+
+# check_proof of the logic modules. The rule tables are written out separately from
+# `alternatives`, so the search's pruning and rule order play no part.
+
+def invalid_step(proof, premises: Dict[str, Premises]):
+    # The first node whose premises are not what its rule needs for its conclusion, or
+    # None. One pass; a subproof shared between nodes is checked once.
+    seen = set()
+    stack = [proof]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        rule = premises.get(node.rule)
+        if rule is None or rule(*node.sequent) != tuple(premise.sequent for premise in node.premises):
+            return node
+        stack.extend(node.premises)
+    return None
+
+def check_proof(proof, premises: Dict[str, Premises]) -> bool:
+    return invalid_step(proof, premises) is None
+
+# Certificates: a proof as the pre-order sequence of its rules, one byte per node
+# holding the rule's index in the logic's PREMISES table. The conclusion and the table
+# determine every sequent, so replay rebuilds and checks the tree without searching.
+
+def certificate(proof, premises: Dict[str, Premises]) -> bytes:
+    codes = {rule: code for code, rule in enumerate(premises)}
+    out = bytearray()
+    stack = [proof]
+    while stack:
+        node = stack.pop()
+        out.append(codes[node.rule])
+        stack.extend(reversed(node.premises))
+    return bytes(out)
+
+def replay(sequent, certificate: bytes, premises: Dict[str, Premises], make_node: Callable):
+    # The proof of `sequent` described by `certificate`; ValueError if a rule does not
+    # apply where it is used or the certificate is too short or too long.
+    rules = list(premises.items())
+    root = make_node(sequent, None, [])
+    stack = [root]
+    position = 0
+    for code in certificate:
+        if not stack:
+            raise ValueError(f"certificate has {len(certificate) - position} codes past the end of the proof")
+        node = stack.pop()
+        if code >= len(rules):
+            raise ValueError(f"unknown rule code {code} at {position}")
+        node.rule, needs = rules[code]
+        goals = needs(*node.sequent)
+        if goals is None:
+            raise ValueError(f"{node.rule} does not apply to {node} at {position}")
+        node.premises = [make_node(goal, None, []) for goal in goals]
+        stack.extend(reversed(node.premises))
+        position += 1
+    if stack:
+        raise ValueError(f"certificate ends with {len(stack)} sequent(s) unproved")
+    return root
@@ -1,19 +1,46 @@
-import subprocess
 import os
+import gc
+import copy
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import dataclasses
 
 import ll
 import pql
 import nl
 import nql
+import memo
+import search
+import formula_store
+import latex_output
+import workload
+import fuzz
+import trace_report
 
 PRODUCE_PROOFS = True
 PERFORM_ASSERTION = True
 PRINT_MARKERS = True
+# Proofs per .tex file (None: one file per logic), pdflatex run at once (None: one per
+# core), and whether to join each logic's shards into one PDF (needs pypdf).
+SHARD_SIZE = None
+LATEX_WORKERS = None
+MERGE_PDFS = False
+# Load the preamble from a precompiled format, and use minimal.template's preamble.
+PRECOMPILED_PREAMBLE = True
+MINIMAL_PREAMBLE = False
 
 proof_data = ""
+latex_pool = None
 
-def generate_latex_output(pref):
+def start_latex_output(pref):
+    # Proofs are written to proofs_output/proofs_<pref>.tex as each test renders them
+    # (see latex_output.py), instead of piling up in a string until the end.
     global proof_data
+    proof_data = ""
     if PRODUCE_PROOFS:
         output_dir = "proofs_output"
         ext = "proofs_" + pref
@@ -24,30 +51,34 @@ def generate_latex_output(pref):
         else:
             os.makedirs(output_dir)
 
-        template_dest = os.path.join(output_dir, "../a.template")
-        
-        tex_file = os.path.join(output_dir, ext + ".tex")
-        with open(tex_file, "w") as f:
-            template_data = ""
-            with open(template_dest, "r") as g:
-                template_data = g.read()
-                final = template_data + proof_data + "\n\\end{document}"
-                f.write(final)
-        
-        original_cwd = os.getcwd()
-        try:
-            os.chdir(output_dir)
-            subprocess.run(["pdflatex", ext + ".tex"], check=True)
-            
-            aux_files = [ext + ".aux", ext + ".log", ext + ".out"]
-            for aux_file in aux_files:
-                if os.path.exists(aux_file):
-                    os.remove(aux_file)
-                    
-        finally:
-            os.chdir(original_cwd)
-        
-        print(f"PDF generated successfully in {output_dir}/" + ext + ".pdf")
+        template_dest = os.path.join(output_dir, "../minimal.template" if MINIMAL_PREAMBLE else "../a.template")
+        proof_data = latex_output.LatexWriter(os.path.join(output_dir, ext + ".tex"), template_dest, SHARD_SIZE)
+
+def generate_latex_output(pref):
+    # Queues the report for pdflatex and returns, so the next logic's tests run while it
+    # compiles; finish_latex_output waits for all of them.
+    global latex_pool
+    if PRODUCE_PROOFS:
+        if latex_pool is None:
+            latex_pool = latex_output.CompilePool(LATEX_WORKERS, latex_output.FORMAT_DIR if PRECOMPILED_PREAMBLE else None)
+        latex_pool.submit(proof_data, MERGE_PDFS)
+
+def finish_latex_output():
+    if latex_pool is not None:
+        for pdf in latex_pool.wait():
+            print(f"PDF generated successfully in {pdf}")
+
+def bytes_per_node(build, nodes: int) -> float:
+    # Memory still allocated after build() returns, per formula node; build returns
+    # what it made so it stays alive while it is measured.
+    gc.collect()
+    tracemalloc.start()
+    kept = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size / nodes
 
 def assertion_print(msg: str):
     if PERFORM_ASSERTION and PRINT_MARKERS:
@@ -55,7 +86,7 @@ def assertion_print(msg: str):
 
 def ll_tests():
     global proof_data
-    proof_data = ""
+    start_latex_output("ll")
 
     p = ll.atom("p")
     q = ll.atom("q")
@@ -144,14 +175,238 @@ def ll_tests():
     # Test 20: The reverse (should be False)
     proof_data += ll.test_derivable((pr_and_qs, pq_or_rs), False, "Test 20 failed: (p ∨ r) ∧ (q ∨ s) ⟹  (p ∧ q) ∨ (r ∧ s) should be False", PERFORM_ASSERTION, PRODUCE_PROOFS)
     assertion_print("Passed!")
-    
+
+    assertion_print("\n=== INTERNING TESTS ===")
+    # Test 21: Structurally equal formulas are the same object
+    assert ll.and_formula(ll.atom("p"), ll.atom("q")) is pq, "Test 21 failed: p ∧ q is not interned"
+    assert ll.Compound(ll.ConnectiveType.OR, p, q) is pq_or, "Test 21 failed: p ∨ q is not interned"
+    # Test 22: Interning survives copying
+    assert copy.deepcopy(pq_or_rs) is pq_or_rs, "Test 22 failed: deepcopy breaks interning"
+    # Test 22b: Formulas built directly in the store are the same objects
+    assert ll.formula(ll.store.binary(formula_store.AND, p.id, q.id)) is pq, "Test 22b failed: store node is not p ∧ q"
+    assert ll.formula(ll.store.atom("p")) is p, "Test 22b failed: store node is not p"
+    # Test 22c: A store node takes less memory than the frozen dataclass node it replaced
+    chain_length = 20000
+    DataclassCompound = dataclasses.make_dataclass("DataclassCompound", ["connective", "left", "right"], frozen=True)
+    def dataclass_chain():
+        chain = p
+        for _ in range(chain_length):
+            chain = DataclassCompound(ll.ConnectiveType.AND, chain, p)
+        return chain
+    def store_chain():
+        chain_store = formula_store.FormulaStore()
+        node, leaf = chain_store.atom("p"), chain_store.atom("q")
+        for _ in range(chain_length):
+            node = chain_store.binary(formula_store.AND, node, leaf)
+        return chain_store
+    store_bytes, dataclass_bytes = bytes_per_node(store_chain, chain_length), bytes_per_node(dataclass_chain, chain_length)
+    assert store_bytes < dataclass_bytes, f"Test 22c failed: {store_bytes:.0f} B per store node, {dataclass_bytes:.0f} B per dataclass node"
+    # Test 22d: collect frees the nodes no live formula reaches and reuses their ids
+    chain_store = formula_store.FormulaStore()
+    chain_view = type("ChainView", (formula_store.FormulaView,), {"__slots__": (), "_store": chain_store})
+    chain_store.register(formula_store.ATOM, chain_view)
+    chain_store.register(formula_store.AND, chain_view)
+    leaf = chain_store.atom("p")
+    kept = chain_store.binary(formula_store.AND, leaf, leaf)
+    node = kept
+    for _ in range(100):
+        node = chain_store.binary(formula_store.AND, node, leaf)
+    kept_view = chain_store.view(kept)
+    assert chain_store.collect() == 100 and len(chain_store) == 2, "Test 22d failed: unreachable nodes kept"
+    assert chain_store.binary(formula_store.AND, leaf, leaf) == kept and chain_store.view(kept) is kept_view, "Test 22d failed: live node lost"
+    assert chain_store.binary(formula_store.AND, kept, leaf) < len(chain_store.op), "Test 22d failed: freed id not reused"
+    del kept_view
+    assert chain_store.collect(roots=[leaf]) == 2 and len(chain_store) == 1, "Test 22d failed: dead view kept its node"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== MEMO TESTS ===")
+    # Test 23: Repeated queries are answered from the cache
+    hits = ll.proof_cache.hits
+    proof = ll.derive_proof((pq_or_rs, pr_and_qs))
+    assert ll.derive_proof((pq_or_rs, pr_and_qs)) == proof, "Test 23 failed: cached proof changed"
+    assert ll.proof_cache.hits > hits, "Test 23 failed: no cache hit recorded"
+    # Test 24: LRU eviction keeps the most recently used entries
+    lru = memo.Memo("lru_test", max_entries=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")
+    lru.put("c", 3)
+    assert "a" in lru and "b" not in lru and lru.evictions == 1, "Test 24 failed: wrong LRU eviction"
+    lru.clear()
+    assert len(lru) == 0 and lru.get("a") is memo.MISSING, "Test 24 failed: clear() kept entries"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== DEEP FORMULA TESTS ===")
+    # Test 25: Chains deeper than the recursion limit do not overflow the stack
+    deep_and = p
+    deep_or = p
+    for _ in range(5000):
+        deep_and = ll.and_formula(deep_and, q)
+        deep_or = ll.or_formula(q, deep_or)
+    assert ll.derive_proof((deep_and, deep_or)) is not None, "Test 25 failed: deep ∧ ⟹  deep ∨"
+    assert not ll.is_derivable((deep_or, deep_and)), "Test 25 failed: deep ∨ ⟹  deep ∧ should be False"
+    # Test 25b: A 20000-deep sequent is traced without recursion, one record per formula
+    deep_trace = p
+    for _ in range(20000):
+        deep_trace = ll.and_formula(deep_trace, q)
+    with tempfile.TemporaryDirectory() as trace_dir:
+        trace_path = os.path.join(trace_dir, "trace.jsonl")
+        assert ll.is_derivable((deep_trace, p), trace=trace_path), "Test 25b failed: deep ∧ ⟹  p"
+        hottest, _ = trace_report.summarize(trace_report.read_trace(trace_path), 1)
+        trace_size = os.path.getsize(trace_path)
+    assert hottest[0][-1] == f"{'(' * 20000}p{' ∧ q)' * 20000} ⟹  p", "Test 25b failed: wrong sequent text"
+    assert trace_size < 500 * 20000, f"Test 25b failed: {trace_size} bytes of trace for 20000 goals"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== WHITMAN ENGINE TESTS ===")
+    # Test 26: The subformula-pair table gives the same verdicts and proofs as search
+    for sequent in [(pq_or_rs, pr_and_qs), (pr_and_qs, pq_or_rs), (p_and_qr_or, pq_or_pr),
+                    (pq_or_pr, p_and_qr_or), (pq_and_r, p_and_qr)]:
+        expected = ll.derive_proof(sequent)
+        assert ll.is_derivable(sequent, engine="whitman") == (expected is not None), f"Test 26 failed: {sequent[0]} ⟹  {sequent[1]}"
+        assert ll.derive_proof(sequent, engine="whitman") == expected, f"Test 26 failed: {sequent[0]} ⟹  {sequent[1]}"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== BATCH DECISION TESTS ===")
+    # Test 27: A batch over shared subformulas gives the same verdicts one by one
+    batch_sequents = [(a, b) for a in [p, pq, pq_or, pq_or_rs, pr_and_qs, p_and_qr_or, pq_or_pr]
+                      for b in [p, qp, qp_or, pr_and_qs, pq_or_rs, p_and_qr, pq_or_pr]]
+    assert ll.decide_many(batch_sequents) == [ll.is_derivable(sequent) for sequent in batch_sequents], "Test 27 failed: decide_many disagrees with is_derivable"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== SIGNATURE TESTS ===")
+    # Test 28: Sides with no common atom are refuted without searching
+    assert not ll.shares_atom(pq, ll.or_formula(r, s)) and ll.shares_atom(pq, pq_or_rs), "Test 28 failed: wrong atom signatures"
+    assert [rule for rule, _ in ll.alternatives((p, ll.or_formula(r, p)))] == ["∨R2"], "Test 28 failed: ∨R1 not pruned"
+    assert not ll.is_derivable((pq, ll.or_formula(r, s))), "Test 28 failed: p ∧ q ⟹  r ∨ s derivable"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== SEARCH STATS TESTS ===")
+    # Test 29: Opt-in stats count rule attempts next to the proof
+    memo.clear_all()
+    proof, stats = ll.derive_proof((pq_or_rs, pr_and_qs), stats=True)
+    assert proof == ll.derive_proof((pq_or_rs, pr_and_qs)), "Test 29 failed: stats changed the proof"
+    assert stats.rules["A"].successes > 0 and stats.rules[proof.rule].successes > 0, "Test 29 failed: successes not counted"
+    assert all(rule.attempts == rule.successes + rule.failures for rule in stats.rules.values()), "Test 29 failed: attempts do not add up"
+    assert stats.subgoals > 0 and stats.max_depth > 1 and stats.cache_misses > 0, "Test 29 failed: search not measured"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== PROOF CHECK TESTS ===")
+    # Test 30: Proofs of both engines check; a node whose premises do not fit its rule does not
+    assert ll.check_proof(proof) and ll.check_proof(ll.derive_proof((pq_or_rs, pr_and_qs), engine="whitman")), "Test 30 failed: valid proof rejected"
+    forged = ll.ProofNode((pq, qp), "∧R", [ll.ProofNode((pq, q), "∧L1", [ll.ProofNode((q, q), "A", [])]),
+                                           ll.ProofNode((pq, p), "∧L1", [ll.ProofNode((p, p), "A", [])])])
+    assert not ll.check_proof(forged), "Test 30 failed: ∧L1 to the wrong conjunct accepted"
+    forged.premises[0].rule = "∧L2"
+    assert ll.check_proof(forged) and not ll.check_proof(ll.ProofNode((p, q), "A", [])), "Test 30 failed: wrong verdict"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== LEMMA TESTS ===")
+    # Test 31: A subproof used twice is typeset once, as a lemma, and referenced at both uses
+    shared = ll.ProofNode((pq, p), "∧L1", [ll.ProofNode((p, p), "A", [])])
+    twice = ll.ProofNode((pq, ll.and_formula(p, p)), "∧R", [shared, shared])
+    latex = ll.lift_lemmas_to_bussproofs(twice, threshold=2)
+    assert latex.count("Lemma 1") == 3 and latex.count("\\land_{L1}") == 1, "Test 31 failed: shared subproof not a lemma"
+    assert ll.lift_lemmas_to_bussproofs(twice, threshold=3) == ll.lift_object_to_bussproofs(twice), "Test 31 failed: small subproof split"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== STREAMED LATEX TESTS ===")
+    # Test 32: A proof far deeper than the recursion limit renders, and the file written
+    # piece by piece holds the same text as the string
+    # (rendering does not check the rules, so the same step repeated will do)
+    deep = ll.ProofNode((p, p), "A", [])
+    for _ in range(5000):
+        deep = ll.ProofNode((pq, p), "∧L1", [deep])
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "a.template")
+        with open(template, "w") as f:
+            f.write("\\begin{document}\n")
+        with latex_output.LatexWriter(os.path.join(tmp, "deep.tex"), template) as out:
+            out.write_all(ll.iter_object_to_bussproofs(deep))
+        with open(os.path.join(tmp, "deep.tex")) as f:
+            written = f.read()
+    assert written == "\\begin{document}\n" + ll.lift_object_to_bussproofs(deep) + "\n\\end{document}", "Test 32 failed: streamed text differs"
+    assert written.count("\\UnaryInfC") == 5001, "Test 32 failed: deep proof cut short"
+    # Test 33: Formulas render without recursion, each compound subformula once
+    deep_formula = p
+    for _ in range(5000):
+        deep_formula = ll.and_formula(deep_formula, q)
+    assert ll.lift_formula_to_latex_string(deep_formula).count("\\land") == 5000, "Test 33 failed: deep formula"
+    ll.latex_cache.reset_stats()
+    assert ll.lift_formula_to_latex_string(ll.and_formula(deep_formula, p)).endswith("\\land p)"), "Test 33 failed: wrong text"
+    assert ll.latex_cache.hits == 1 and ll.latex_cache.misses == 1, "Test 33 failed: subformula rendered again"
+    # Test 33b: Rendering keeps memory linear in the text, and the cache is bounded in bytes
+    for _ in range(15000):
+        deep_formula = ll.and_formula(deep_formula, q)
+    tracemalloc.start()
+    deep_text = ll.lift_formula_to_latex_string(deep_formula)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < 20 * len(deep_text), f"Test 33b failed: {peak} bytes to render {len(deep_text)} characters"
+    assert ll.latex_cache.max_bytes is not None and 0 < ll.latex_cache.size_bytes <= ll.latex_cache.max_bytes, "Test 33b failed: latex cache not bounded in bytes"
+    # Test 34: Sharded output keeps each entry whole and every shard a full document
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "a.template")
+        with open(template, "w") as f:
+            f.write("\\begin{document}\n")
+        with latex_output.LatexWriter(os.path.join(tmp, "report.tex"), template, shard_size=2) as out:
+            for k in range(5):
+                out += (piece for piece in (f"entry {k}", "\n"))
+        shards = []
+        for path in out.paths:
+            with open(path) as f:
+                shards.append(f.read())
+    assert [os.path.basename(path) for path in out.paths] == ["report_1.tex", "report_2.tex", "report_3.tex"], "Test 34 failed: shard names"
+    assert shards[1] == "\\begin{document}\nentry 2\nentry 3\n\n\\end{document}", "Test 34 failed: shard contents"
+    # Test 35: The preamble that goes into a precompiled format is the one minimal.template loads
+    preamble = latex_output.read_preamble(os.path.join(os.path.dirname(os.path.abspath(__file__)), "minimal.template"))
+    assert preamble.startswith("\\documentclass") and "\\usepackage{bussproofs}" in preamble, "Test 35 failed: preamble"
+    assert "\\begin{document}" not in preamble, "Test 35 failed: preamble runs into the document"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== PRECOMPILED PREAMBLE TESTS ===")
+    if shutil.which("pdflatex") is None:
+        assertion_print("Skipped (no pdflatex)")
+    else:
+        here = os.path.dirname(os.path.abspath(__file__))
+        body = "\\begin{document}\n" + ll.lift_object_to_bussproofs(ll.derive_proof((pq, p))) + "\n\\end{document}\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            format_dir = os.path.join(tmp, "formats")
+            # Test 36: Both templates, hyperref included, dump to a format and compile from it
+            for template_name in ("a.template", "minimal.template"):
+                tex_file = os.path.join(tmp, template_name.replace(".template", ".tex"))
+                with open(os.path.join(here, template_name)) as f, open(tex_file, "w") as g:
+                    g.write(f.read().split("\\begin{document}")[0] + body)
+                fmt = latex_output.preamble_format(latex_output.read_preamble(tex_file), format_dir)
+                assert fmt is not None and os.path.exists(fmt), f"Test 36 failed: {template_name} did not dump"
+                pdf = latex_output.pdflatex(tex_file, format_dir)
+                assert os.path.getsize(pdf) > 0, f"Test 36 failed: {template_name} did not compile from its format"
+            # Test 37: A preamble that fails to dump falls back to an ordinary compile
+            run = subprocess.run
+            def failing_dump(command, *args, **kwargs):
+                if "-ini" in command:
+                    return subprocess.CompletedProcess(command, 1)
+                return run(command, *args, **kwargs)
+            tex_file = os.path.join(tmp, "fallback.tex")
+            with open(tex_file, "w") as f:
+                f.write("\\documentclass{article}\n% fallback\n\\usepackage{bussproofs}\n" + body)
+            formats = set(os.listdir(format_dir))
+            subprocess.run = failing_dump
+            try:
+                assert latex_output.preamble_format(latex_output.read_preamble(tex_file), format_dir) is None, "Test 37 failed: failed dump returned a format"
+                pdf = latex_output.pdflatex(tex_file, format_dir)
+            finally:
+                subprocess.run = run
+            assert os.path.getsize(pdf) > 0 and set(os.listdir(format_dir)) == formats, "Test 37 failed: no fallback compile"
+        assertion_print("Passed!")
+
     generate_latex_output("ll")
 
     proof_data = ""
 
 def nl_tests():
     global proof_data
-    proof_data = ""
+    start_latex_output("nl")
     p = nl.atom("p")
     q = nl.atom("q")
     r = nl.atom("r")
@@ -310,12 +565,26 @@ def nl_tests():
 
     proof_data += nl.test_derivable((p_coimp_r_or_s, p_or_q_coimp_r_and_s), True, "Test 31: (p ⊂ (r ∨ s)) ⟹  ((p ∨ q) ⊂ (r ∧ s)) should be True", PERFORM_ASSERTION, PRODUCE_PROOFS)
 
+    assertion_print("\n=== CACHE ARGUMENT TESTS ===")
+    # Test 32: The old call form with a fresh dict still proves axioms, other caches are refused
+    proof = nl.derive_proof((p, p), {})
+    assert proof is not None and proof == nl.derive_proof((p, p)), "Test 32 failed: derive_proof((p, p), {}) lost the axiom"
+    assert nl.derive_proof((p, p), memo.Memo("nl test", max_entries=None)).rule == "A", "Test 32 failed: explicit memo ignored"
+    for bad_cache in ({(p, p): None}, []):
+        try:
+            nl.derive_proof((p, p), bad_cache)
+        except TypeError:
+            continue
+        assert False, f"Test 32 failed: {type(bad_cache).__name__} cache accepted"
+    assertion_print("Passed!")
+
     generate_latex_output("nl")
 
     proof_data = ""
 
 def pql_tests():
     global proof_data
+    start_latex_output("pql")
     p = pql.atom("p")
     q = pql.atom("q")
     r = pql.atom("r")
@@ -478,13 +747,41 @@ def pql_tests():
     proof_data += pql.test_derivable((mixed_or, result_or), True, "Test 35 failed: (p ∧ ~q) ∨ (~p ∧ q) ⟹  ~(p ∧ q) ∨ ~(~p ∧ ~q)", PERFORM_ASSERTION, PRODUCE_PROOFS)
     assertion_print("Passed!")
 
+    assertion_print("\n=== DECISION ENGINE TESTS ===")
+    # Test 36: The boolean engine agrees with proof search
+    for sequent, expected in [((mixed_or, result_or), True), ((not_p_or_not_qr, not_p_and_qr), True),
+                              ((p, not_p), False), ((not_pq_and, not_p), False)]:
+        assert pql.is_derivable(sequent) == expected, f"Test 36 failed: {sequent[0]} ⟹  {sequent[1]}"
+        assert (pql.derive_proof(sequent) is not None) == expected, f"Test 36 failed: {sequent[0]} ⟹  {sequent[1]}"
+    # Test 37: Only the winning rule is recorded; reconstruct builds the proof from it
+    rule, premises = pql.proof_cache.get((mixed_or, result_or))
+    assert pql.reconstruct((mixed_or, result_or)) == pql.derive_proof((mixed_or, result_or)), "Test 37 failed: reconstruct differs from derive_proof"
+    shallow = pql.reconstruct((mixed_or, result_or), depth=1)
+    assert shallow.rule == rule and [node.sequent for node in shallow.premises] == list(premises), "Test 37 failed: wrong first step"
+    assert all(node.premises == [] for node in shallow.premises), "Test 37 failed: depth not respected"
+    assert pql.proof_cache.get((p, not_p)) is None, "Test 37 failed: failure not recorded"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== BATCH DECISION TESTS ===")
+    # Test 38: A batch over shared subformulas gives the same verdicts one by one
+    batch_formulas = [p, not_p, not_not_p, not_pq_and, not_p_or_q, mixed_or, result_or, not_p_or_not_qr, not_p_and_qr]
+    batch_sequents = [(a, b) for a in batch_formulas for b in batch_formulas]
+    assert pql.decide_many(batch_sequents) == [pql.is_derivable(sequent) for sequent in batch_sequents], "Test 38 failed: decide_many disagrees with is_derivable"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== SIGNATURE TESTS ===")
+    # Test 39: Signatures follow negations inwards, so p and ~p share no literal
+    assert not pql.shares_literal(p, not_p) and pql.shares_literal(not_pq_and, not_p), "Test 39 failed: wrong literal signatures"
+    assert [rule for rule, _ in pql.alternatives((not_p, not_pq_and))] == ["~∧R1"], "Test 39 failed: ~∧R2 not pruned"
+    assertion_print("Passed!")
+
     generate_latex_output("pql")
 
     proof_data = ""
 
 def nql_tests():
     global proof_data
-    proof_data = ""
+    start_latex_output("nql")
 
     p = nql.atom("p")
     q = nql.atom("q")
@@ -608,6 +905,121 @@ def nql_tests():
     proof_data += nql.test_derivable((pq_or, pq_or), True, "Original Test: p ∨ q ⟹  p ∨ q", PERFORM_ASSERTION, PRODUCE_PROOFS)
     assertion_print("Passed!")
 
+    assertion_print("\n=== INTERNING TESTS ===")
+    # Constants and their negations are singletons
+    assert nql.top() is nql.Top() is nql.TOP, "Interning Test failed: ⊤ is not a singleton"
+    assert nql.bot() is nql.Bot() is nql.BOT, "Interning Test failed: ⊥ is not a singleton"
+    assert nql.not_formula(nql.top()) is nql.NEG_TOP, "Interning Test failed: ~⊤ is not a singleton"
+    assert nql.not_formula(nql.bot()) is nql.NEG_BOT, "Interning Test failed: ~⊥ is not a singleton"
+    assert nql.not_formula(nql.and_formula(p, q)) is nql.not_formula(pq), "Interning Test failed: ~(p ∧ q) is not interned"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== RULE DISPATCH TESTS ===")
+    # Only the rules for the sequent's shapes are offered, still in calculus order
+    p_imp_q, q_imp_p = nql.imp_formula(p, q), nql.imp_formula(q, p)
+    assert [rule for rule, _ in nql.alternatives((p_imp_q, q_imp_p))] == ["we_L", "we_R", "~we_L", "~we_R", "⊃L", "⊃order"], "Dispatch Test failed: wrong rules for ⊃ ⟹  ⊃"
+    assert [rule for rule, _ in nql.alternatives((nql.not_formula(pq), nql.top()))] == ["⊤", "we_L", "we_R", "~we_L", "~we_R", "~∧L"], "Dispatch Test failed: wrong rules for ~∧ ⟹  ⊤"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== TABLING TESTS ===")
+    # Weakening cycles are cut by tabling rather than a budget, so proofs that weaken
+    # more than three times are found
+    not_top = nql.not_formula(nql.top())
+    long_weakening = nql.imp_formula(nql.not_formula(r), nql.imp_formula(nql.not_formula(nql.or_formula(nql.bot(), nql.top())),
+                                                                        nql.not_formula(nql.imp_formula(nql.bot(), not_top))))
+    proof_data += nql.test_derivable((nql.top(), long_weakening), True, "Tabling Test: ⊤ ⟹  ~r ⊃ (~(⊥ ∨ ⊤) ⊃ ~(⊥ ⊃ ~⊤))", PERFORM_ASSERTION, PRODUCE_PROOFS)
+    # Failures do not depend on earlier queries, so they are kept in the cache
+    assert not nql.is_derivable((p, q)) and nql.proof_cache.get((p, q)) is None, "Tabling Test failed: failure not cached"
+    # Rebuilding a proof after some of its choices were evicted terminates with a valid proof,
+    # even when a subgoal searched again goes back through a goal still being built
+    weak_or = (p, nql.or_formula(q, nql.top()))
+    memo.clear_all()
+    nql.is_derivable(weak_or)
+    for keep in range(len(nql.proof_cache) - 1, 0, -1):
+        memo.clear_all()
+        nql.proof_cache.resize()
+        nql.is_derivable(weak_or)
+        nql.proof_cache.resize(max_entries=keep)
+        proof = nql.derive_proof(weak_or)
+        assert proof is not None and nql.check_proof(proof), f"Tabling Test failed: bad proof with {keep} cached choices"
+    nql.proof_cache.resize()
+    assertion_print("Passed!")
+
+    assertion_print("\n=== SEARCH LIMIT TESTS ===")
+    # A search that runs out of nodes or time answers UNKNOWN and leaves the cache usable
+    memo.clear_all()
+    assert nql.is_derivable((nql.top(), long_weakening), max_nodes=3) is search.UNKNOWN, "Limit Test failed: node budget ignored"
+    assert nql.derive_proof((nql.top(), long_weakening), deadline=time.monotonic() - 1) is search.UNKNOWN, "Limit Test failed: deadline ignored"
+    assert nql.is_derivable((nql.top(), long_weakening)) is True, "Limit Test failed: stopped search poisoned the cache"
+    assert nql.is_derivable((nql.top(), long_weakening), max_nodes=0) is True, "Limit Test failed: cached result not returned"
+    # Building the proof spends the limits too, even when every choice is cached
+    proof = nql.derive_proof((nql.top(), long_weakening))
+    assert nql.derive_proof((nql.top(), long_weakening), max_nodes=3) is search.UNKNOWN, "Limit Test failed: build ignores the node budget"
+    assert nql.derive_proof((nql.top(), long_weakening), deadline=time.monotonic() - 1) is search.UNKNOWN, "Limit Test failed: build ignores the deadline"
+    assert nql.derive_proof((nql.top(), long_weakening), max_nodes=1000) == proof, "Limit Test failed: large budget changed the proof"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== SEARCH TRACE TESTS ===")
+    # Every goal visited is streamed to the trace, the root last
+    memo.clear_all()
+    with tempfile.TemporaryDirectory() as trace_dir:
+        trace_path = os.path.join(trace_dir, "trace.jsonl")
+        proof, stats = nql.derive_proof((nql.top(), long_weakening), stats=True, trace=trace_path)
+        with open(trace_path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+    events = [line for line in lines if "formula" not in line]
+    formulas = {line["formula"]: line for line in lines if "formula" in line}
+    assert events[-1]["parent"] is None and events[-1]["rule"] == proof.rule == "⊃R", "Trace Test failed: root not last"
+    assert sum(not event["cache_hit"] and event["outcome"] != "cycle" for event in events) == stats.subgoals, "Trace Test failed: searched goals missing"
+    assert {event["outcome"] for event in events} <= {"proved", "failed", "cycle"}, "Trace Test failed: bad outcome"
+    # Each formula is written once, before the first goal that needs it
+    assert len(formulas) == sum("formula" in line for line in lines), "Trace Test failed: formula written twice"
+    assert trace_report.sequent_text(formulas, events[-1]["goal"]) == f"{nql.top()} ⟹  {long_weakening}", "Trace Test failed: wrong sequent text"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== WORKLOAD TESTS ===")
+    # The same seed gives the same sequents, with the requested number of connectives
+    options = dict(size=12, depth=5, sharing=0.3, negation=0.3)
+    first, second = workload.random_sequents(nql, 5, 7, **options), workload.random_sequents(nql, 5, 7, **options)
+    assert first == second, "Workload Test failed: not deterministic"
+    # (every binary connective is parenthesised once in the text)
+    assert all(workload.formula_text(alpha).count("(") == workload.formula_text(beta).count("(") == 12 for alpha, beta in first), "Workload Test failed: wrong size"
+    assert workload.sequent_text((nql.not_formula(pq), nql.imp_formula(nql.top(), p))) == "not (p and q) => (top imp p)", "Workload Test failed: wrong text"
+    assert not nql.is_derivable(workload.alternating(nql, 2)) and nql.is_derivable(workload.minimax(nql, 3)), "Workload Test failed: wrong family"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== CERTIFICATE TESTS ===")
+    # A proof packs into one byte per node and replays to the same tree
+    proof = nql.derive_proof((nql.top(), long_weakening))
+    cert = nql.certificate(proof)
+    assert isinstance(cert, bytes) and nql.replay((nql.top(), long_weakening), cert) == proof, "Certificate Test failed: replay differs"
+    root = (nql.top(), long_weakening)
+    for sequent, broken in ((root, cert[:-1]), (root, cert + cert[-1:]), ((p, q), cert)):
+        try:
+            nql.replay(sequent, broken)
+        except ValueError:
+            continue
+        assert False, "Certificate Test failed: bad certificate replayed"
+    assertion_print("Passed!")
+
+    assertion_print("\n=== DIFFERENTIAL FUZZING TESTS ===")
+    # The engines agree with the fixed-point reference and the unoptimized baseline, and their proofs check
+    report = fuzz.fuzz("nql", 40, seed=1, size=4, budget=2000)
+    assert report.sequents == 40 and not report.failures, f"Fuzz Test failed: {fuzz.format_report(report)}"
+    assert "vs baseline" in fuzz.format_report(report), "Fuzz Test failed: no speedup against the baseline"
+    # The reference reads PREMISES, so a broken dispatch table is caught
+    rules, nql.RULES = nql.RULES, [()] * len(nql.RULES)
+    try:
+        report = fuzz.fuzz("nql", 10, seed=1, size=2, budget=2000, shrink_failures=False)
+    finally:
+        nql.RULES = rules
+    assert report.failures, "Fuzz Test failed: broken dispatch table not caught"
+    proof = nql.derive_proof((nql.top(), long_weakening))
+    assert fuzz.check_derivation(nql, proof) is None, "Fuzz Test failed: good proof rejected"
+    proof.premises[0].rule = "⊃L"
+    assert fuzz.check_derivation(nql, proof) is not None, "Fuzz Test failed: bad proof accepted"
+    assertion_print("Passed!")
+
     generate_latex_output("nql")
 
     proof_data = ""
@@ -618,4 +1030,5 @@ if __name__ == "__main__":
     pql_tests()
     nl_tests()
     nql_tests()
+    finish_latex_output()
 
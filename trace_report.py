@@ -0,0 +1,96 @@
+import argparse
+from collections import Counter
+import heapq
+import json
+
+# Summary of a search trace written with derive_proof(..., trace="out.jsonl"):
+#
+#     python trace_report.py out.jsonl [-n 10]
+#
+# The trace is read one line at a time. Goals are written once their subtree is done,
+# so the size of a subtree is known when its root goal is read. Formulas are only
+# turned back into text for the rows printed.
+
+def read_trace(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def formula_text(formulas: dict, node: int) -> str:
+    # Text of formula `node` from the trace's formula records, built with an explicit
+    # stack of pieces so that deep formulas neither recurse nor copy their subformulas.
+    pieces = []
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            pieces.append(item)
+            continue
+        record = formulas[item]
+        if "atom" in record:
+            pieces.append(record["atom"])
+        elif "constant" in record:
+            pieces.append(record["constant"])
+        elif "operand" in record:
+            pieces.append(record["connective"])
+            stack.append(record["operand"])
+        else:
+            stack.extend((")", record["right"], f" {record['connective']} ", record["left"], "("))
+    return "".join(pieces)
+
+def sequent_text(formulas: dict, goal: tuple) -> str:
+    return f"{formula_text(formulas, goal[0])} ⟹  {formula_text(formulas, goal[1])}"
+
+def summarize(events, top: int):
+    hottest = []        # min-heap of the `top` slowest subtrees
+    sizes = {}          # goal id -> goals seen so far in its subtree
+    visits = Counter()
+    hits = Counter()
+    cycles = Counter()
+    formulas = {}
+
+    for event in events:
+        if "formula" in event:
+            formulas[event["formula"]] = event
+            continue
+
+        size = sizes.pop(event["id"], 0) + 1
+        if event["parent"] is not None:
+            sizes[event["parent"]] = sizes.get(event["parent"], 0) + size
+
+        goal = tuple(event["goal"])
+        entry = (event["seconds"], event["id"], size, event["outcome"], event["rule"], goal)
+        if len(hottest) < top:
+            heapq.heappush(hottest, entry)
+        else:
+            heapq.heappushpop(hottest, entry)
+
+        visits[goal] += 1
+        hits[goal] += event["cache_hit"]
+        cycles[goal] += event["outcome"] == "cycle"
+
+    hottest = [entry[:-1] + (sequent_text(formulas, entry[-1]),) for entry in sorted(hottest, reverse=True)]
+    revisited = [(count, hits[goal], cycles[goal], sequent_text(formulas, goal)) for goal, count in visits.most_common(top)]
+    return hottest, revisited
+
+def main():
+    parser = argparse.ArgumentParser(description="Hottest subtrees and most revisited sequents of a search trace.")
+    parser.add_argument("trace", help="JSONL file written by derive_proof/is_derivable with trace=...")
+    parser.add_argument("-n", "--top", type=int, default=10, help="rows per table (default 10)")
+    args = parser.parse_args()
+
+    hottest, revisited = summarize(read_trace(args.trace), args.top)
+
+    print("Hottest subtrees")
+    print(f"{'seconds':>10} {'goals':>8}  {'outcome':<8} {'rule':<8} sequent")
+    for seconds, _, size, outcome, rule, sequent in hottest:
+        print(f"{seconds:10.6f} {size:8d}  {outcome:<8} {rule or '-':<8} {sequent}")
+
+    print()
+    print("Most revisited sequents")
+    print(f"{'visits':>8} {'cached':>8} {'cycles':>8}  sequent")
+    for count, cached, cycle, sequent in revisited:
+        print(f"{count:8d} {cached:8d} {cycle:8d}  {sequent}")
+
+if __name__ == "__main__":
+    main()
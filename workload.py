@@ -0,0 +1,224 @@
+import argparse
+import random
+from typing import Dict, List, Optional, Tuple
+
+import formula_store
+import ll
+import pql
+import nl
+import nql
+
+# Reproducible random formulas and sequents for the four logics, as formula objects
+# or as text the *_run.py parsers accept:
+#
+#     python workload.py nql -n 100 --size 30 --seed 1 > nql.txt
+#     python nql_run.py < nql.txt
+#
+# Formulas are built straight into the logic's store. The same seed and options
+# always give the same formulas.
+
+LOGICS = {"ll": ll, "pql": pql, "nl": nl, "nql": nql}
+
+# Connectives each logic has, by parser keyword.
+BINARY = {"and": formula_store.AND, "or": formula_store.OR,
+          "imp": formula_store.IMP, "coimp": formula_store.COIMP}
+CONNECTIVES = {ll: ("and", "or"), pql: ("and", "or"),
+               nl: ("and", "or", "imp", "coimp"), nql: ("and", "or", "imp", "coimp")}
+NEGATION = (pql, nql)
+CONSTANTS = (nl, nql)
+
+KEYWORDS = {formula_store.AND: "and", formula_store.OR: "or", formula_store.IMP: "imp",
+            formula_store.COIMP: "coimp", formula_store.TOP: "top", formula_store.BOT: "bot"}
+
+def atom_names(count: int) -> List[str]:
+    return [f"p{i}" for i in range(count)]
+
+class Generator:
+    # size:      binary connectives in each formula
+    # depth:     bound on the binary connectives along a branch (None: unbounded)
+    # atoms:     number of distinct atoms, p0 ... p{atoms-1}
+    # mix:       weight of each binary connective by keyword (default: all equal)
+    # negation:  chance of negating a subformula, repeatedly (pql, nql)
+    # constants: chance of a leaf being ⊤ or ⊥ instead of an atom (nl, nql)
+    # sharing:   chance of reusing a subformula of the right size already built for
+    #            the same sequent instead of building a new one
+    def __init__(self, logic, seed: int = 0, size: int = 10, depth: Optional[int] = None, atoms: int = 4,
+                 mix: Optional[Dict[str, float]] = None, negation: float = 0.2, constants: float = 0.1,
+                 sharing: float = 0.0):
+        if size < 0 or atoms < 1:
+            raise ValueError("size must be at least 0 and atoms at least 1")
+        if depth is not None and size >= 2 ** depth:
+            raise ValueError(f"{size} connectives do not fit in depth {depth}")
+        mix = dict.fromkeys(CONNECTIVES[logic], 1.0) if mix is None else mix
+        unknown = set(mix) - set(CONNECTIVES[logic])
+        if unknown:
+            raise ValueError(f"{logic.__name__} has no connective {', '.join(sorted(unknown))}")
+        if not any(weight > 0 for weight in mix.values()):
+            raise ValueError("mix needs a connective with positive weight")
+
+        self.logic = logic
+        self.store = logic.store
+        self.rng = random.Random(seed)
+        self.size = size
+        self.depth = depth
+        self.atoms = [self.store.atom(name) for name in atom_names(atoms)]
+        self.ops = [BINARY[name] for name in mix]
+        self.weights = list(mix.values())
+        self.negation = negation if logic in NEGATION else 0.0
+        self.constants = [self.store.constant(formula_store.TOP), self.store.constant(formula_store.BOT)] \
+            if logic in CONSTANTS and constants > 0 else []
+        self.constant_chance = constants
+        self.sharing = sharing
+        self.shared: Dict[int, List[Tuple[int, int]]] = {}
+
+    def _leaf(self) -> int:
+        if self.constants and self.rng.random() < self.constant_chance:
+            return self.rng.choice(self.constants)
+        return self.rng.choice(self.atoms)
+
+    def _node(self, size: int, depth: int) -> Tuple[int, int]:
+        # A formula with `size` binary connectives, none nested deeper than `depth`,
+        # and its actual height.
+        if self.shared.get(size) and self.rng.random() < self.sharing:
+            fitting = [entry for entry in self.shared[size] if entry[1] <= depth]
+            if fitting:
+                return self.rng.choice(fitting)
+
+        if size == 0:
+            node, height = self._leaf(), 0
+        else:
+            # Split the other size - 1 connectives so both sides fit in depth - 1.
+            room = 2 ** min(depth - 1, size) - 1
+            left_size = self.rng.randint(max(0, size - 1 - room), min(size - 1, room))
+            left, left_height = self._node(left_size, depth - 1)
+            right, right_height = self._node(size - 1 - left_size, depth - 1)
+            op = self.rng.choices(self.ops, self.weights)[0]
+            node, height = self.store.binary(op, left, right), 1 + max(left_height, right_height)
+
+        while self.negation and self.rng.random() < self.negation:
+            node = self.store.unary(formula_store.NOT, node)
+        self.shared.setdefault(size, []).append((node, height))
+        return node, height
+
+    def _formula(self) -> int:
+        return self._node(self.size, self.size if self.depth is None else self.depth)[0]
+
+    def formula(self):
+        self.shared = {}
+        return self.logic.formula(self._formula())
+
+    def sequent(self) -> tuple:
+        # Both sides draw on the same pool of shared subformulas.
+        self.shared = {}
+        alpha = self._formula()
+        return (self.logic.formula(alpha), self.logic.formula(self._formula()))
+
+    def sequents(self, count: int) -> List[tuple]:
+        return [self.sequent() for _ in range(count)]
+
+def random_sequents(logic, count: int, seed: int = 0, **options) -> List[tuple]:
+    return Generator(logic, seed, **options).sequents(count)
+
+# Known-hard families, by size n. They only use ∧, ∨ and atoms, so every logic has them.
+def _balanced(store, op: int, nodes: List[int]) -> int:
+    while len(nodes) > 1:
+        paired = [store.binary(op, a, b) for a, b in zip(nodes[::2], nodes[1::2])]
+        nodes = paired + nodes[len(paired) * 2:]
+    return nodes[0]
+
+def _alternating(store, names: List[str], depth: int, op: int, position: int = 0) -> int:
+    if depth == 0:
+        return store.atom(names[position % len(names)])
+    other = formula_store.OR if op == formula_store.AND else formula_store.AND
+    left = _alternating(store, names, depth - 1, other, 2 * position)
+    return store.binary(op, left, _alternating(store, names, depth - 1, other, 2 * position + 1))
+
+def alternating(logic, n: int) -> tuple:
+    # ∧/∨ trees of depth n over the same leaves, ∧ at the root on the left and ∨ on the
+    # right, so both ∨L and ∧R branch at every level. Not derivable for n >= 2.
+    names = atom_names(2 ** n)
+    return (logic.formula(_alternating(logic.store, names, n, formula_store.AND)),
+            logic.formula(_alternating(logic.store, names, n, formula_store.OR)))
+
+def distributive(logic, n: int) -> tuple:
+    # p0 ∧ (p1 ∨ ... ∨ pn) ⟹ (p0 ∧ p1) ∨ ... ∨ (p0 ∧ pn): distributivity, which for n >= 2
+    # does not hold, so every way of taking the sequent apart is tried.
+    store = logic.store
+    p, qs = store.atom("p0"), [store.atom(name) for name in atom_names(n + 1)[1:]]
+    alpha = store.binary(formula_store.AND, p, _balanced(store, formula_store.OR, qs))
+    beta = _balanced(store, formula_store.OR, [store.binary(formula_store.AND, p, q) for q in qs])
+    return logic.formula(alpha), logic.formula(beta)
+
+def minimax(logic, n: int) -> tuple:
+    # ∨_i ∧_j p_ij ⟹ ∧_j ∨_i p_ij over an n × n grid of atoms: derivable, through n²
+    # branches of ∨L and ∧R.
+    store = logic.store
+    grid = [[store.atom(f"p{i}_{j}") for j in range(n)] for i in range(n)]
+    alpha = _balanced(store, formula_store.OR, [_balanced(store, formula_store.AND, row) for row in grid])
+    beta = _balanced(store, formula_store.AND, [_balanced(store, formula_store.OR, list(column)) for column in zip(*grid)])
+    return logic.formula(alpha), logic.formula(beta)
+
+FAMILIES = {"alternating": alternating, "distributive": distributive, "minimax": minimax}
+
+# Text for the *_run.py parsers: binary connectives are always parenthesised.
+def formula_text(formula) -> str:
+    store = formula._store
+    text: Dict[int, str] = {}
+    stack = [formula.id]
+    while stack:
+        node = stack[-1]
+        if node in text:
+            stack.pop()
+            continue
+        op = store.op[node]
+        if op == formula_store.ATOM:
+            text[node] = store.names[store.left[node]]
+        elif op == formula_store.TOP or op == formula_store.BOT:
+            text[node] = KEYWORDS[op]
+        elif op == formula_store.NOT:
+            operand = store.left[node]
+            if operand not in text:
+                stack.append(operand)
+                continue
+            text[node] = "not " + text[operand]
+        else:
+            left, right = store.left[node], store.right[node]
+            if left not in text or right not in text:
+                stack.extend((left, right))
+                continue
+            text[node] = f"({text[left]} {KEYWORDS[op]} {text[right]})"
+        stack.pop()
+    return text[formula.id]
+
+def sequent_text(sequent: tuple) -> str:
+    return f"{formula_text(sequent[0])} => {formula_text(sequent[1])}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Print random or hard sequents, one per line, as parser input.")
+    parser.add_argument("logic", choices=sorted(LOGICS))
+    parser.add_argument("-n", "--count", type=int, default=10, help="number of sequents (default 10)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--size", type=int, default=10, help="binary connectives per formula (default 10)")
+    parser.add_argument("--depth", type=int, help="bound on the nesting of binary connectives")
+    parser.add_argument("--atoms", type=int, default=4, help="distinct atoms (default 4)")
+    parser.add_argument("--mix", help="connective weights, e.g. and=2,or=1")
+    parser.add_argument("--negation", type=float, default=0.2, help="negation density, pql and nql (default 0.2)")
+    parser.add_argument("--constants", type=float, default=0.1, help="share of ⊤/⊥ leaves, nl and nql (default 0.1)")
+    parser.add_argument("--sharing", type=float, default=0.0, help="chance of reusing a subformula (default 0)")
+    parser.add_argument("--family", choices=sorted(FAMILIES), help="print the hard family for n = 1 ... count instead")
+    args = parser.parse_args()
+
+    logic = LOGICS[args.logic]
+    if args.family:
+        sequents = [FAMILIES[args.family](logic, n) for n in range(1, args.count + 1)]
+    else:
+        mix = None
+        if args.mix:
+            mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+        sequents = random_sequents(logic, args.count, args.seed, size=args.size, depth=args.depth, atoms=args.atoms,
+                                   mix=mix, negation=args.negation, constants=args.constants, sharing=args.sharing)
+    for sequent in sequents:
+        print(sequent_text(sequent))
+
+if __name__ == "__main__":
+    main()